@@ -0,0 +1,403 @@
+"""
+Offline consistency analytics.
+
+Computes, as of one instant and over the last ``ANALYTICS_WINDOW_DAYS``
+local days of every user:
+
+- per habit: completion rates over the last 7 and 30 days and a
+  consistency score (the same rate over the whole window, weighted so each
+  ``ANALYTICS_HALF_LIFE_DAYS`` back counts half as much)
+- per user: the means of those over their active habits
+- per ``HabitCategory`` and day: the share of habit-days satisfied, across
+  all users
+
+A day is satisfied when the habit's period containing it (day, week,
+month or custom interval, as in ``streaks.period_index``) has a
+completion. Days before the habit was created don't count, and neither
+does the current period while it is still open and empty.
+
+Users are split into id ranges, and a process pool works through the
+shards. Each worker streams the shard's completions from
+``habit_completions`` in chunks of ``--chunk-size`` rows into NumPy arrays
+and computes everything with array operations on a habits x days matrix.
+The parent merges the shards and replaces ``habit_metrics``,
+``user_metrics`` and ``category_trends`` with COPY in one transaction, so
+the API never sees a half-written run:
+
+    python analytics.py --workers 4
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+from models import HabitCategory, HabitFrequency
+import csv
+import io
+import itertools
+import logging
+import multiprocessing
+import numpy as np
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_WINDOW_DAYS = int(os.getenv("ANALYTICS_WINDOW_DAYS", "90"))
+ANALYTICS_HALF_LIFE_DAYS = float(os.getenv("ANALYTICS_HALF_LIFE_DAYS", "14"))
+ANALYTICS_CHUNK_SIZE = int(os.getenv("ANALYTICS_CHUNK_SIZE", "100000"))
+
+FREQUENCIES = list(HabitFrequency)
+CATEGORIES = list(HabitCategory)
+FREQUENCY_CODES = {frequency.name: code for code, frequency in enumerate(FREQUENCIES)}
+CATEGORY_CODES = {category.name: code for code, category in enumerate(CATEGORIES)}
+DAILY, WEEKLY, MONTHLY, CUSTOM = (
+    FREQUENCIES.index(frequency) for frequency in (
+        HabitFrequency.DAILY, HabitFrequency.WEEKLY, HabitFrequency.MONTHLY, HabitFrequency.CUSTOM
+    )
+)
+# date(1970, 1, 1).toordinal(), to turn ordinals into datetime64 days
+EPOCH_ORDINAL = 719163
+
+# Local "today" and day offsets are computed in Postgres, which knows the
+# users' timezones; ordinals count days like date.toordinal()
+_HABITS_SQL = """
+    SELECT h.id, h.user_id, CAST(h.frequency AS text), COALESCE(h.custom_interval_days, 1),
+           COALESCE(h.is_active, true), CAST(h.category AS text),
+           COALESCE(CAST(timezone(u.timezone, CAST(:as_of AS timestamptz)) AS date)
+               - CAST(timezone(u.timezone, h.created_at) AS date), 0),
+           CAST(timezone(u.timezone, CAST(:as_of AS timestamptz)) AS date) - DATE '0001-01-01' + 1
+    FROM habits h JOIN users u ON u.id = h.user_id
+    WHERE h.user_id BETWEEN :first_user AND :last_user
+    ORDER BY h.id
+"""
+_COMPLETIONS_SQL = """
+    SELECT c.habit_id,
+           CAST(timezone(u.timezone, CAST(:as_of AS timestamptz)) AS date)
+               - CAST(timezone(u.timezone, c.completed_at) AS date)
+    FROM habit_completions c JOIN users u ON u.id = c.user_id
+    WHERE c.user_id BETWEEN :first_user AND :last_user
+      AND c.completed_at >= CAST(:as_of AS timestamptz) - make_interval(days => :days)
+      AND c.completed_at <= CAST(:as_of AS timestamptz)
+"""
+
+
+class HabitArrays(NamedTuple):
+    """Habits of one shard, sorted by id, one array per attribute."""
+    id: np.ndarray
+    user_id: np.ndarray
+    frequency: np.ndarray  # Index into FREQUENCIES
+    interval: np.ndarray  # Custom period length in days, 1 otherwise
+    active: np.ndarray
+    category: np.ndarray  # Index into CATEGORIES
+    age_days: np.ndarray  # Local days since the habit was created
+    today: np.ndarray  # Ordinal of the user's local day at ``as_of``
+
+
+class ShardMetrics(NamedTuple):
+    habit_id: np.ndarray
+    habit_user_id: np.ndarray
+    habit_rate_7d: np.ndarray
+    habit_rate_30d: np.ndarray
+    habit_consistency: np.ndarray
+    user_id: np.ndarray
+    user_rate_7d: np.ndarray
+    user_rate_30d: np.ndarray
+    user_consistency: np.ndarray
+    user_habits: np.ndarray
+    category_satisfied: np.ndarray  # categories x days ago
+    category_eligible: np.ndarray
+
+
+def habit_arrays(rows: List[tuple]) -> HabitArrays:
+    """Build ``HabitArrays`` from rows shaped like ``_HABITS_SQL``, sorted by id."""
+    count = len(rows)
+    columns = list(zip(*rows)) if rows else [()] * 8
+    return HabitArrays(
+        id=np.fromiter(columns[0], np.int64, count),
+        user_id=np.fromiter(columns[1], np.int64, count),
+        frequency=np.fromiter((FREQUENCY_CODES.get(name, DAILY) for name in columns[2]), np.int8, count),
+        interval=np.maximum(np.fromiter(columns[3], np.int32, count), 1),
+        active=np.fromiter(columns[4], np.bool_, count),
+        category=np.fromiter((CATEGORY_CODES.get(name, CATEGORY_CODES["OTHER"]) for name in columns[5]), np.int8, count),
+        age_days=np.fromiter(columns[6], np.int32, count),
+        today=np.fromiter(columns[7], np.int32, count),
+    )
+
+
+def _periods(habits: HabitArrays, window: int) -> np.ndarray:
+    """Period index (as in ``streaks.period_index``) of each habit x days-ago cell."""
+    ordinals = habits.today[:, None] - np.arange(window, dtype=np.int32)[None, :]
+    periods = ordinals.astype(np.int64)
+    weekly = habits.frequency == WEEKLY
+    periods[weekly] = (ordinals[weekly] - 1) // 7
+    monthly = habits.frequency == MONTHLY
+    if monthly.any():
+        days = (ordinals[monthly] - EPOCH_ORDINAL).astype("datetime64[D]")
+        periods[monthly] = days.astype("datetime64[M]").astype(np.int64)
+    custom = habits.frequency == CUSTOM
+    periods[custom] = ordinals[custom] // habits.interval[custom, None]
+    return periods
+
+
+def _rate(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1e-12), np.nan)
+
+
+def compute_metrics(
+    habits: HabitArrays,
+    completion_habit_ids: np.ndarray,
+    completion_days_ago: np.ndarray,
+    window: int = ANALYTICS_WINDOW_DAYS,
+    half_life: float = ANALYTICS_HALF_LIFE_DAYS
+) -> ShardMetrics:
+    """
+    Metrics of one shard over ``window`` (at least 30) days.
+    ``completion_habit_ids`` and ``completion_days_ago`` describe one
+    completion per element; completions of unknown habits or outside the
+    window are ignored.
+    """
+    count = len(habits.id)
+
+    # habits x days-ago matrix of days with at least one completion
+    rows = np.searchsorted(habits.id, completion_habit_ids)
+    valid = (rows < count) & (completion_days_ago >= 0) & (completion_days_ago < window)
+    valid[valid] = habits.id[rows[valid]] == completion_habit_ids[valid]
+    done = np.zeros((count, window), dtype=np.bool_)
+    done[rows[valid], completion_days_ago[valid]] = True
+
+    # A day is satisfied if any day of its period is done. Periods are
+    # contiguous runs along each row, so OR-reduce each run and spread it back.
+    periods = _periods(habits, window)
+    starts_mask = np.ones((count, window), dtype=np.bool_)
+    starts_mask[:, 1:] = periods[:, 1:] != periods[:, :-1]
+    starts = np.flatnonzero(starts_mask)
+    if count:
+        run_done = np.logical_or.reduceat(done.ravel(), starts)
+        run_length = np.diff(np.append(starts, count * window))
+        satisfied = np.repeat(run_done, run_length).reshape(count, window)
+    else:
+        satisfied = done
+
+    days_ago = np.arange(window)
+    eligible = days_ago[None, :] <= habits.age_days[:, None]
+    # The current period is still open; it only counts once it is satisfied
+    eligible &= ~((periods == periods[:, :1]) & ~satisfied)
+    hits = satisfied & eligible
+
+    rate_7d = _rate(hits[:, :7].sum(axis=1), eligible[:, :7].sum(axis=1))
+    rate_30d = _rate(hits[:, :30].sum(axis=1), eligible[:, :30].sum(axis=1))
+    weights = 0.5 ** (days_ago / half_life)
+    consistency = _rate(hits.astype(np.float64) @ weights, eligible.astype(np.float64) @ weights)
+
+    # Users: mean over active habits with a defined value
+    user_ids, user_index = np.unique(habits.user_id, return_inverse=True)
+
+    def user_mean(values: np.ndarray) -> np.ndarray:
+        counted = habits.active & ~np.isnan(values)
+        sums = np.bincount(user_index, weights=np.where(counted, values, 0.0), minlength=len(user_ids))
+        return _rate(sums, np.bincount(user_index, weights=counted, minlength=len(user_ids)))
+
+    category_satisfied = np.zeros((len(CATEGORIES), window), dtype=np.int64)
+    category_eligible = np.zeros((len(CATEGORIES), window), dtype=np.int64)
+    for code in range(len(CATEGORIES)):
+        in_category = habits.active & (habits.category == code)
+        category_satisfied[code] = hits[in_category].sum(axis=0)
+        category_eligible[code] = eligible[in_category].sum(axis=0)
+
+    return ShardMetrics(
+        habit_id=habits.id,
+        habit_user_id=habits.user_id,
+        habit_rate_7d=rate_7d,
+        habit_rate_30d=rate_30d,
+        habit_consistency=consistency,
+        user_id=user_ids,
+        user_rate_7d=user_mean(rate_7d),
+        user_rate_30d=user_mean(rate_30d),
+        user_consistency=user_mean(consistency),
+        user_habits=np.bincount(user_index, weights=habits.active, minlength=len(user_ids)).astype(np.int64),
+        category_satisfied=category_satisfied,
+        category_eligible=category_eligible,
+    )
+
+
+def _stream_completions(connection, params: dict, chunk_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    result = connection.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(
+        text(_COMPLETIONS_SQL), params
+    )
+    for chunk in result.partitions(chunk_size):
+        flat = np.fromiter(itertools.chain.from_iterable(chunk), np.int64, 2 * len(chunk))
+        yield flat[0::2], flat[1::2]
+
+
+def compute_shard(
+    database_url: str,
+    first_user: int,
+    last_user: int,
+    as_of: datetime,
+    window: int = ANALYTICS_WINDOW_DAYS,
+    chunk_size: int = ANALYTICS_CHUNK_SIZE
+) -> Tuple[ShardMetrics, int]:
+    """Load and compute users ``first_user``..``last_user``; returns the metrics and completions read."""
+    engine = create_engine(database_url, poolclass=NullPool)
+    params = {"as_of": as_of, "first_user": first_user, "last_user": last_user, "days": window + 1}
+    try:
+        # Habits and completions are read from the same snapshot
+        with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+            habits = habit_arrays(connection.execute(text(_HABITS_SQL), params).all())
+            chunks = list(_stream_completions(connection, params, chunk_size))
+    finally:
+        engine.dispose()
+    habit_ids = np.concatenate([ids for ids, _ in chunks]) if chunks else np.zeros(0, np.int64)
+    days_ago = np.concatenate([days for _, days in chunks]) if chunks else np.zeros(0, np.int64)
+    return compute_metrics(habits, habit_ids, days_ago, window), len(habit_ids)
+
+
+def user_shards(connection, shards: int) -> List[Tuple[int, int]]:
+    """Split the users into ``shards`` contiguous id ranges of similar size."""
+    bounds = connection.execute(text("""
+        SELECT min(id), max(id) FROM (
+            SELECT id, ntile(:shards) OVER (ORDER BY id) AS shard FROM users
+        ) ranked GROUP BY shard ORDER BY shard
+    """), {"shards": shards}).all()
+    return [(first, last) for first, last in bounds]
+
+
+def _copy(cursor, table: str, columns: Tuple[str, ...], rows) -> int:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    written = 0
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+        written += 1
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return written
+
+
+def _value(number: float) -> Optional[float]:
+    return None if np.isnan(number) else round(float(number), 4)
+
+
+def write_results(engine, shards: List[ShardMetrics], as_of: datetime) -> Dict[str, int]:
+    """Replace the metrics tables with this run's results in one transaction."""
+    computed_at = as_of.isoformat()
+    days = shards[0].category_satisfied.shape[1] if shards else 0
+    satisfied = sum(shard.category_satisfied for shard in shards) if shards else np.zeros((len(CATEGORIES), 0))
+    eligible = sum(shard.category_eligible for shard in shards) if shards else np.zeros((len(CATEGORIES), 0))
+    as_of_day = as_of.date()
+
+    habit_rows = (
+        (habit_id, user_id, _value(consistency), _value(rate_7d), _value(rate_30d), computed_at)
+        for shard in shards
+        for habit_id, user_id, consistency, rate_7d, rate_30d in zip(
+            shard.habit_id.tolist(), shard.habit_user_id.tolist(), shard.habit_consistency,
+            shard.habit_rate_7d, shard.habit_rate_30d
+        )
+    )
+    user_rows = (
+        (user_id, _value(consistency), _value(rate_7d), _value(rate_30d), habits, computed_at)
+        for shard in shards
+        for user_id, consistency, rate_7d, rate_30d, habits in zip(
+            shard.user_id.tolist(), shard.user_consistency, shard.user_rate_7d,
+            shard.user_rate_30d, shard.user_habits.tolist()
+        )
+    )
+    # Day offsets are per user's local day; trends label them with as_of's UTC date
+    trend_rows = (
+        (
+            category.name, (as_of_day - timedelta(days=day)).isoformat(),
+            int(satisfied[code, day]), int(eligible[code, day]),
+            _value(satisfied[code, day] / eligible[code, day]) if eligible[code, day] else None,
+            computed_at
+        )
+        for code, category in enumerate(CATEGORIES)
+        for day in range(days)
+    )
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM habit_metrics")
+        cursor.execute("DELETE FROM user_metrics")
+        cursor.execute("DELETE FROM category_trends")
+        written = {
+            "habit_metrics": _copy(cursor, "habit_metrics", (
+                "habit_id", "user_id", "consistency", "rate_7d", "rate_30d", "computed_at"
+            ), habit_rows),
+            "user_metrics": _copy(cursor, "user_metrics", (
+                "user_id", "consistency", "rate_7d", "rate_30d", "habits", "computed_at"
+            ), user_rows),
+            "category_trends": _copy(cursor, "category_trends", (
+                "category", "day", "satisfied", "eligible", "rate", "computed_at"
+            ), trend_rows),
+        }
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return written
+
+
+def run_job(
+    workers: int = 4,
+    shards: Optional[int] = None,
+    window: int = ANALYTICS_WINDOW_DAYS,
+    chunk_size: int = ANALYTICS_CHUNK_SIZE,
+    as_of: Optional[datetime] = None
+) -> Dict[str, int]:
+    """
+    Compute all metrics and store them. Returns row counts per table plus
+    the number of completions read.
+    """
+    from database import DATABASE_URL, engine
+
+    as_of = as_of or datetime.now(timezone.utc)
+    window = max(window, 30)
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        ranges = user_shards(connection, shards or workers * 4)
+
+    results: List[ShardMetrics] = []
+    completions_read = 0
+    # Spawned workers open their own connections instead of inheriting ours
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(compute_shard, DATABASE_URL, first, last, as_of, window, chunk_size)
+            for first, last in ranges
+        ]
+        for future in futures:
+            metrics, read = future.result()
+            results.append(metrics)
+            completions_read += read
+    computed = time.perf_counter() - started
+
+    written = write_results(engine, results, as_of)
+    written["completions_read"] = completions_read
+    logger.info(
+        f"Computed consistency metrics for {written['user_metrics']} users from {completions_read} completions "
+        f"in {computed:.1f} s ({len(ranges)} shards, {workers} workers), stored in {time.perf_counter() - started - computed:.1f} s"
+    )
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(description="Compute habit consistency metrics")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shards", type=int, help="user id ranges (default: 4 per worker)")
+    parser.add_argument("--window", type=int, default=ANALYTICS_WINDOW_DAYS, help="days of history (at least 30)")
+    parser.add_argument("--chunk-size", type=int, default=ANALYTICS_CHUNK_SIZE, help="completions fetched per chunk")
+    args = parser.parse_args()
+    print("Computing consistency metrics...")
+    counts = run_job(args.workers, args.shards, args.window, args.chunk_size)
+    print(f"Consistency metrics computed successfully! {counts}")
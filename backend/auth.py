@@ -4,53 +4,93 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import models
 import schemas
 from database import get_db
+from hashing import HashingPool, HashingPoolFull
+from principal_cache import principal_cache
+from logging_config import RateLimitedLog, SampledLog
+import metrics
 import os
+import time
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("app.log")
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Security configuration
-SECRET_KEY = os.getenv("SECRET_KEY")
-if not SECRET_KEY:
-    logger.error("SECRET_KEY environment variable is not set")
-    raise ValueError("SECRET_KEY environment variable is not set")
+# Failed logins and bad tokens can arrive in floods; cap the warnings per minute
+AUTH_FAILURE_LOG_LIMIT = int(os.getenv("AUTH_FAILURE_LOG_LIMIT", "20"))
+auth_failure_log = RateLimitedLog(logger, max_per_interval=AUTH_FAILURE_LOG_LIMIT, interval_seconds=60)
+# Per-login debug lines run on every request to /token; keep a sample
+AUTH_DEBUG_LOG_SAMPLE_RATE = float(os.getenv("AUTH_DEBUG_LOG_SAMPLE_RATE", "0.01"))
+login_debug_log = SampledLog(logger, rate=AUTH_DEBUG_LOG_SAMPLE_RATE)
 
+# Security configuration. The signing key is read on first use; the app
+# checks it during startup, so importing this module never fails.
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-logger.info(f"Security configuration loaded - Algorithm: {ALGORITHM}, Token Expiry: {ACCESS_TOKEN_EXPIRE_MINUTES} minutes")
+def get_secret_key() -> str:
+    """Key used to sign access tokens, from the SECRET_KEY environment variable."""
+    secret_key = os.getenv("SECRET_KEY")
+    if not secret_key:
+        logger.error("SECRET_KEY environment variable is not set")
+        raise ValueError("SECRET_KEY environment variable is not set")
+    return secret_key
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Changing BCRYPT_ROUNDS is picked up on each user's next login: hashes with a
+# different cost are flagged by needs_update() and rehashed transparently.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt runs here instead of on the event loop
+hash_pool = HashingPool(
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING
+)
+metrics.hashing_pool_pending.set_function(lambda: hash_pool.stats()["pending"])
+metrics.hashing_pool_in_flight.set_function(lambda: hash_pool.stats()["in_flight"])
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def _timed_bcrypt(operation: str, function, *args):
+    # Runs on a hashing thread, so this times bcrypt itself, not the queueing
+    start = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        metrics.password_hash_seconds.observe(time.perf_counter() - start, operation)
+
+def _hashing_overloaded() -> HTTPException:
+    logger.warning("Password hashing pool is full, rejecting request")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy. Please try again shortly.",
+        headers={"Retry-After": "1"}
+    )
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
     try:
-        return pwd_context.verify(plain_password, hashed_password)
+        return await hash_pool.run(_timed_bcrypt, "verify", pwd_context.verify, plain_password, hashed_password)
+    except HashingPoolFull:
+        raise _hashing_overloaded()
     except Exception as e:
         logger.error(f"Error verifying password: {str(e)}", exc_info=True)
         return False
 
-def get_password_hash(password: str) -> str:
+async def get_password_hash(password: str) -> str:
     """Generate a password hash."""
     try:
-        return pwd_context.hash(password)
+        return await hash_pool.run(_timed_bcrypt, "hash", pwd_context.hash, password)
+    except HashingPoolFull:
+        raise _hashing_overloaded()
     except Exception as e:
         logger.error(f"Error hashing password: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -58,26 +98,45 @@ def get_password_hash(password: str) -> str:
             detail="Error processing password"
         )
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[models.User]:
+async def rehash_password_if_needed(db: AsyncSession, user: models.User, password: str) -> None:
+    """Upgrade a stored hash whose cost no longer matches BCRYPT_ROUNDS."""
+    try:
+        if not pwd_context.needs_update(user.hashed_password):
+            return
+        user.hashed_password = await get_password_hash(password)
+        await db.commit()
+        logger.info(f"Rehashed password for user: {user.username}")
+    except Exception as e:
+        # The login itself succeeded; the upgrade is retried next time
+        await db.rollback()
+        await db.refresh(user)
+        logger.error(f"Error rehashing password: {str(e)}", exc_info=True)
+
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[models.User]:
     """Authenticate a user with username and password."""
     try:
-        logger.debug(f"Attempting to authenticate user: {username}")
+        login_debug_log.debug("Attempting to authenticate user: %s", username)
         
         # Check if user exists
-        user = db.query(models.User).filter(models.User.username == username).first()
+        result = await db.execute(select(models.User).where(models.User.username == username))
+        user = result.scalars().first()
         if not user:
-            logger.warning(f"Authentication failed: User {username} not found")
+            auth_failure_log.warning("Authentication failed: User %s not found", username)
             return None
             
-        logger.debug(f"User found: {user.username}, checking password")
+        login_debug_log.debug("User found: %s, checking password", user.username)
         
         # Verify password
-        if not verify_password(password, user.hashed_password):
-            logger.warning(f"Authentication failed: Invalid password for user {username}")
+        if not await verify_password(password, user.hashed_password):
+            auth_failure_log.warning("Authentication failed: Invalid password for user %s", username)
             return None
+
+        await rehash_password_if_needed(db, user, password)
             
-        logger.info(f"Successfully authenticated user: {username}")
+        login_debug_log.debug("Successfully authenticated user: %s", username)
         return user
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error during authentication: {str(e)}", exc_info=True)
         return None
@@ -91,8 +150,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
         to_encode.update({"exp": expire})
-        logger.debug(f"Creating access token for user: {data.get('sub')}")
-        encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+        login_debug_log.debug("Creating access token for user: %s", data.get("sub"))
+        encoded_jwt = jwt.encode(to_encode, get_secret_key(), algorithm=ALGORITHM)
         return encoded_jwt
     except Exception as e:
         logger.error(f"Error creating access token: {str(e)}", exc_info=True)
@@ -101,31 +160,76 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
             detail="Error creating access token"
         )
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> models.User:
-    """Get the current user from the JWT token."""
-    credentials_exception = HTTPException(
+def token_claims(user: models.User) -> dict:
+    """Claims identifying ``user`` in an access token."""
+    return {"sub": user.username, "uid": user.id, "active": user.is_active}
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> dict:
+    """Decode and validate a JWT access token, returning its payload."""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            logger.warning("Token validation failed: No username in payload")
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
+        payload = jwt.decode(token, get_secret_key(), algorithms=[ALGORITHM])
     except JWTError as e:
-        logger.warning(f"Token validation failed: {str(e)}")
-        raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
+        auth_failure_log.warning("Token validation failed: %s", e)
+        raise _credentials_exception()
+    if payload.get("sub") is None:
+        auth_failure_log.warning("Token validation failed: No username in payload")
+        raise _credentials_exception()
+    return payload
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme)
+) -> schemas.TokenData:
+    """
+    Authorize a request from the token claims alone, without a database lookup.
+
+    Intended for read-only endpoints that only need the caller's identity.
+    The ``active`` claim reflects the user at login time, so a deactivated
+    user keeps read access through these endpoints until their token
+    expires, up to ``ACCESS_TOKEN_EXPIRE_MINUTES``.
+    """
+    payload = decode_access_token(token)
+    if payload.get("uid") is None:
+        # Tokens issued before user ids were embedded in the claims
+        auth_failure_log.warning("Token validation failed: No user id in payload")
+        raise _credentials_exception()
+    principal = schemas.TokenData(
+        username=payload["sub"],
+        user_id=payload["uid"],
+        is_active=payload.get("active", True)
+    )
+    if not principal.is_active:
+        logger.warning(f"Access denied: User {principal.username} is inactive")
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> models.User:
+    """Get the current user from the JWT token."""
+    payload = decode_access_token(token)
+    token_data = schemas.TokenData(username=payload["sub"], user_id=payload.get("uid"))
+
+    cached_user = principal_cache.get(token)
+    if cached_user is not None:
+        return await db.merge(cached_user, load=False)
+
+    result = await db.execute(select(models.User).where(models.User.username == token_data.username))
+    user = result.scalars().first()
     if user is None:
-        logger.warning(f"Token validation failed: User {token_data.username} not found")
-        raise credentials_exception
+        auth_failure_log.warning("Token validation failed: User %s not found", token_data.username)
+        raise _credentials_exception()
+    if token_data.user_id is not None and token_data.user_id != user.id:
+        auth_failure_log.warning("Token validation failed: User id mismatch for %s", token_data.username)
+        raise _credentials_exception()
+    principal_cache.put(token, user, payload.get("exp"))
     return user
 
 async def get_current_active_user(
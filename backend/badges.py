@@ -0,0 +1,301 @@
+"""
+Event-driven badge rules.
+
+Badges are declared as data in ``BADGE_RULES``: each rule names the event
+it listens to, the metric it reads and the threshold that earns it. When an
+event is dispatched only the rules subscribed to that event and metric are
+looked at, and the rules whose threshold the metric just crossed are found
+with a binary search, so the cost of an event does not grow with the number
+of badges or users.
+
+Metrics come from the event itself (e.g. the new current streak) or from
+``user_counters``, which the event increments with one upsert. Nothing
+counts rows. Awards are ``INSERT ... ON CONFLICT DO NOTHING`` against a
+unique (user_id, code) index, so replaying an event never awards twice.
+
+``python badges.py`` recomputes the counters from history and awards any
+badges they already qualify for.
+"""
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import BigInteger, Integer, String, bindparam, cast, delete, func, literal, select, text, union_all
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Badge, Habit, HabitCategory, HabitCompletion, PointsLedger, Streak, UserCounter
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Event kinds
+COMPLETION_RECORDED = "completion_recorded"
+STREAK_CHANGED = "streak_changed"
+POINTS_CHANGED = "points_changed"
+
+
+class BadgeEvent(NamedTuple):
+    """
+    Something that happened to a user.
+
+    ``increments`` are added to the user's counters; ``values`` are metrics
+    carried by the event as (before, after), with ``before`` None when the
+    previous value is unknown.
+    """
+    kind: str
+    user_id: int
+    increments: Dict[str, int] = {}
+    values: Dict[str, Tuple[Optional[int], int]] = {}
+
+
+@dataclass(frozen=True)
+class BadgeRule:
+    """Award ``code`` when ``metric`` reaches ``threshold`` on a ``event`` event."""
+    code: str
+    title: str
+    description: str
+    icon: str
+    event: str
+    metric: str
+    threshold: int
+
+
+def completion_counter(category: HabitCategory) -> str:
+    return f"completions:{HabitCategory(category).value}"
+
+
+BADGE_RULES: List[BadgeRule] = [
+    BadgeRule("first_completion", "First Step", "Complete a habit for the first time", "footprints",
+              COMPLETION_RECORDED, "completions", 1),
+    BadgeRule("completions_10", "Getting Going", "Complete habits 10 times", "sprout",
+              COMPLETION_RECORDED, "completions", 10),
+    BadgeRule("completions_100", "Centurion", "Complete habits 100 times", "shield",
+              COMPLETION_RECORDED, "completions", 100),
+    BadgeRule("completions_1000", "Unstoppable", "Complete habits 1,000 times", "rocket",
+              COMPLETION_RECORDED, "completions", 1000),
+    *[
+        BadgeRule(f"{category.value}_50", f"{category.value.title()} Regular",
+                  f"Complete {category.value} habits 50 times", category.value,
+                  COMPLETION_RECORDED, completion_counter(category), 50)
+        for category in HabitCategory
+    ],
+    BadgeRule("streak_7", "One Week Strong", "Reach a 7 period streak", "flame",
+              STREAK_CHANGED, "current_streak", 7),
+    BadgeRule("streak_30", "Habit Formed", "Reach a 30 period streak", "fire",
+              STREAK_CHANGED, "current_streak", 30),
+    BadgeRule("streak_100", "Iron Will", "Reach a 100 period streak", "crown",
+              STREAK_CHANGED, "current_streak", 100),
+    BadgeRule("points_100", "Point Collector", "Earn 100 points", "coin",
+              POINTS_CHANGED, "points_earned", 100),
+    BadgeRule("points_1000", "High Scorer", "Earn 1,000 points", "trophy",
+              POINTS_CHANGED, "points_earned", 1000),
+    BadgeRule("points_10000", "Legend", "Earn 10,000 points", "star",
+              POINTS_CHANGED, "points_earned", 10000),
+]
+
+
+@dataclass
+class BadgeEngine:
+    """Index of badge rules by event and metric, sorted by threshold."""
+    rules: Sequence[BadgeRule]
+    _index: Dict[str, Dict[str, Tuple[List[int], List[BadgeRule]]]] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        grouped: Dict[str, Dict[str, List[BadgeRule]]] = {}
+        for rule in self.rules:
+            grouped.setdefault(rule.event, {}).setdefault(rule.metric, []).append(rule)
+        self._index = {
+            event: {
+                metric: ([rule.threshold for rule in ordered], ordered)
+                for metric, rules in metrics.items()
+                for ordered in [sorted(rules, key=lambda rule: rule.threshold)]
+            }
+            for event, metrics in grouped.items()
+        }
+
+    def evaluate(self, kind: str, metrics: Dict[str, Tuple[Optional[int], int]]) -> List[BadgeRule]:
+        """
+        Rules of event ``kind`` earned by the given (before, after) metric values.
+
+        A rule is earned when its threshold lies in (before, after]; with an
+        unknown ``before`` every rule at or below ``after`` qualifies and the
+        unique index discards the ones awarded earlier.
+        """
+        subscribed = self._index.get(kind)
+        if not subscribed:
+            return []
+        earned = []
+        for metric, (before, after) in metrics.items():
+            entry = subscribed.get(metric)
+            if entry is None:
+                continue
+            thresholds, rules = entry
+            low = 0 if before is None else bisect_right(thresholds, before)
+            earned.extend(rules[low:bisect_right(thresholds, after)])
+        return earned
+
+
+engine = BadgeEngine(BADGE_RULES)
+
+
+async def _increment_counters(db: AsyncSession, user_id: int, increments: Dict[str, int]) -> Dict[str, int]:
+    """Add ``increments`` to the user's counters; returns the new values."""
+    stmt = insert(UserCounter).values([
+        {"user_id": user_id, "name": name, "value": delta}
+        for name, delta in sorted(increments.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserCounter.user_id, UserCounter.name],
+        set_={"value": UserCounter.value + stmt.excluded.value}
+    ).returning(UserCounter.name, UserCounter.value)
+    result = await db.execute(stmt)
+    return dict(result.all())
+
+
+async def _award(
+    db: AsyncSession,
+    awards: Iterable[Tuple[int, BadgeRule]],
+    chunk_size: int = 1000
+) -> List[Tuple[int, str]]:
+    """Insert badges not awarded yet; returns the (user_id, code) pairs actually awarded."""
+    rows = [
+        {"user_id": user_id, "code": rule.code, "title": rule.title,
+         "description": rule.description, "icon": rule.icon}
+        for user_id, rule in awards
+    ]
+    awarded = []
+    for offset in range(0, len(rows), chunk_size):
+        result = await db.execute(
+            insert(Badge)
+            .values(rows[offset:offset + chunk_size])
+            .on_conflict_do_nothing(index_elements=[Badge.user_id, Badge.code])
+            .returning(Badge.user_id, Badge.code)
+        )
+        awarded.extend(result.all())
+    for user_id, code in awarded:
+        logger.info(f"Awarded badge {code} to user {user_id}")
+    return awarded
+
+
+async def dispatch(db: AsyncSession, event: BadgeEvent) -> List[str]:
+    """
+    Apply an event: bump its counters, run the subscribed rules and award
+    any badges earned. Runs in the caller's transaction; the caller commits.
+
+    Returns:
+        Codes of the badges newly awarded
+    """
+    metrics: Dict[str, Tuple[Optional[int], int]] = dict(event.values)
+    increments = {name: delta for name, delta in event.increments.items() if delta}
+    if increments:
+        for name, value in (await _increment_counters(db, event.user_id, increments)).items():
+            metrics[name] = (value - increments[name], value)
+
+    rules = engine.evaluate(event.kind, metrics)
+    awarded = await _award(db, [(event.user_id, rule) for rule in rules])
+    return [code for _, code in awarded]
+
+
+async def dispatch_bulk(db: AsyncSession, kind: str, user_ids: List[int], increments: Dict[str, int]) -> int:
+    """
+    Apply the same counter increments to many users with one set-based
+    upsert per counter, then award the badges earned. Returns the number
+    of badges awarded.
+    """
+    if not user_ids:
+        return 0
+    # Same lock order as single-user upserts touching these rows
+    user_ids = sorted(user_ids)
+    awards = []
+    for name, delta in sorted(increments.items()):
+        if not delta:
+            continue
+        stmt = insert(UserCounter).from_select(
+            ["user_id", "name", "value"],
+            select(
+                func.unnest(bindparam("user_ids", user_ids, type_=ARRAY(Integer))),
+                literal(name, String),
+                literal(delta, BigInteger)
+            )
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserCounter.user_id, UserCounter.name],
+            set_={"value": UserCounter.value + stmt.excluded.value}
+        ).returning(UserCounter.user_id, UserCounter.value)
+        for user_id, value in (await db.execute(stmt)).all():
+            awards.extend((user_id, rule) for rule in engine.evaluate(kind, {name: (value - delta, value)}))
+    return len(await _award(db, awards))
+
+
+def rebuild_counters() -> int:
+    """
+    Recompute every badge counter from completions and the points ledger.
+
+    For backfills and for counters added with new rules. Counter writers
+    wait on a table lock meanwhile, so no increment is lost or counted
+    twice. Returns the number of counters written.
+    """
+    from database import engine as db_engine
+
+    sources = [
+        select(HabitCompletion.user_id, literal("completions"), func.count())
+        .group_by(HabitCompletion.user_id),
+        select(HabitCompletion.user_id, literal("completions:") + func.lower(cast(Habit.category, String)), func.count())
+        .join(Habit, Habit.id == HabitCompletion.habit_id)
+        .group_by(HabitCompletion.user_id, Habit.category),
+        select(PointsLedger.user_id, literal("points_earned"), func.sum(PointsLedger.delta))
+        .where(PointsLedger.delta > 0)
+        .group_by(PointsLedger.user_id),
+    ]
+    with db_engine.begin() as connection:
+        connection.execute(text("LOCK TABLE user_counters IN EXCLUSIVE MODE"))
+        connection.execute(delete(UserCounter))
+        written = connection.execute(
+            insert(UserCounter).from_select(["user_id", "name", "value"], union_all(*sources))
+        ).rowcount
+    logger.info(f"Rebuilt {written} badge counters")
+    return written
+
+
+def backfill_badges() -> int:
+    """
+    Award every badge already earned according to the counters and streaks,
+    one set-based insert per rule. Safe to repeat. Returns the number awarded.
+    """
+    from database import engine as db_engine
+
+    awarded = 0
+    with db_engine.begin() as connection:
+        for rule in BADGE_RULES:
+            if rule.metric == "current_streak":
+                # Any streak that ever reached the threshold counts
+                earners = select(Streak.user_id).where(Streak.longest_streak >= rule.threshold)
+            else:
+                earners = select(UserCounter.user_id).where(
+                    UserCounter.name == rule.metric, UserCounter.value >= rule.threshold
+                )
+            earners = earners.distinct().subquery()
+            awarded += connection.execute(
+                insert(Badge)
+                .from_select(
+                    ["user_id", "code", "title", "description", "icon"],
+                    select(
+                        earners.c.user_id,
+                        literal(rule.code), literal(rule.title),
+                        literal(rule.description), literal(rule.icon)
+                    )
+                )
+                .on_conflict_do_nothing(index_elements=[Badge.user_id, Badge.code])
+            ).rowcount
+    logger.info(f"Backfilled {awarded} badges")
+    return awarded
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    print("Rebuilding badge counters from history...")
+    rebuild_counters()
+    backfill_badges()
+    print("Badge counters rebuilt successfully!")
@@ -0,0 +1,3 @@
+"""
+Benchmarks. Run from the backend directory, e.g. ``python -m benchmarks.bench_pagination``.
+"""
@@ -0,0 +1,136 @@
+"""
+Throughput of the consistency analytics job.
+
+Synthesizes ``--habits`` habits with ``--completions`` completions over the
+analytics window in memory (no database) and times ``analytics.compute_metrics``
+on them, then checks a sample of habits against a plain-Python
+implementation built on ``streaks.period_index``. ``--database`` instead runs
+the whole job, process pool and COPY included, against DATABASE_URL (seed
+it with ``benchmarks.generate_dataset``):
+
+    python -m benchmarks.bench_analytics --habits 150000 --completions 10000000
+    python -m benchmarks.bench_analytics --database --workers 4
+"""
+import argparse
+import math
+import time
+from datetime import date, datetime, time as day_time, timedelta, timezone
+import numpy as np
+import analytics
+import streaks
+from models import HabitFrequency
+
+
+def synthesize(habits: int, completions: int, window: int, seed: int):
+    """Random habits of ~10 users each and completions spread over their eligible days."""
+    rng = np.random.default_rng(seed)
+    today = date.today().toordinal()
+    frequency = rng.choice(
+        [analytics.DAILY, analytics.WEEKLY, analytics.MONTHLY, analytics.CUSTOM],
+        size=habits, p=[0.7, 0.15, 0.05, 0.1]
+    ).astype(np.int8)
+    arrays = analytics.HabitArrays(
+        id=np.arange(1, habits + 1, dtype=np.int64),
+        user_id=np.arange(habits, dtype=np.int64) // 10 + 1,
+        frequency=frequency,
+        interval=np.where(frequency == analytics.CUSTOM, rng.integers(2, 8, habits), 1).astype(np.int32),
+        active=rng.random(habits) < 0.9,
+        category=rng.integers(0, len(analytics.CATEGORIES), habits).astype(np.int8),
+        age_days=rng.integers(0, 2 * window, habits).astype(np.int32),
+        # Users in timezones a day apart
+        today=(today - rng.integers(0, 2, habits)).astype(np.int32),
+    )
+    rows = rng.integers(0, habits, completions)
+    days_ago = (rng.random(completions) * (np.minimum(arrays.age_days[rows], window - 1) + 1)).astype(np.int64)
+    return arrays, arrays.id[rows], days_ago
+
+
+def reference(habits: analytics.HabitArrays, row: int, done_days: set, window: int, half_life: float):
+    """Rates and consistency of one habit, a day at a time."""
+    frequency = analytics.FREQUENCIES[habits.frequency[row]]
+    today = date.fromordinal(int(habits.today[row]))
+
+    def period(day: date) -> int:
+        moment = datetime.combine(day, day_time(12), tzinfo=timezone.utc)
+        return streaks.period_index(moment, frequency, "UTC", int(habits.interval[row]))
+
+    done_periods = {period(today - timedelta(days=days_ago)) for days_ago in done_days}
+    current = period(today)
+    hits = {7: 0, 30: 0}
+    eligible = {7: 0, 30: 0}
+    weighted_hits = weighted_eligible = 0.0
+    for days_ago in range(min(window, int(habits.age_days[row]) + 1)):
+        day_period = period(today - timedelta(days=days_ago))
+        satisfied = day_period in done_periods
+        if day_period == current and not satisfied:
+            continue
+        weight = 0.5 ** (days_ago / half_life)
+        weighted_eligible += weight
+        weighted_hits += weight * satisfied
+        for span in hits:
+            if days_ago < span:
+                eligible[span] += 1
+                hits[span] += satisfied
+    rate = lambda span: hits[span] / eligible[span] if eligible[span] else math.nan
+    return rate(7), rate(30), weighted_hits / weighted_eligible if weighted_eligible else math.nan
+
+
+def check(habits, habit_ids, days_ago, metrics, window: int, half_life: float, sample: int, seed: int) -> int:
+    rows = np.random.default_rng(seed).choice(len(habits.id), size=min(sample, len(habits.id)), replace=False)
+    wanted = set(habits.id[rows].tolist())
+    done = {habit_id: set() for habit_id in wanted}
+    for habit_id, days in zip(habit_ids.tolist(), days_ago.tolist()):
+        if habit_id in wanted:
+            done[habit_id].add(days)
+    mismatches = 0
+    for row in rows.tolist():
+        expected = reference(habits, row, done[int(habits.id[row])], window, half_life)
+        actual = (metrics.habit_rate_7d[row], metrics.habit_rate_30d[row], metrics.habit_consistency[row])
+        if not np.allclose(expected, actual, equal_nan=True):
+            mismatches += 1
+            print(f"  habit {habits.id[row]}: expected {expected}, got {actual}")
+    return mismatches
+
+
+def run_in_memory(args) -> None:
+    started = time.perf_counter()
+    habits, habit_ids, days_ago = synthesize(args.habits, args.completions, args.window, args.seed)
+    print(f"Synthesized {args.habits:,} habits, {len(habit_ids):,} completions in {time.perf_counter() - started:.1f} s")
+
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        metrics = analytics.compute_metrics(habits, habit_ids, days_ago, args.window, args.half_life)
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    print(
+        f"compute_metrics: best {best:.2f} s of {args.runs} "
+        f"({len(habit_ids) / best / 1e6:.1f}M completions/s, {len(metrics.user_id):,} users)"
+    )
+
+    mismatches = check(habits, habit_ids, days_ago, metrics, args.window, args.half_life, args.sample, args.seed)
+    print(f"Reference check: {args.sample - mismatches}/{args.sample} habits match")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--habits", type=int, default=150000)
+    parser.add_argument("--completions", type=int, default=10_000_000)
+    parser.add_argument("--window", type=int, default=analytics.ANALYTICS_WINDOW_DAYS)
+    parser.add_argument("--half-life", type=float, default=analytics.ANALYTICS_HALF_LIFE_DAYS)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--sample", type=int, default=500, help="habits checked against the reference")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--database", action="store_true", help="run the full job against DATABASE_URL")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    args.window = max(args.window, 30)
+    if args.database:
+        started = time.perf_counter()
+        counts = analytics.run_job(args.workers, window=args.window)
+        elapsed = time.perf_counter() - started
+        print(f"run_job: {elapsed:.2f} s, {counts['completions_read'] / elapsed / 1e6:.2f}M completions/s, {counts}")
+    else:
+        run_in_memory(args)
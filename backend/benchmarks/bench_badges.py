@@ -0,0 +1,122 @@
+"""
+Throughput of the badge rule engine.
+
+Replays ``--events`` synthetic events (completions, streak changes and
+points awards spread over ``--users`` users) through ``badges.engine``
+with counters held in memory, and compares it with checking every rule on
+every event. ``--db-events`` additionally dispatches that many events
+through Postgres to measure the end-to-end cost including counter upserts.
+
+    python -m benchmarks.bench_badges --events 1000000
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+import badges
+from models import HabitCategory
+
+
+def synthetic_events(count: int, users: int, seed: int = 42):
+    rng = random.Random(seed)
+    categories = list(HabitCategory)
+    streaks = defaultdict(int)
+    for _ in range(count):
+        user_id = rng.randrange(users)
+        roll = rng.random()
+        if roll < 0.5:
+            category = rng.choice(categories)
+            yield badges.BadgeEvent(
+                badges.COMPLETION_RECORDED, user_id,
+                increments={"completions": 1, badges.completion_counter(category): 1}
+            )
+        elif roll < 0.8:
+            previous = streaks[user_id]
+            streaks[user_id] = previous + 1 if rng.random() < 0.9 else 1
+            yield badges.BadgeEvent(
+                badges.STREAK_CHANGED, user_id,
+                values={"current_streak": (previous, streaks[user_id])}
+            )
+        else:
+            yield badges.BadgeEvent(badges.POINTS_CHANGED, user_id, increments={"points_earned": 10})
+
+
+def run_indexed(events) -> int:
+    """The engine: subscribed rules only, thresholds found by binary search."""
+    counters = defaultdict(int)
+    earned = set()
+    for event in events:
+        metrics = dict(event.values)
+        for name, delta in event.increments.items():
+            key = (event.user_id, name)
+            before = counters[key]
+            counters[key] = before + delta
+            metrics[name] = (before, before + delta)
+        for rule in badges.engine.evaluate(event.kind, metrics):
+            earned.add((event.user_id, rule.code))
+    return len(earned)
+
+
+def run_naive(events) -> int:
+    """Baseline: every rule checked against the user's state on every event."""
+    state = defaultdict(int)
+    earned = set()
+    for event in events:
+        for name, delta in event.increments.items():
+            state[(event.user_id, name)] += delta
+        for name, (_, after) in event.values.items():
+            state[(event.user_id, name)] = after
+        for rule in badges.BADGE_RULES:
+            if state[(event.user_id, rule.metric)] >= rule.threshold:
+                earned.add((event.user_id, rule.code))
+    return len(earned)
+
+
+async def run_db(events, users: int) -> None:
+    from sqlalchemy import delete, select
+    from database import AsyncSessionLocal, async_engine
+    import models
+
+    async with AsyncSessionLocal() as db:
+        user_ids = (await db.execute(select(models.User.id).limit(users))).scalars().all()
+        if not user_ids:
+            print("  no users in the database, skipping the Postgres run")
+            return
+        # Map synthetic users onto real ones; clear what the run will write
+        await db.execute(delete(models.UserCounter).where(models.UserCounter.user_id.in_(user_ids)))
+        await db.execute(delete(models.Badge).where(models.Badge.user_id.in_(user_ids), models.Badge.code.is_not(None)))
+        await db.commit()
+
+        start = time.perf_counter()
+        for position, event in enumerate(events, 1):
+            await badges.dispatch(db, event._replace(user_id=user_ids[event.user_id % len(user_ids)]))
+            if position % 100 == 0:
+                await db.commit()
+        await db.commit()
+        elapsed = time.perf_counter() - start
+    print(f"  postgres dispatch {position / elapsed:12,.0f} events/s ({elapsed:.2f} s)")
+    await async_engine.dispose()
+
+
+def main(count: int, users: int, db_events: int) -> None:
+    print(f"Generating {count:,} events over {users:,} users...")
+    events = list(synthetic_events(count, users))
+
+    for name, runner in (("indexed rules", run_indexed), ("check every rule", run_naive)):
+        start = time.perf_counter()
+        earned = runner(events)
+        elapsed = time.perf_counter() - start
+        print(f"  {name:<18} {count / elapsed:12,.0f} events/s ({elapsed:.2f} s, {earned:,} badges)")
+
+    if db_events:
+        asyncio.run(run_db(events[:db_events], users))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--db-events", type=int, default=0)
+    args = parser.parse_args()
+    main(args.events, args.users, args.db_events)
@@ -0,0 +1,60 @@
+"""
+Cost of a poll with and without conditional GET.
+
+Seeds one user with ``--habits`` habits and, in-process over ASGI, times
+``/users/me`` and ``/habits?limit=<page size>`` fetched in full versus
+revalidated with the ETag of the previous response (a 304 with no body).
+Uses the Postgres in DATABASE_URL; ``--fake-redis`` as in
+``benchmarks.bench_load``.
+
+    python -m benchmarks.bench_conditional --habits 200 --requests 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+import httpx
+from benchmarks.bench_load import in_process_app, remove_users, seed_users
+
+
+async def time_requests(client: httpx.AsyncClient, path: str, headers: dict, count: int, expected: int) -> float:
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        timings.append(time.perf_counter() - start)
+        if response.status_code != expected:
+            raise SystemExit(f"{path}: expected {expected}, got {response.status_code}")
+    return statistics.median(timings) * 1000
+
+
+async def run(args) -> None:
+    prefix = f"conditional_{uuid.uuid4().hex[:8]}"
+    user, = await seed_users(prefix, 1, args.habits)
+    try:
+        async with in_process_app(args.fake_redis) as app:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                auth_header = {"Authorization": f"Bearer {user.token}", "Accept-Encoding": "gzip"}
+                for path in ("/users/me", f"/habits?limit={args.page_size}"):
+                    first = await client.get(path, headers=auth_header)
+                    revalidate = {**auth_header, "If-None-Match": first.headers["etag"]}
+                    full = await time_requests(client, path, auth_header, args.requests, 200)
+                    cached = await time_requests(client, path, revalidate, args.requests, 304)
+                    print(
+                        f"  {path:<20} full {full:7.3f} ms ({len(first.content):,} bytes)  "
+                        f"304 {cached:7.3f} ms  ({full / cached:.1f}x)"
+                    )
+    finally:
+        await remove_users(prefix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--habits", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--fake-redis", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args))
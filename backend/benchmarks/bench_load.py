@@ -0,0 +1,313 @@
+"""
+HTTP load test for the API.
+
+Runs realistic request mixes against the app and reports throughput and
+p50/p95/p99 latency per endpoint:
+
+- ``login_storm``: every virtual user logs in over and over (POST /token)
+- ``authenticated_reads``: logged-in users read /users/me, /habits and /rewards
+- ``signup_storm``: new accounts created as fast as possible, running into
+  the per-IP signup rate limit (429s are expected and counted)
+
+By default the app runs in-process over ASGI, with its lifespan, against
+the Postgres in DATABASE_URL and the Redis in REDIS_URL. ``--fake-redis``
+swaps Redis for an in-process fakeredis (needs ``fakeredis`` and ``lupa``).
+Each virtual user gets its own client address, so per-IP rate limits apply
+per user as they would for real clients; ``--rotate-addresses`` gives every
+request a new address instead, to measure the handlers behind the rate
+limiter (e.g. bcrypt on /token). ``--url`` targets a running
+server instead; all requests then share one address. Test users are
+created directly in the database (DATABASE_URL must point at the server's
+database) and removed afterwards unless ``--keep``.
+
+Results are printed and, with ``--output``, saved as JSON. ``--compare``
+checks against an earlier results file and exits non-zero if any endpoint
+lost more than ``--threshold`` of its throughput or p95 latency.
+
+    BCRYPT_ROUNDS=10 python -m benchmarks.bench_load --duration 20 --output before.json
+    python -m benchmarks.bench_load --duration 20 --compare before.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional
+import httpx
+from sqlalchemy import delete, select
+import auth
+import models
+from database import AsyncSessionLocal
+
+PASSWORD = "load-test-password"
+SCENARIOS = ("login_storm", "authenticated_reads", "signup_storm")
+
+
+class LoadUser(NamedTuple):
+    id: int
+    username: str
+    token: str
+
+
+class Recorder:
+    """Latencies and status codes per endpoint label."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+
+    async def call(self, label: str, request) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError as e:
+            self.errors[f"{label}: {type(e).__name__}"] += 1
+            return None
+        self.latencies[label].append(time.perf_counter() - start)
+        self.statuses[label][str(response.status_code)] += 1
+        return response
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for label, latencies in sorted(recorder.latencies.items()):
+        latencies.sort()
+        endpoints[label] = {
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "statuses": dict(recorder.statuses[label]),
+        }
+    return {"duration_s": round(elapsed, 2), "endpoints": endpoints, "errors": dict(recorder.errors)}
+
+
+async def seed_users(prefix: str, count: int, habits_per_user: int) -> List[LoadUser]:
+    """Create ``count`` users with habits, sharing one password hash, and mint their tokens."""
+    hashed_password = await auth.get_password_hash(PASSWORD)
+    async with AsyncSessionLocal() as db:
+        users = [
+            models.User(
+                email=f"{prefix}_{n}@example.com", username=f"{prefix}_{n}",
+                hashed_password=hashed_password, is_active=True, points=0
+            )
+            for n in range(count)
+        ]
+        db.add_all(users)
+        await db.flush()
+        db.add_all(
+            models.Habit(
+                title=f"Habit {n}", description="Load test habit", user_id=user.id,
+                frequency=models.HabitFrequency.DAILY, category=models.HabitCategory.HEALTH, is_active=True
+            )
+            for user in users for n in range(habits_per_user)
+        )
+        await db.commit()
+        return [
+            LoadUser(user.id, user.username, auth.create_access_token(auth.token_claims(user)))
+            for user in users
+        ]
+
+
+async def remove_users(prefix: str) -> int:
+    async with AsyncSessionLocal() as db:
+        user_ids = select(models.User.id).where(models.User.username.startswith(f"{prefix}_", autoescape=True))
+        await db.execute(delete(models.Habit).where(models.Habit.user_id.in_(user_ids)))
+        await db.execute(delete(models.Reward).where(models.Reward.user_id.in_(user_ids)))
+        result = await db.execute(delete(models.User).where(models.User.id.in_(user_ids)))
+        await db.commit()
+        return result.rowcount
+
+
+async def login_storm(client: httpx.AsyncClient, recorder: Recorder, user: LoadUser, rng: random.Random, prefix: str):
+    await recorder.call("POST /token", client.post("/token", data={"username": user.username, "password": PASSWORD}))
+
+
+async def authenticated_reads(client: httpx.AsyncClient, recorder: Recorder, user: LoadUser, rng: random.Random, prefix: str):
+    headers = {"Authorization": f"Bearer {user.token}"}
+    roll = rng.random()
+    if roll < 0.6:
+        await recorder.call("GET /users/me", client.get("/users/me", headers=headers))
+    elif roll < 0.85:
+        await recorder.call("GET /habits", client.get("/habits", headers=headers))
+    else:
+        await recorder.call("GET /rewards", client.get("/rewards", headers=headers))
+
+
+async def signup_storm(client: httpx.AsyncClient, recorder: Recorder, user: LoadUser, rng: random.Random, prefix: str):
+    name = f"{prefix}_s{uuid.uuid4().hex[:12]}"
+    await recorder.call("POST /signup", client.post(
+        "/signup", json={"email": f"{name}@example.com", "username": name, "password": PASSWORD}
+    ))
+
+
+async def run_scenario(
+    name: str,
+    make_client,
+    users: List[LoadUser],
+    duration: float,
+    prefix: str,
+    seed: int,
+    rotate_addresses: bool = False
+) -> dict:
+    step = globals()[name]
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    addresses = itertools.count(len(users))
+
+    async def virtual_user(index: int, user: LoadUser):
+        rng = random.Random(seed + index)
+        if rotate_addresses:
+            # A fresh client address per request: per-IP limits never apply
+            while time.perf_counter() < deadline:
+                async with make_client(next(addresses)) as client:
+                    await step(client, recorder, user, rng, prefix)
+            return
+        async with make_client(index) as client:
+            while time.perf_counter() < deadline:
+                await step(client, recorder, user, rng, prefix)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(virtual_user(index, user) for index, user in enumerate(users)))
+    return summarize(recorder, time.perf_counter() - start)
+
+
+@asynccontextmanager
+async def in_process_app(fake_redis: bool):
+    if fake_redis:
+        import fakeredis
+        import redis_config
+        redis_config.redis_client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        yield main.app
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Endpoints whose throughput or p95 latency got worse than ``threshold`` (a fraction)."""
+    regressions = []
+    for scenario, summary in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario, {}).get("endpoints", {})
+        for label, current in summary["endpoints"].items():
+            before = previous.get(label)
+            if not before:
+                continue
+            if before["throughput_rps"] and current["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+                regressions.append(
+                    f"{scenario} {label}: throughput {before['throughput_rps']} -> {current['throughput_rps']} req/s"
+                )
+            if before["p95_ms"] and current["p95_ms"] > before["p95_ms"] * (1 + threshold):
+                regressions.append(f"{scenario} {label}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+    return regressions
+
+
+def print_summary(scenario: str, summary: dict) -> None:
+    print(f"{scenario} ({summary['duration_s']} s)")
+    for label, stats in summary["endpoints"].items():
+        statuses = ", ".join(f"{code}: {count}" for code, count in sorted(stats["statuses"].items()))
+        print(
+            f"  {label:<16} {stats['throughput_rps']:9.1f} req/s  p50 {stats['p50_ms']:8.2f}  "
+            f"p95 {stats['p95_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms  [{statuses}]"
+        )
+    for error, count in summary["errors"].items():
+        print(f"  error {error}: {count}")
+
+
+async def run(args) -> int:
+    prefix = f"load_{uuid.uuid4().hex[:8]}"
+    users = await seed_users(prefix, args.users, args.habits)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "target": args.url or ("in-process, fakeredis" if args.fake_redis else "in-process"),
+            "users": args.users,
+            "duration_s": args.duration,
+            "bcrypt_rounds": auth.BCRYPT_ROUNDS,
+            "rotate_addresses": args.rotate_addresses,
+        },
+        "scenarios": {},
+    }
+    try:
+        if args.url:
+            def make_client(index: int) -> httpx.AsyncClient:
+                return httpx.AsyncClient(base_url=args.url, timeout=30.0)
+            for scenario in args.scenarios:
+                results["scenarios"][scenario] = await run_scenario(
+                    scenario, make_client, users, args.duration, prefix, args.seed
+                )
+                print_summary(scenario, results["scenarios"][scenario])
+        else:
+            async with in_process_app(args.fake_redis) as app:
+                def make_client(index: int) -> httpx.AsyncClient:
+                    address = f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"
+                    transport = httpx.ASGITransport(app=app, client=(address, 40000))
+                    return httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=30.0)
+                for scenario in args.scenarios:
+                    results["scenarios"][scenario] = await run_scenario(
+                        scenario, make_client, users, args.duration, prefix, args.seed, args.rotate_addresses
+                    )
+                    print_summary(scenario, results["scenarios"][scenario])
+    finally:
+        if not args.keep:
+            await remove_users(prefix)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        print(f"No regressions against {args.compare}" if not regressions else f"{len(regressions)} regression(s)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--users", type=int, default=50, help="virtual users (and seeded accounts)")
+    parser.add_argument("--habits", type=int, default=20, help="habits seeded per user")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--url", default="", help="base URL of a running server; default runs in-process")
+    parser.add_argument("--fake-redis", action="store_true")
+    parser.add_argument(
+        "--rotate-addresses", action="store_true",
+        help="in-process only: new client address per request, so rate limits do not apply"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="")
+    parser.add_argument("--compare", default="")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded users")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
@@ -0,0 +1,85 @@
+"""
+Compare OFFSET and keyset pagination on test_table.
+
+Seeds ``--rows`` rows (once) and times fetching page 1 and a deep page with
+both strategies. Keyset pages should cost the same at any depth; OFFSET
+pages grow linearly with the number of skipped rows.
+
+    python -m benchmarks.bench_pagination --rows 1000000 --page 10000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from sqlalchemy import func, select, text
+from database import AsyncSessionLocal, async_engine
+import models
+import pagination
+
+
+async def seed(rows: int) -> None:
+    async with async_engine.begin() as connection:
+        await connection.run_sync(models.Base.metadata.create_all, tables=[models.TestTable.__table__])
+        existing = (await connection.execute(select(func.count()).select_from(models.TestTable))).scalar()
+        if existing >= rows:
+            return
+        print(f"Seeding {rows - existing} rows into test_table...")
+        # Spread created_at so the sort key is realistic rather than constant
+        await connection.execute(text("""
+            INSERT INTO test_table (name, created_at)
+            SELECT 'item-' || n, now() - (n || ' seconds')::interval
+            FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer)) AS n
+        """), {"start": existing + 1, "stop": rows})
+        await connection.execute(text("ANALYZE test_table"))
+
+
+async def time_query(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+async def run(rows: int, page: int, page_size: int, repeat: int) -> None:
+    await seed(rows)
+    order = (models.TestTable.created_at, models.TestTable.id)
+    skip = (page - 1) * page_size
+
+    async with AsyncSessionLocal() as db:
+        # Cursor pointing just before the deep page, as a client would hold it
+        last_of_previous = (await db.execute(
+            select(*order).order_by(*order).offset(skip - 1).limit(1)
+        )).one()
+        deep_cursor = pagination.encode_cursor(list(last_of_previous))
+
+        async def offset_page(offset):
+            await db.execute(select(models.TestTable).order_by(*order).offset(offset).limit(page_size))
+            db.expunge_all()
+
+        async def keyset_page(cursor):
+            await pagination.paginate(db, select(models.TestTable), order, cursor, page_size)
+            db.expunge_all()
+
+        results = {
+            "offset page 1": await time_query(lambda: offset_page(0), repeat),
+            f"offset page {page}": await time_query(lambda: offset_page(skip), repeat),
+            "keyset page 1": await time_query(lambda: keyset_page(None), repeat),
+            f"keyset page {page}": await time_query(lambda: keyset_page(deep_cursor), repeat),
+        }
+
+    print(f"{rows} rows, {page_size} per page, median of {repeat} runs")
+    for name, ms in results.items():
+        print(f"  {name:<24} {ms:8.2f} ms")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--page", type=int, default=10_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.page, args.page_size, args.repeat))
@@ -0,0 +1,99 @@
+"""
+Response serialization cost, before and after ``serializers``.
+
+Builds in-memory ORM objects (no database) for a ``/users/me`` response and
+a ``--page-size`` page of habits, then times:
+
+- before: what FastAPI does with a ``response_model``: validate from
+  attributes, dump in JSON mode, encode with the standard ``json`` module
+- after: ``serializers.serializer_for`` plus orjson
+
+It also reports compressed sizes and timings for the page body.
+
+    python -m benchmarks.bench_serialization --page-size 200
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from pydantic import TypeAdapter
+import compression
+import models
+import schemas
+import serializers
+
+
+def sample_user() -> models.User:
+    return models.User(
+        id=42, email="ada@example.com", username="ada", is_active=True, points=1250,
+        created_at=datetime(2024, 1, 1, tzinfo=timezone.utc), updated_at=datetime.now(timezone.utc),
+        oauth_provider=None, oauth_id=None, profile_picture=None, timezone="Europe/London"
+    )
+
+
+def sample_page(size: int) -> dict:
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    habits = [
+        models.Habit(
+            id=n, title=f"Habit number {n}", description="Read twenty pages before breakfast",
+            frequency=models.HabitFrequency.DAILY, category=models.HabitCategory.LEARNING,
+            user_id=42, is_active=True, created_at=start + timedelta(minutes=n), updated_at=None
+        )
+        for n in range(size)
+    ]
+    return {"items": habits, "next_cursor": "eyJrIjpbIjIwMjQtMDEtMDEiLDIwMF19"}
+
+
+def before(schema):
+    adapter = TypeAdapter(schema)
+
+    def render(obj) -> bytes:
+        value = adapter.validate_python(obj, from_attributes=True)
+        content = adapter.dump_python(value, mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+    return render
+
+
+def after(schema):
+    serializer = serializers.serializer_for(schema)
+    return lambda obj: serializers.dumps(serializer.dump(obj))
+
+
+def per_call(function, argument, seconds: float = 1.0) -> float:
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        function(argument)
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+
+def main(page_size: int) -> None:
+    cases = (
+        ("/users/me", schemas.User, sample_user()),
+        (f"/habits ({page_size} items)", schemas.Page[schemas.Habit], sample_page(page_size)),
+    )
+    for name, schema, obj in cases:
+        old, new = before(schema), after(schema)
+        if json.loads(old(obj)) != json.loads(new(obj)):
+            print(f"  {name}: outputs differ!")
+        old_time, new_time = per_call(old, obj), per_call(new, obj)
+        print(
+            f"  {name:<22} before {old_time * 1e6:9.1f} us  after {new_time * 1e6:9.1f} us"
+            f"  ({old_time / new_time:.1f}x, {len(new(obj)):,} bytes)"
+        )
+
+    body = after(schemas.Page[schemas.Habit])(sample_page(page_size))
+    encodings = ["gzip"] + (["zstd"] if compression.zstandard is not None else [])
+    for encoding in encodings:
+        elapsed = per_call(lambda data: compression.compress(data, encoding), body)
+        size = len(compression.compress(body, encoding))
+        print(f"  {encoding:<5} {len(body):,} -> {size:,} bytes ({size / len(body):.0%}) in {elapsed * 1e6:.1f} us")
+    if compression.zstandard is None:
+        print("  zstd  skipped (zstandard not installed)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=200)
+    args = parser.parse_args()
+    main(args.page_size)
@@ -0,0 +1,120 @@
+"""
+Worker startup cost.
+
+Measures, over ``--runs`` fresh processes:
+
+1. import time: how long ``import main`` takes in a new interpreter
+2. time to first request: from spawning a single uvicorn worker until
+   /health answers, and until /ready reports the worker ready
+
+``--database-url`` points the workers elsewhere, e.g. at an unreachable
+host to check that they still start and report 503 from /ready.
+``--top`` lists the slowest imports from ``python -X importtime``.
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_time(env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env: dict, count: int) -> list:
+    """(cumulative seconds, module) for the slowest imports under ``import main``."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], env=env, check=True, capture_output=True, text=True
+    ).stderr
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        timings.append((int(cumulative) / 1e6, module.strip()))
+    return sorted(timings, reverse=True)[:count]
+
+
+def first_request(env: dict, timeout: float) -> tuple:
+    """Seconds from spawn until /health answers and until /ready is 200 (None if it never is)."""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    healthy = ready = None
+    try:
+        with httpx.Client(timeout=1.0) as client:
+            while time.perf_counter() - start < timeout and ready is None:
+                try:
+                    if healthy is None and client.get(f"{base}/health").status_code == 200:
+                        healthy = time.perf_counter() - start
+                    if healthy is not None and client.get(f"{base}/ready").status_code == 200:
+                        ready = time.perf_counter() - start
+                except httpx.TransportError:
+                    pass
+                if server.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    return healthy, ready
+
+
+def summarize(name: str, samples: list) -> None:
+    values = [sample for sample in samples if sample is not None]
+    if not values:
+        print(f"  {name:<22} never")
+        return
+    missing = f", {len(samples) - len(values)} never" if len(values) < len(samples) else ""
+    print(
+        f"  {name:<22} median {statistics.median(values) * 1000:8.1f} ms"
+        f"  min {min(values) * 1000:8.1f} ms  max {max(values) * 1000:8.1f} ms{missing}"
+    )
+
+
+def main(runs: int, database_url: str, timeout: float, top: int) -> None:
+    env = dict(os.environ, LOG_FILE="")
+    if database_url:
+        env["DATABASE_URL"] = database_url
+
+    print(f"{runs} runs per measurement")
+    summarize("import main", [import_time(env) for _ in range(runs)])
+    samples = [first_request(env, timeout) for _ in range(runs)]
+    summarize("first /health", [healthy for healthy, _ in samples])
+    summarize("first ready /ready", [ready for _, ready in samples])
+
+    if top:
+        print("Slowest imports under `import main`:")
+        for seconds, module in slowest_imports(env, top):
+            print(f"  {seconds * 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--database-url", default="")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--top", type=int, default=0)
+    args = parser.parse_args()
+    main(args.runs, args.database_url, args.timeout, args.top)
@@ -0,0 +1,320 @@
+"""
+Time the application's key queries and capture their plans.
+
+Runs the statements behind login, the habit and completion pages, streak
+lookups, completion stats, calendars and offline sync for two sample users of a
+generated dataset (see ``benchmarks.generate_dataset``): the user with the
+most completions and a median one. Most statements are built by the same
+code the endpoints use (``pagination.page_query``,
+``rollups.completion_stats_query``), so the numbers follow the app.
+
+Each query runs ``--runs`` times for median and p95 latency, then once
+under ``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)``; the report lists the
+indexes used and any sequential scans. ``--output`` saves results and full
+plans as JSON. ``--compare`` checks against an earlier file, prints plan
+changes and exits non-zero if any median got more than ``--threshold``
+(and at least ``--min-delta`` ms) slower.
+
+    python -m benchmarks.generate_dataset --users 100000
+    python -m benchmarks.explain_queries --output before.json
+    python -m benchmarks.explain_queries --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import ClauseElement, Executable, Text, cast, func, select, text
+from sqlalchemy.ext.compiler import compiles
+import calendars
+import models
+import pagination
+import rollups
+import streaks
+from database import async_engine
+
+TABLES = ("users", "habits", "habit_completions", "streaks", "completion_daily_rollup", "completion_calendar")
+
+
+class Explain(Executable, ClauseElement):
+    """``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`` of a statement, keeping its bound parameters."""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+class Sample(NamedTuple):
+    """A user and one of their habits that the queries run for."""
+    user_id: int
+    username: str
+    email: str
+    timezone: str
+    completions: int
+    habit_id: int
+    deep_cursor: Optional[str]
+    client_ids: List[str]
+
+
+def user_queries(sample: Sample, now: datetime) -> Dict[str, object]:
+    HabitCompletion = models.HabitCompletion
+    completion_order = (HabitCompletion.completed_at, HabitCompletion.id)
+    completions = select(HabitCompletion).where(HabitCompletion.habit_id == sample.habit_id)
+    today = streaks.local_date(now, sample.timezone)
+    queries = {
+        "user_by_username": select(models.User).where(models.User.username == sample.username),
+        "signup_conflict": select(models.User.id).where(
+            (models.User.email == sample.email) | (models.User.username == sample.username)
+        ),
+        "owned_habit": select(models.Habit).where(
+            models.Habit.id == sample.habit_id,
+            models.Habit.user_id == sample.user_id,
+            models.Habit.is_active.is_(True)
+        ),
+        "habits_page": pagination.page_query(
+            select(models.Habit).where(models.Habit.user_id == sample.user_id, models.Habit.is_active.is_(True)),
+            (models.Habit.created_at, models.Habit.id)
+        ),
+        "completions_first_page": pagination.page_query(completions, completion_order, descending=True),
+        "completions_last_30_days": pagination.page_query(
+            completions.where(HabitCompletion.completed_at >= now - timedelta(days=30)),
+            completion_order, descending=True
+        ),
+        "streak": select(models.Streak).where(
+            models.Streak.habit_id == sample.habit_id,
+            models.Streak.user_id == sample.user_id
+        ),
+        "stats_by_day_year": rollups.completion_stats_query(
+            sample.user_id, today - timedelta(days=364), today, "day"
+        )[1],
+        "stats_by_category_year": rollups.completion_stats_query(
+            sample.user_id, today - timedelta(days=364), today, "category"
+        )[1],
+        # Year heatmap and "done today?" from the calendar, as in calendars.py
+        "calendar_year": select(cast(models.CompletionCalendar.days, Text)).where(
+            models.CompletionCalendar.habit_id == sample.habit_id,
+            models.CompletionCalendar.year == today.year
+        ),
+        "calendar_done_today": select(
+            func.get_bit(models.CompletionCalendar.days, calendars.day_index(today))
+        ).where(
+            models.CompletionCalendar.habit_id == sample.habit_id,
+            models.CompletionCalendar.year == today.year
+        ),
+        # What the calendar replaces: the year's raw completions
+        "completions_year_scan": select(HabitCompletion.completed_at).where(
+            HabitCompletion.habit_id == sample.habit_id,
+            HabitCompletion.completed_at >= now - timedelta(days=365)
+        ),
+    }
+    if sample.deep_cursor:
+        queries["completions_deep_page"] = pagination.page_query(
+            completions, completion_order, sample.deep_cursor, descending=True
+        )
+    if sample.client_ids:
+        queries["sync_client_ids"] = select(HabitCompletion.client_id, HabitCompletion.id).where(
+            HabitCompletion.user_id == sample.user_id,
+            HabitCompletion.client_id.in_(sample.client_ids)
+        )
+    return queries
+
+
+def global_queries() -> Dict[str, object]:
+    return {
+        # Candidates for a 30-period streak badge, as in badges.backfill_badges
+        "streak_badge_earners": select(models.Streak.user_id).where(models.Streak.longest_streak >= 30),
+    }
+
+
+async def pick_samples(connection, prefix: str) -> Dict[str, Sample]:
+    """The user with the most completions and a median one, among ``prefix`` users."""
+    per_user = (await connection.execute(
+        select(models.CompletionDailyRollup.user_id, func.sum(models.CompletionDailyRollup.completions))
+        .join(models.User, models.User.id == models.CompletionDailyRollup.user_id)
+        .where(models.User.username.startswith(f"{prefix}_", autoescape=True))
+        .group_by(models.CompletionDailyRollup.user_id)
+        .order_by(func.sum(models.CompletionDailyRollup.completions), models.CompletionDailyRollup.user_id)
+    )).all()
+    if not per_user:
+        raise SystemExit(f"No users named {prefix}_*; run benchmarks.generate_dataset first")
+    picks = {"heavy": per_user[-1], "median": per_user[len(per_user) // 2]}
+
+    samples = {}
+    for profile, (user_id, completions) in picks.items():
+        user = (await connection.execute(select(models.User).where(models.User.id == user_id))).one()
+        habit_id, habit_completions = (await connection.execute(
+            select(models.Habit.id, func.count(models.HabitCompletion.id))
+            .join(models.HabitCompletion, models.HabitCompletion.habit_id == models.Habit.id)
+            .where(models.Habit.user_id == user_id)
+            .group_by(models.Habit.id)
+            .order_by(models.Habit.is_active.desc(), func.count(models.HabitCompletion.id).desc())
+            .limit(1)
+        )).one()
+        # A cursor halfway through the habit's history, as a client paging back would hold
+        middle = (await connection.execute(
+            select(models.HabitCompletion.completed_at, models.HabitCompletion.id)
+            .where(models.HabitCompletion.habit_id == habit_id)
+            .order_by(models.HabitCompletion.completed_at.desc(), models.HabitCompletion.id.desc())
+            .offset(habit_completions // 2)
+            .limit(1)
+        )).first()
+        client_ids = (await connection.execute(
+            select(models.HabitCompletion.client_id)
+            .where(models.HabitCompletion.user_id == user_id, models.HabitCompletion.client_id.is_not(None))
+            .limit(50)
+        )).scalars().all()
+        samples[profile] = Sample(
+            user_id=user_id, username=user.username, email=user.email, timezone=user.timezone,
+            completions=int(completions), habit_id=habit_id,
+            deep_cursor=pagination.encode_cursor(list(middle)) if middle else None,
+            client_ids=list(client_ids)
+        )
+    return samples
+
+
+def summarize_plan(plan: dict) -> dict:
+    """Indexes, sequential scans and totals of an ``EXPLAIN (FORMAT JSON)`` plan."""
+    indexes, seq_scans, nodes = set(), set(), []
+
+    def walk(node: dict) -> None:
+        nodes.append(node["Node Type"])
+        if "Index Name" in node:
+            indexes.add(node["Index Name"])
+        if node["Node Type"] == "Seq Scan":
+            seq_scans.add(node["Relation Name"])
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    root = plan["Plan"]
+    walk(root)
+    return {
+        "execution_ms": round(plan["Execution Time"], 3),
+        "planning_ms": round(plan["Planning Time"], 3),
+        "rows": root.get("Actual Rows"),
+        "shared_hit_blocks": root.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": root.get("Shared Read Blocks", 0),
+        "indexes": sorted(indexes),
+        "seq_scans": sorted(seq_scans),
+        "nodes": nodes,
+    }
+
+
+async def measure(connection, statement, runs: int) -> dict:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        (await connection.execute(statement)).all()
+        timings.append((time.perf_counter() - start) * 1000)
+    raw_plan = (await connection.execute(Explain(statement))).scalar()
+    plan = (json.loads(raw_plan) if isinstance(raw_plan, str) else raw_plan)[0]
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(sorted(timings)[max(int(len(timings) * 0.95) - 1, 0)], 3),
+        **summarize_plan(plan),
+        "plan": plan,
+    }
+
+
+def print_result(name: str, result: dict) -> None:
+    scans = f"  SEQ SCAN {', '.join(result['seq_scans'])}" if result["seq_scans"] else ""
+    print(
+        f"  {name:<34} median {result['median_ms']:8.3f}  p95 {result['p95_ms']:8.3f} ms  "
+        f"rows {result['rows']:>6}  buffers {result['shared_hit_blocks'] + result['shared_read_blocks']:>6}  "
+        f"{', '.join(result['indexes']) or '-'}{scans}"
+    )
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> List[str]:
+    regressions = []
+    for name, current in results["queries"].items():
+        before = baseline.get("queries", {}).get(name)
+        if before is None:
+            continue
+        if (before["indexes"], before["seq_scans"]) != (current["indexes"], current["seq_scans"]):
+            print(
+                f"PLAN CHANGED: {name}: indexes {before['indexes']} -> {current['indexes']}, "
+                f"seq scans {before['seq_scans']} -> {current['seq_scans']}"
+            )
+        slower = current["median_ms"] - before["median_ms"]
+        if slower > before["median_ms"] * threshold and slower > min_delta_ms:
+            regressions.append(f"{name}: median {before['median_ms']} -> {current['median_ms']} ms")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> int:
+    now = datetime.now(timezone.utc)
+    results = {"meta": {"commit": git_commit(), "started_at": now.isoformat(), "runs": args.runs}, "queries": {}}
+    try:
+        async with async_engine.connect() as connection:
+            rows = {}
+            for table in TABLES:
+                # Planner estimate; exact counts take too long on large tables
+                rows[table] = (await connection.execute(
+                    text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table"), {"table": table}
+                )).scalar()
+            results["meta"]["table_rows"] = rows
+            print("Rows: " + ", ".join(f"{table} ~{count:,}" for table, count in rows.items()))
+
+            samples = await pick_samples(connection, args.prefix)
+            queries: Dict[str, object] = {}
+            for profile, sample in samples.items():
+                print(f"{profile}: user {sample.user_id} ({sample.completions:,} completions), habit {sample.habit_id}")
+                results["meta"][f"{profile}_user"] = sample._asdict()
+                for name, statement in user_queries(sample, now).items():
+                    queries[f"{profile}/{name}"] = statement
+            queries.update(global_queries())
+
+            for name, statement in queries.items():
+                if args.only and not any(pattern in name for pattern in args.only):
+                    continue
+                results["queries"][name] = await measure(connection, statement, args.runs)
+                print_result(name, results["queries"][name])
+    finally:
+        await async_engine.dispose()
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2, default=str)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold, args.min_delta)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        print(f"No regressions against {args.compare}" if not regressions else f"{len(regressions)} regression(s)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prefix", default="synthetic", help="username prefix of the generated users")
+    parser.add_argument("--runs", type=int, default=20, help="timed executions per query")
+    parser.add_argument("--only", nargs="*", default=[], help="run only queries whose name contains one of these")
+    parser.add_argument("--output", default="")
+    parser.add_argument("--compare", default="")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument(
+        "--min-delta", type=float, default=0.5,
+        help="ms; smaller slowdowns are noise and never count as regressions"
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
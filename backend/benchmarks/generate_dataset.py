@@ -0,0 +1,354 @@
+"""
+Load a synthetic production-sized dataset.
+
+Creates ``--users`` users with habits and ``--years`` of completion history,
+shaped like real usage rather than uniform noise:
+
+- sign-ups grow over time, users live in a weighted mix of timezones and a
+  share of them sign in with OAuth; some stop using the app after a while
+- each user has a heavy-tailed number of habits (mean ``--habits-per-user``)
+  spread over the ``HabitCategory`` and ``HabitFrequency`` values, and some
+  habits are abandoned
+- completions follow streaks: a user keeps a streak going or breaks it with
+  a probability set by their adherence, then resumes after a gap, so streak
+  lengths and gaps are geometric as in real data. Completions cluster in
+  the morning and evening of the user's local day, a few are logged twice
+  in one period and a share carries an offline-sync ``client_id``
+
+``streaks``, ``completion_daily_rollup`` and ``completion_calendar`` rows
+are computed with the application's own rules (``streaks.period_index``,
+``streaks.fold``, ``calendars.day_index``), so the endpoints return
+consistent data. Points and the points ledger are left at
+zero. Rows are written with binary COPY in batches of ``--batch-size``
+users, one transaction per batch, and the tables are analyzed at the end.
+Users are named ``<prefix>_<id>`` and share the password ``PASSWORD``;
+running again adds more users, ``--remove`` deletes them all.
+
+Ids for users and habits are reserved from their sequences up front, so
+avoid running this against a database that takes sign-ups at the same time.
+
+    python -m benchmarks.generate_dataset --users 100000 --habits-per-user 5 --years 3
+    python -m benchmarks.generate_dataset --remove
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Set, Tuple
+from zoneinfo import ZoneInfo
+from asyncpg import BitString
+from sqlalchemy import delete, select, text
+import auth
+import calendars
+import models
+import partitions
+import streaks
+from database import AsyncSessionLocal, async_engine
+from models import HabitCategory, HabitFrequency
+
+PASSWORD = "synthetic-password"
+
+TIMEZONES = (
+    ("America/New_York", 18), ("America/Chicago", 7), ("America/Los_Angeles", 10),
+    ("America/Sao_Paulo", 6), ("Europe/London", 10), ("Europe/Berlin", 9),
+    ("Asia/Karachi", 5), ("Asia/Kolkata", 12), ("Asia/Tokyo", 5),
+    ("Australia/Sydney", 4), ("UTC", 14),
+)
+CATEGORIES = (
+    (HabitCategory.HEALTH, 25), (HabitCategory.FITNESS, 25), (HabitCategory.PRODUCTIVITY, 18),
+    (HabitCategory.LEARNING, 15), (HabitCategory.MINDFULNESS, 12), (HabitCategory.OTHER, 5),
+)
+FREQUENCIES = (
+    (HabitFrequency.DAILY, 62), (HabitFrequency.WEEKLY, 24),
+    (HabitFrequency.MONTHLY, 9), (HabitFrequency.CUSTOM, 5),
+)
+TITLES = {
+    HabitCategory.HEALTH: ("Drink water", "Take vitamins", "Sleep by 11", "No sugar", "Floss"),
+    HabitCategory.FITNESS: ("Morning run", "10k steps", "Gym session", "Stretch", "Push-ups"),
+    HabitCategory.PRODUCTIVITY: ("Inbox zero", "Plan the day", "Deep work block", "Weekly review"),
+    HabitCategory.LEARNING: ("Read 20 pages", "Spanish practice", "Practice piano", "Online course"),
+    HabitCategory.MINDFULNESS: ("Meditate", "Journal", "Gratitude list", "Digital detox"),
+    HabitCategory.OTHER: ("Call family", "Water the plants", "Tidy up", "Cook at home"),
+}
+NOTES = ("Felt great", "Hard today", "Done early", "Almost skipped", "New personal best")
+
+USER_COLUMNS = (
+    "id", "email", "username", "hashed_password", "is_active", "points", "created_at", "updated_at",
+    "oauth_provider", "oauth_id", "profile_picture", "timezone",
+)
+HABIT_COLUMNS = (
+    "id", "title", "description", "frequency", "category", "custom_interval_days",
+    "user_id", "created_at", "updated_at", "is_active",
+)
+COMPLETION_COLUMNS = ("habit_id", "user_id", "completed_at", "notes", "client_id")
+STREAK_COLUMNS = (
+    "habit_id", "user_id", "current_streak", "longest_streak", "last_completion_date",
+    "last_period", "created_at", "updated_at",
+)
+ROLLUP_COLUMNS = ("user_id", "day", "habit_id", "completions", "updated_at")
+CALENDAR_COLUMNS = ("habit_id", "year", "user_id", "days", "updated_at")
+
+
+class Batch(NamedTuple):
+    users: List[tuple]
+    habits: List[tuple]
+    completions: List[tuple]
+    streaks: List[tuple]
+    rollups: List[tuple]
+    calendars: List[tuple]
+
+
+def _choose(rng: random.Random, weighted: tuple):
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights)[0]
+
+
+def _run_length(rng: random.Random, stop: float) -> int:
+    """Periods until an event of probability ``stop`` per period happens (at least 1)."""
+    if stop >= 1.0:
+        return 1
+    return 1 + int(math.log(1.0 - rng.random()) / math.log(1.0 - stop))
+
+
+def _period_days(period: int, frequency: HabitFrequency, interval: int) -> Tuple[int, int]:
+    """First local day (as an ordinal) and length in days of a ``streaks.period_index`` period."""
+    if frequency == HabitFrequency.WEEKLY:
+        return period * 7 + 1, 7
+    if frequency == HabitFrequency.MONTHLY:
+        year, month = divmod(period, 12)
+        first = date(year, month + 1, 1)
+        following = date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1)
+        return first.toordinal(), (following - first).days
+    if frequency == HabitFrequency.CUSTOM:
+        return max(period * interval, 1), interval
+    return period, 1
+
+
+def _local_time(rng: random.Random, ordinal: int, days: int, zone: ZoneInfo) -> datetime:
+    """A completion time within a period: morning or evening of one of its days."""
+    hour = rng.gauss(7.5, 1.2) if rng.random() < 0.65 else rng.gauss(20.0, 1.5)
+    seconds = int(min(max(hour, 0.0), 23.99) * 3600)
+    day = date.fromordinal(ordinal + rng.randrange(days))
+    local = datetime(day.year, day.month, day.day, tzinfo=zone) + timedelta(seconds=seconds)
+    return local.astimezone(timezone.utc)
+
+
+def _completions(
+    rng: random.Random,
+    start: datetime,
+    end: datetime,
+    frequency: HabitFrequency,
+    interval: int,
+    tz_name: str,
+    adherence: float
+) -> List[datetime]:
+    """Completion times of one habit between ``start`` and ``end``, in order."""
+    zone = ZoneInfo(tz_name)
+    first = streaks.period_index(start, frequency, tz_name, interval)
+    last = streaks.period_index(end, frequency, tz_name, interval)
+    keep = 0.55 + 0.44 * adherence
+    resume = 0.08 + 0.5 * adherence
+    times = []
+    period = first + int(rng.random() < 0.3)
+    while period <= last:
+        run = _run_length(rng, 1.0 - keep)
+        for current in range(period, min(period + run, last + 1)):
+            ordinal, days = _period_days(current, frequency, interval)
+            moment = _local_time(rng, ordinal, days, zone)
+            if start <= moment <= end:
+                times.append(moment)
+                if rng.random() < 0.04:
+                    extra = moment + timedelta(minutes=rng.randrange(5, 240))
+                    if extra <= end:
+                        times.append(extra)
+        period += run + _run_length(rng, resume)
+    # A second completion late in the evening can fall into the next period
+    times.sort()
+    return times
+
+
+def build_batch(
+    rng: random.Random,
+    user_ids: range,
+    habit_ids: range,
+    habits_per_user: List[int],
+    years: float,
+    prefix: str,
+    hashed_password: str,
+    now: datetime
+) -> Batch:
+    batch = Batch([], [], [], [], [], [])
+    span = timedelta(days=365.25 * years)
+    habit_id = iter(habit_ids)
+    for user_id, habit_count in zip(user_ids, habits_per_user):
+        # More recent sign-ups than old ones, as in a growing app
+        created_at = now - span * (1.0 - math.sqrt(rng.random()))
+        tz_name = _choose(rng, TIMEZONES)
+        churned = rng.random() < 0.35
+        active_until = min(created_at + timedelta(days=rng.expovariate(1 / 120)), now) if churned else now
+        adherence = rng.betavariate(2.5, 1.5)
+        oauth = rng.random() < 0.08
+        name = f"{prefix}_{user_id}"
+        batch.users.append((
+            user_id, f"{name}@example.com", name, None if oauth else hashed_password, True, 0,
+            created_at, None, "google" if oauth else None, str(10 ** 20 + user_id) if oauth else None,
+            f"https://example.com/avatars/{user_id}.png" if oauth else None, tz_name,
+        ))
+
+        rollup = Counter()
+        for _ in range(habit_count):
+            id_ = next(habit_id)
+            category = _choose(rng, CATEGORIES)
+            frequency = _choose(rng, FREQUENCIES)
+            interval = rng.randint(2, 4) if frequency == HabitFrequency.CUSTOM else None
+            habit_created = min(created_at + timedelta(days=rng.expovariate(1 / 30)), active_until)
+            abandoned = rng.random() < 0.2
+            habit_end = active_until
+            if abandoned:
+                habit_end = min(habit_end, habit_created + timedelta(days=rng.expovariate(1 / 60)))
+            batch.habits.append((
+                id_, rng.choice(TITLES[category]), None, frequency.name, category.name, interval,
+                user_id, habit_created, habit_end if abandoned else None, not abandoned,
+            ))
+
+            times = _completions(
+                rng, habit_created, habit_end, frequency, interval,
+                tz_name, min(max(adherence + rng.gauss(0, 0.1), 0.0), 1.0)
+            )
+            if not times:
+                continue
+            periods = []
+            for moment in times:
+                periods.append(streaks.period_index(moment, frequency, tz_name, interval))
+                rollup[(streaks.local_date(moment, tz_name), id_)] += 1
+                batch.completions.append((
+                    id_, user_id, moment,
+                    rng.choice(NOTES) if rng.random() < 0.08 else None,
+                    str(uuid.UUID(int=rng.getrandbits(128), version=4)) if rng.random() < 0.25 else None,
+                ))
+            current, longest, last_period = streaks.fold(periods)
+            batch.streaks.append((id_, user_id, current, longest, times[-1], last_period, times[0], times[-1]))
+        batch.rollups.extend(
+            (user_id, day, id_, count, now) for (day, id_), count in sorted(rollup.items())
+        )
+        calendar: Dict[Tuple[int, int], Set[int]] = {}
+        for day, id_ in rollup:
+            calendar.setdefault((id_, day.year), set()).add(calendars.day_index(day))
+        batch.calendars.extend(
+            (id_, year, user_id, BitString(calendars.bit_string(indexes)), now)
+            for (id_, year), indexes in sorted(calendar.items())
+        )
+    return batch
+
+
+async def reserve_ids(connection, table: str, count: int) -> range:
+    """Take ``count`` consecutive ids from the table's sequence."""
+    last = (await connection.execute(text(
+        "SELECT setval(pg_get_serial_sequence(:table, 'id'), nextval(pg_get_serial_sequence(:table, 'id')) + :count - 1)"
+    ), {"table": table, "count": count})).scalar()
+    return range(last - count + 1, last + 1)
+
+
+async def copy_batch(connection, batch: Batch) -> None:
+    raw = (await connection.get_raw_connection()).driver_connection
+    for table, columns, records in (
+        ("users", USER_COLUMNS, batch.users),
+        ("habits", HABIT_COLUMNS, batch.habits),
+        ("habit_completions", COMPLETION_COLUMNS, batch.completions),
+        ("streaks", STREAK_COLUMNS, batch.streaks),
+        ("completion_daily_rollup", ROLLUP_COLUMNS, batch.rollups),
+        ("completion_calendar", CALENDAR_COLUMNS, batch.calendars),
+    ):
+        if records:
+            await raw.copy_records_to_table(table, records=records, columns=columns)
+
+
+async def generate(args) -> None:
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    hashed_password = await auth.get_password_hash(PASSWORD)
+
+    async with async_engine.begin() as connection:
+        # A partitioned habit_completions needs partitions back to the oldest completion
+        oldest = (now - timedelta(days=365.25 * args.years)).date()
+        await connection.run_sync(lambda sync: partitions.ensure_completion_partitions(sync, start=oldest))
+
+    totals = Counter()
+    started = time.perf_counter()
+    remaining = args.users
+    while remaining > 0:
+        size = min(args.batch_size, remaining)
+        habit_counts = [
+            min(1 + int(rng.expovariate(1 / max(args.habits_per_user - 1, 0.1))), int(args.habits_per_user * 10))
+            for _ in range(size)
+        ]
+        async with async_engine.begin() as connection:
+            user_ids = await reserve_ids(connection, "users", size)
+            habit_ids = await reserve_ids(connection, "habits", sum(habit_counts))
+            batch = build_batch(
+                rng, user_ids, habit_ids, habit_counts, args.years, args.prefix, hashed_password, now
+            )
+            await copy_batch(connection, batch)
+        for table, rows in batch._asdict().items():
+            totals[table] += len(rows)
+        remaining -= size
+        elapsed = time.perf_counter() - started
+        print(
+            f"  {totals['users']:>9,} users  {totals['habits']:>10,} habits  "
+            f"{totals['completions']:>12,} completions  ({totals['completions'] / elapsed:,.0f} completions/s)"
+        )
+
+    print("Analyzing tables...")
+    async with async_engine.begin() as connection:
+        for table in (
+            "users", "habits", "habit_completions", "streaks", "completion_daily_rollup", "completion_calendar"
+        ):
+            await connection.execute(text(f"ANALYZE {table}"))
+    summary = ", ".join(f"{rows:,} {table}" for table, rows in totals.items())
+    print(f"Loaded {summary} in {time.perf_counter() - started:.1f} s")
+
+
+async def remove(prefix: str) -> int:
+    """Delete the generated users and everything that belongs to them."""
+    async with AsyncSessionLocal() as db:
+        user_ids = select(models.User.id).where(models.User.username.startswith(f"{prefix}_", autoescape=True))
+        badge_ids = select(models.Badge.id).where(models.Badge.user_id.in_(user_ids))
+        await db.execute(delete(models.user_badges).where(
+            models.user_badges.c.user_id.in_(user_ids) | models.user_badges.c.badge_id.in_(badge_ids)
+        ))
+        await db.execute(delete(models.user_habits).where(models.user_habits.c.user_id.in_(user_ids)))
+        for model in (
+            models.CompletionCalendar, models.CompletionDailyRollup, models.Streak, models.HabitCompletion, models.PointsLedger,
+            models.UserCounter, models.Badge, models.Reward, models.HabitMetrics, models.UserMetrics, models.Habit,
+        ):
+            await db.execute(delete(model).where(model.user_id.in_(user_ids)))
+        result = await db.execute(delete(models.User).where(models.User.id.in_(user_ids)))
+        await db.commit()
+        return result.rowcount
+
+
+async def main(args) -> None:
+    try:
+        if args.remove:
+            print(f"Removed {await remove(args.prefix):,} users")
+        else:
+            await generate(args)
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--habits-per-user", type=float, default=4.0, help="mean habits per user")
+    parser.add_argument("--years", type=float, default=3.0, help="length of the history")
+    parser.add_argument("--batch-size", type=int, default=500, help="users per COPY transaction")
+    parser.add_argument("--prefix", default="synthetic", help="username prefix of generated users")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--remove", action="store_true", help="delete the users with --prefix instead")
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,143 @@
+"""
+Concurrency stress test for reward claiming.
+
+Creates a throwaway user with ``--balance`` points and fires hundreds of
+parallel claims at ``rewards.claim_reward``:
+
+1. ``--taps`` simultaneous claims of one reward (a double-tapping client)
+2. ``--claims`` simultaneous claims spread over ``--rewards`` rewards whose
+   total cost exceeds the remaining balance
+
+It then checks that no reward was claimed twice, the balance never went
+negative, every point spent belongs to a claimed reward, and the balance
+still equals the user's ledger sum. Exits non-zero on any violation.
+
+    python -m benchmarks.stress_reward_claims
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from database import AsyncSessionLocal, async_engine
+import models
+import points
+import rewards
+
+
+async def create_user(balance: int) -> models.User:
+    async with AsyncSessionLocal() as db:
+        name = f"stress_{uuid.uuid4().hex[:12]}"
+        user = models.User(email=f"{name}@example.com", username=name, is_active=True, points=0)
+        db.add(user)
+        await db.flush()
+        await points.award_points(db, user.id, balance, reason="stress_seed")
+        await db.commit()
+        await db.refresh(user)
+        db.expunge(user)
+        return user
+
+
+async def create_rewards(user: models.User, count: int, cost: int) -> list:
+    async with AsyncSessionLocal() as db:
+        created = [
+            models.Reward(title=f"Stress reward {n}", points_required=cost, user_id=user.id, is_claimed=False)
+            for n in range(count)
+        ]
+        db.add_all(created)
+        await db.commit()
+        return [reward.id for reward in created]
+
+
+async def claim(user: models.User, reward_id: int, start: asyncio.Event) -> str:
+    await start.wait()
+    async with AsyncSessionLocal() as db:
+        try:
+            await rewards.claim_reward(db, user, reward_id)
+            return "claimed"
+        except HTTPException as e:
+            return e.detail
+
+
+async def burst(user: models.User, reward_ids: list) -> Counter:
+    """Start every claim at the same moment and tally the outcomes."""
+    start = asyncio.Event()
+    tasks = [asyncio.create_task(claim(user, reward_id, start)) for reward_id in reward_ids]
+    await asyncio.sleep(0.1)
+    began = time.perf_counter()
+    start.set()
+    outcomes = Counter(await asyncio.gather(*tasks))
+    print(f"  {len(reward_ids)} claims in {time.perf_counter() - began:.2f} s: {dict(outcomes)}")
+    return outcomes
+
+
+async def verify(user: models.User, balance: int) -> list:
+    async with AsyncSessionLocal() as db:
+        current = (await db.execute(select(models.User.points).where(models.User.id == user.id))).scalar()
+        ledger = (await db.execute(
+            select(func.coalesce(func.sum(models.PointsLedger.delta), 0))
+            .where(models.PointsLedger.user_id == user.id)
+        )).scalar()
+        claimed_cost = (await db.execute(
+            select(func.coalesce(func.sum(models.Reward.points_required), 0))
+            .where(models.Reward.user_id == user.id, models.Reward.is_claimed.is_(True))
+        )).scalar()
+        spends = (await db.execute(
+            select(func.count()).select_from(models.PointsLedger)
+            .where(models.PointsLedger.user_id == user.id, models.PointsLedger.reason == "reward_claim")
+        )).scalar()
+        claimed = (await db.execute(
+            select(func.count()).select_from(models.Reward)
+            .where(models.Reward.user_id == user.id, models.Reward.is_claimed.is_(True))
+        )).scalar()
+
+    failures = []
+    if current < 0:
+        failures.append(f"balance went negative: {current}")
+    if current != ledger:
+        failures.append(f"balance {current} does not match ledger sum {ledger}")
+    if balance - claimed_cost != current:
+        failures.append(f"spent {balance - current} points but claimed rewards cost {claimed_cost}")
+    if spends != claimed:
+        failures.append(f"{spends} reward payments for {claimed} claimed rewards")
+    print(f"  balance {current}, {claimed} rewards claimed for {claimed_cost} points")
+    return failures
+
+
+async def run(balance: int, taps: int, claims: int, reward_count: int, cost: int) -> int:
+    user = await create_user(balance)
+    print(f"User {user.id} starts with {balance} points")
+
+    print(f"Double tap: {taps} claims of one reward")
+    single = await create_rewards(user, 1, cost)
+    outcomes = await burst(user, single * taps)
+    failures = []
+    if outcomes["claimed"] != 1:
+        failures.append(f"one reward was claimed {outcomes['claimed']} times")
+
+    print(f"Overspend: {claims} claims over {reward_count} rewards costing {cost * reward_count} in total")
+    reward_ids = await create_rewards(user, reward_count, cost)
+    await burst(user, [random.choice(reward_ids) for _ in range(claims)])
+
+    failures += await verify(user, balance)
+    await points.wait_for_publishing()
+    await async_engine.dispose()
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print("PASS" if not failures else f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--balance", type=int, default=1000)
+    parser.add_argument("--taps", type=int, default=200)
+    parser.add_argument("--claims", type=int, default=500)
+    parser.add_argument("--rewards", type=int, default=50)
+    parser.add_argument("--cost", type=int, default=100)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.balance, args.taps, args.claims, args.rewards, args.cost)))
@@ -0,0 +1,216 @@
+"""
+Completion calendars: one bit per local day per habit per year.
+
+``completion_calendar`` holds a ``BIT(366)`` string per (habit, year) whose
+bit ``n`` (counted from the left) is set when the habit was completed on
+day ``n`` of that year in the user's timezone, January 1st being day 0.
+Every completion write ORs its days in within the same transaction, like
+the daily rollup. A year heatmap is then one 46-byte row, "done on day X?"
+one ``get_bit`` and a completion rate a popcount, whatever the number of
+completions. ``rebuild_calendar`` recomputes years from raw completions:
+
+    python calendars.py --start-year 2025 --end-year 2026
+"""
+from base64 import b64encode
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, Optional, Set, Tuple
+from sqlalchemy import Date, Integer, Text, cast, delete, extract, func, literal, select
+from sqlalchemy.dialects.postgresql import BIT, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import CompletionCalendar, HabitCompletion, User
+from streaks import local_date
+import logging
+
+logger = logging.getLogger(__name__)
+
+YEAR_BITS = 366
+# Bytes of a packed year bitmap; the last two bits are always zero
+YEAR_BYTES = (YEAR_BITS + 7) // 8
+EMPTY_YEAR = "0" * YEAR_BITS
+
+
+def day_index(day: date) -> int:
+    """Position of ``day`` in its year's bitmap."""
+    return day.timetuple().tm_yday - 1
+
+
+def days_in_year(year: int) -> int:
+    return (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+
+def bit_string(indexes: Iterable[int]) -> str:
+    """A year's bit string ('0101...') with the given day indexes set."""
+    bits = bytearray(EMPTY_YEAR.encode())
+    for index in indexes:
+        bits[index] = ord("1")
+    return bits.decode()
+
+
+def _bits(value: str):
+    """Bind a '0101...' string as a bit string; drivers disagree on the native type."""
+    return cast(literal(value, Text), BIT(YEAR_BITS))
+
+
+def pack(bits: Optional[str]) -> bytes:
+    """Pack a bit string, first day in the most significant bit of the first byte."""
+    if not bits:
+        return bytes(YEAR_BYTES)
+    return int(bits.ljust(YEAR_BYTES * 8, "0"), 2).to_bytes(YEAR_BYTES, "big")
+
+
+async def record_completions(
+    db: AsyncSession,
+    user: User,
+    completions: Iterable[Tuple[int, datetime]]
+) -> None:
+    """
+    Set the calendar bits of ``(habit_id, completed_at)`` pairs.
+
+    One multi-row upsert ORs each (habit, year) mask into the stored row;
+    rows are written in key order so concurrent writers lock them in the
+    same order.
+    """
+    days: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+    for habit_id, completed_at in completions:
+        day = local_date(completed_at, user.timezone)
+        days[(habit_id, day.year)].add(day_index(day))
+    if not days:
+        return
+    rows = [
+        {"habit_id": habit_id, "year": year, "user_id": user.id, "days": _bits(bit_string(indexes))}
+        for (habit_id, year), indexes in sorted(days.items())
+    ]
+    stmt = insert(CompletionCalendar).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CompletionCalendar.habit_id, CompletionCalendar.year],
+        set_={"days": CompletionCalendar.days.op("|")(stmt.excluded.days), "updated_at": func.now()}
+    )
+    await db.execute(stmt)
+
+
+async def habit_year(db: AsyncSession, habit_id: int, year: int) -> Optional[str]:
+    """The habit's bit string for ``year``, or None if it has no completions that year."""
+    result = await db.execute(
+        select(cast(CompletionCalendar.days, Text)).where(
+            CompletionCalendar.habit_id == habit_id,
+            CompletionCalendar.year == year
+        )
+    )
+    return result.scalar()
+
+
+async def user_year(db: AsyncSession, user_id: int, year: int) -> Optional[str]:
+    """Days of ``year`` on which the user completed any habit, as a bit string."""
+    result = await db.execute(
+        select(cast(func.bit_or(CompletionCalendar.days), Text)).where(
+            CompletionCalendar.user_id == user_id,
+            CompletionCalendar.year == year
+        )
+    )
+    return result.scalar()
+
+
+async def is_done(db: AsyncSession, habit_id: int, day: date) -> bool:
+    """Whether the habit was completed on local ``day``."""
+    result = await db.execute(
+        select(func.get_bit(CompletionCalendar.days, day_index(day))).where(
+            CompletionCalendar.habit_id == habit_id,
+            CompletionCalendar.year == day.year
+        )
+    )
+    return result.scalar() == 1
+
+
+def heatmap(bits: Optional[str], year: int, first_day: date, today: date) -> dict:
+    """
+    Response body for a year calendar.
+
+    ``completion_rate`` is the share of days with a completion between
+    ``first_day`` (e.g. when the habit was created) and ``today``, clipped
+    to the year.
+    """
+    start = max(first_day, date(year, 1, 1))
+    end = min(today, date(year, 12, 31))
+    elapsed = (end - start).days + 1
+    completed = bits.count("1") if bits else 0
+    return {
+        "year": year,
+        "days": days_in_year(year),
+        "bitmap": b64encode(pack(bits)).decode(),
+        "completed_days": completed,
+        "completion_rate": round(min(completed / elapsed, 1.0), 4) if elapsed > 0 else 0.0,
+    }
+
+
+def rebuild_calendar(
+    start_year: Optional[int] = None,
+    end_year: Optional[int] = None,
+    user_id: Optional[int] = None
+) -> int:
+    """
+    Recompute calendar rows for ``start_year``..``end_year`` from ``habit_completions``.
+
+    Open ends mean all history. Like ``rollups.rebuild_rollup`` the delete
+    and re-insert run in one transaction and overwrite rows written
+    meanwhile, so it is safe while serving traffic. Returns the number of
+    rows written.
+    """
+    from database import engine
+
+    local_day = cast(func.timezone(User.timezone, HabitCompletion.completed_at), Date)
+    year = cast(extract("year", local_day), Integer)
+    day_bit = func.set_bit(_bits(EMPTY_YEAR), cast(extract("doy", local_day), Integer) - 1, 1)
+    source = (
+        select(HabitCompletion.habit_id, year.label("year"), HabitCompletion.user_id, func.bit_or(day_bit))
+        .join(User, User.id == HabitCompletion.user_id)
+        .group_by(HabitCompletion.habit_id, year, HabitCompletion.user_id)
+    )
+    stale = delete(CompletionCalendar)
+
+    # Padded bounds on completed_at keep the scan on the index, as in rebuild_rollup
+    if start_year is not None:
+        source = source.where(
+            HabitCompletion.completed_at >= datetime(start_year - 1, 12, 31, tzinfo=timezone.utc),
+            year >= start_year
+        )
+        stale = stale.where(CompletionCalendar.year >= start_year)
+    if end_year is not None:
+        source = source.where(
+            HabitCompletion.completed_at < datetime(end_year + 1, 1, 2, tzinfo=timezone.utc),
+            year <= end_year
+        )
+        stale = stale.where(CompletionCalendar.year <= end_year)
+    if user_id is not None:
+        source = source.where(HabitCompletion.user_id == user_id)
+        stale = stale.where(CompletionCalendar.user_id == user_id)
+
+    stmt = insert(CompletionCalendar).from_select(["habit_id", "year", "user_id", "days"], source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CompletionCalendar.habit_id, CompletionCalendar.year],
+        set_={"days": stmt.excluded.days, "updated_at": func.now()}
+    )
+
+    with engine.begin() as connection:
+        connection.execute(stale)
+        written = connection.execute(stmt).rowcount
+
+    logger.info(f"Rebuilt {written} calendar rows for {start_year or 'beginning'}..{end_year or 'now'}")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(description="Rebuild completion_calendar from raw completions")
+    parser.add_argument("--start-year", type=int, help="First local year (default: all history)")
+    parser.add_argument("--end-year", type=int, help="Last local year (default: all history)")
+    parser.add_argument("--user-id", type=int)
+    args = parser.parse_args()
+    print("Rebuilding completion calendars...")
+    rebuild_calendar(args.start_year, args.end_year, args.user_id)
+    print("Calendars rebuilt successfully!")
@@ -0,0 +1,116 @@
+import threading
+import time
+from typing import Dict
+import metrics
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker guarding calls to a remote dependency.
+
+    The breaker counts consecutive failures, where a call slower than
+    ``slow_call_seconds`` also counts as a failure. After
+    ``failure_threshold`` of them it opens and callers should skip the
+    dependency. Once ``reset_timeout`` has passed it goes half-open and lets a
+    single probe call through: a success closes it again, a failure re-opens it.
+
+    Args:
+        name: Name used in metrics
+        failure_threshold: Consecutive failures (or slow calls) that open the breaker
+        slow_call_seconds: Latency above which a successful call counts as a failure
+        reset_timeout: Seconds to stay open before probing again
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    # Values of the circuit_breaker_state gauge
+    STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        slow_call_seconds: float = 0.1,
+        reset_timeout: float = 10.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.trips = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.short_circuited = 0
+        metrics.circuit_breaker_state.set_function(lambda: self.STATE_CODES[self.state], name)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        """Return True if the caller may use the dependency right now."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self, elapsed: float) -> None:
+        """Record a completed call and how long it took."""
+        if elapsed > self.slow_call_seconds:
+            with self._lock:
+                self.slow_calls += 1
+            self._record_failure()
+            return
+        with self._lock:
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            self._state = self.CLOSED
+
+    def record_failure(self) -> None:
+        """Record a call that raised."""
+        with self._lock:
+            self.failures += 1
+        self._record_failure()
+
+    def _record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            state = self._current_state(time.monotonic())
+            if state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if state != self.OPEN:
+                    self.trips += 1
+                    metrics.circuit_breaker_trips_total.inc(self.name)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def stats(self) -> Dict[str, object]:
+        """Snapshot of breaker state and counters."""
+        with self._lock:
+            return {
+                "name": self.name,
+                "state": self._current_state(time.monotonic()),
+                "consecutive_failures": self._consecutive_failures,
+                "trips": self.trips,
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+                "short_circuited": self.short_circuited,
+            }
@@ -0,0 +1,219 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import badges
+import calendars
+import models
+import points
+import rollups
+import schemas
+import streaks
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How far in the future a client clock may put a synced completion
+MAX_CLIENT_CLOCK_SKEW = timedelta(minutes=5)
+# First key of the per-user advisory lock taken by batch sync
+_SYNC_LOCK_NAMESPACE = 7_310_002
+
+
+async def get_owned_habit(db: AsyncSession, habit_id: int, user: models.User) -> models.Habit:
+    """Load an active habit belonging to ``user`` or raise 404."""
+    result = await db.execute(
+        select(models.Habit).where(
+            models.Habit.id == habit_id,
+            models.Habit.user_id == user.id,
+            models.Habit.is_active.is_(True)
+        )
+    )
+    habit = result.scalars().first()
+    if habit is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Habit not found"
+        )
+    return habit
+
+
+async def record_completion(
+    db: AsyncSession,
+    user: models.User,
+    habit: models.Habit,
+    notes: Optional[str] = None,
+    completed_at: Optional[datetime] = None
+) -> models.HabitCompletion:
+    """Record a completion and update the habit's streak, rollup and calendar in one transaction."""
+    completion = models.HabitCompletion(
+        habit_id=habit.id,
+        user_id=user.id,
+        notes=notes,
+        completed_at=completed_at or datetime.now(timezone.utc)
+    )
+    db.add(completion)
+    await db.flush()
+    streak, previous_streak = await streaks.record_completion_streak(db, habit, user, completion.completed_at)
+    await rollups.record_completions(db, user, [(habit.id, completion.completed_at)])
+    await calendars.record_completions(db, user, [(habit.id, completion.completed_at)])
+    await points.award_points(db, user.id, points.POINTS_PER_COMPLETION, habit.category)
+    await badges.dispatch(db, badges.BadgeEvent(
+        badges.COMPLETION_RECORDED, user.id,
+        increments={"completions": 1, badges.completion_counter(habit.category): 1}
+    ))
+    if previous_streak != streak.current_streak:
+        await badges.dispatch(db, badges.BadgeEvent(
+            badges.STREAK_CHANGED, user.id,
+            values={"current_streak": (previous_streak, streak.current_streak)}
+        ))
+    await db.commit()
+    logger.debug(f"Recorded completion {completion.id} for habit {habit.id}")
+    return completion
+
+
+async def _stored_client_ids(db: AsyncSession, user: models.User, client_ids: set) -> Dict[str, int]:
+    """Map the given client ids already stored for ``user`` to completion ids."""
+    result = await db.execute(
+        select(models.HabitCompletion.client_id, models.HabitCompletion.id).where(
+            models.HabitCompletion.user_id == user.id,
+            models.HabitCompletion.client_id.in_(client_ids)
+        )
+    )
+    return dict(result.all())
+
+
+async def record_completion_batch(
+    db: AsyncSession,
+    user: models.User,
+    items: List[schemas.HabitCompletionSyncItem]
+) -> schemas.HabitCompletionBatchResult:
+    """
+    Ingest a batch of completions uploaded by an offline client.
+
+    Items are validated together, client ids already stored are looked up
+    in one query, the rest are written with one multi-row INSERT, and the
+    affected streaks, rollups, calendars, points and badges are updated once for the whole batch.
+    Everything commits in one transaction.
+
+    Uploads from the same user are serialized with a transaction-level
+    advisory lock taken before the client id lookup. On a partitioned table
+    the unique client id index must include ``completed_at``, so without the
+    lock two uploads of one client id with different times could both insert.
+    """
+    results: Dict[int, schemas.HabitCompletionSyncResult] = {}
+    seen_client_ids = set()
+    now = datetime.now(timezone.utc)
+
+    habit_ids = {item.habit_id for item in items}
+    habit_rows = await db.execute(
+        select(models.Habit).where(
+            models.Habit.id.in_(habit_ids),
+            models.Habit.user_id == user.id,
+            models.Habit.is_active.is_(True)
+        )
+    )
+    habits = {habit.id: habit for habit in habit_rows.scalars()}
+    await db.execute(select(func.pg_advisory_xact_lock(_SYNC_LOCK_NAMESPACE, user.id)))
+    already_stored = await _stored_client_ids(db, user, {item.client_id for item in items})
+
+    rows = []
+    for position, item in enumerate(items):
+        completed_at = item.completed_at
+        if completed_at.tzinfo is None:
+            completed_at = completed_at.replace(tzinfo=timezone.utc)
+        if item.client_id in seen_client_ids:
+            results[position] = schemas.HabitCompletionSyncResult(
+                client_id=item.client_id, status="duplicate", detail="Repeated in this batch"
+            )
+            continue
+        seen_client_ids.add(item.client_id)
+        if item.client_id in already_stored:
+            results[position] = schemas.HabitCompletionSyncResult(
+                client_id=item.client_id, status="duplicate", id=already_stored[item.client_id]
+            )
+            continue
+        if item.habit_id not in habits:
+            results[position] = schemas.HabitCompletionSyncResult(
+                client_id=item.client_id, status="rejected", detail="Habit not found"
+            )
+            continue
+        if completed_at > now + MAX_CLIENT_CLOCK_SKEW:
+            results[position] = schemas.HabitCompletionSyncResult(
+                client_id=item.client_id, status="rejected", detail="Completion is in the future"
+            )
+            continue
+        rows.append((position, {
+            "habit_id": item.habit_id,
+            "user_id": user.id,
+            "completed_at": completed_at,
+            "notes": item.notes,
+            "client_id": item.client_id,
+        }))
+
+    created: Dict[str, int] = {}
+    if rows:
+        inserted = await db.execute(
+            insert(models.HabitCompletion)
+            .values([row for _, row in rows])
+            # No conflict target: the client id index differs between plain
+            # and partitioned tables
+            .on_conflict_do_nothing()
+            .returning(models.HabitCompletion.id, models.HabitCompletion.client_id)
+        )
+        created = {client_id: completion_id for completion_id, client_id in inserted.all()}
+
+    # Rows skipped by ON CONFLICT were stored by a concurrent upload
+    missing = {row["client_id"] for _, row in rows if row["client_id"] not in created}
+    if missing:
+        already_stored.update(await _stored_client_ids(db, user, missing))
+
+    completions_by_habit = {}
+    for position, row in rows:
+        client_id = row["client_id"]
+        if client_id in created:
+            results[position] = schemas.HabitCompletionSyncResult(
+                client_id=client_id, status="created", id=created[client_id]
+            )
+            habit = habits[row["habit_id"]]
+            completions_by_habit.setdefault(habit.id, (habit, []))[1].append(row["completed_at"])
+        else:
+            results[position] = schemas.HabitCompletionSyncResult(
+                client_id=client_id, status="duplicate", id=already_stored.get(client_id)
+            )
+
+    streak_changes = await streaks.record_batch_streaks(db, user, completions_by_habit)
+    created_completions = [
+        (habit_id, completed_at)
+        for habit_id, (_, moments) in completions_by_habit.items()
+        for completed_at in moments
+    ]
+    await rollups.record_completions(db, user, created_completions)
+    await calendars.record_completions(db, user, created_completions)
+    # One award per habit category so category leaderboards stay accurate
+    created_by_category: Dict[models.HabitCategory, int] = {}
+    for habit, moments in completions_by_habit.values():
+        created_by_category[habit.category] = created_by_category.get(habit.category, 0) + len(moments)
+    for category, count in created_by_category.items():
+        await points.award_points(db, user.id, points.POINTS_PER_COMPLETION * count, category)
+
+    increments = {badges.completion_counter(category): count for category, count in created_by_category.items()}
+    increments["completions"] = len(created)
+    await badges.dispatch(db, badges.BadgeEvent(badges.COMPLETION_RECORDED, user.id, increments=increments))
+    for previous, current in streak_changes.values():
+        if previous == current:
+            continue
+        await badges.dispatch(db, badges.BadgeEvent(
+            badges.STREAK_CHANGED, user.id, values={"current_streak": (previous, current)}
+        ))
+    await db.commit()
+
+    ordered = [results[position] for position in range(len(items))]
+    logger.info(f"Synced {len(created)} of {len(items)} completions for user {user.id}")
+    return schemas.HabitCompletionBatchResult(
+        results=ordered,
+        created=len(created),
+        duplicates=sum(1 for result in ordered if result.status == "duplicate"),
+        rejected=sum(1 for result in ordered if result.status == "rejected")
+    )
@@ -0,0 +1,139 @@
+"""
+Response compression negotiated from ``Accept-Encoding``.
+
+Bodies of at least ``COMPRESSION_MIN_SIZE`` bytes with a compressible
+content type are compressed with zstd when the client accepts it and the
+``zstandard`` package is installed, otherwise with gzip. Smaller bodies go
+out as they are, since compressing them costs more CPU than it saves on
+the wire. Streaming responses (sent in several body messages) pass
+through untouched.
+
+Settings (environment):
+
+- ``COMPRESSION_MIN_SIZE``: smallest body compressed, in bytes (default 1024)
+- ``COMPRESSION_GZIP_LEVEL``: gzip level (default 5)
+- ``COMPRESSION_ZSTD_LEVEL``: zstd level (default 3)
+"""
+from typing import Dict, Optional
+import gzip
+import os
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip only without it
+    zstandard = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Map each coding in an ``Accept-Encoding`` header to its quality."""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(header: str, zstd_available: bool = zstandard is not None) -> Optional[str]:
+    """Best coding we support for ``header``: zstd, then gzip, or None."""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["zstd"] if zstd_available else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing single-message responses (see module docstring).
+
+    Args:
+        app: Application to wrap
+        minimum_size: Smallest body compressed, in bytes
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"accept-encoding"), "")
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            headers = {name.lower(): value for name, value in start_message.get("headers", [])}
+            content_type = headers.get(b"content-type", b"").decode("latin-1")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or b"content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            raw_headers = [
+                (name, value) for name, value in start_message.get("headers", [])
+                if name.lower() not in (b"content-length", b"vary")
+            ]
+            vary = headers.get(b"vary")
+            raw_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            passthrough = True
+            await send({**start_message, "headers": raw_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,95 @@
+"""
+Conditional GET.
+
+Read endpoints derive an ETag and a ``Last-Modified`` time from version
+data the rows already carry (ids, counts and ``updated_at``, falling back to
+``created_at`` for rows never updated) and answer ``If-None-Match`` or
+``If-Modified-Since`` with an empty 304 when nothing changed. The check
+runs before the body is loaded or serialized, so a client polling an
+unchanged resource costs one cheap version lookup at most:
+
+    etag = conditional.etag_for(schemas.User, user.id, last_modified)
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified(etag, last_modified)
+
+ETags are weak: the same representation may be sent gzip or zstd encoded
+(see ``compression``), which a strong ETag would have to tell apart. They
+include a digest of the response schema, so changing a schema invalidates
+what clients hold. ``If-None-Match`` takes precedence over
+``If-Modified-Since``, whose one-second resolution can miss two changes
+within the same second.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Any, Dict, Optional, Type
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response
+import json
+
+# Clients must revalidate every time; bodies are per user
+CACHE_CONTROL = "private, no-cache"
+
+
+@lru_cache(maxsize=None)
+def _schema_digest(schema: Type[BaseModel]) -> str:
+    return blake2b(json.dumps(schema.model_json_schema(), sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def etag_for(schema: Type[BaseModel], *version: Any) -> str:
+    """Weak ETag for a representation of ``schema`` at ``version``."""
+    key = repr((_schema_digest(schema), version))
+    return f'W/"{blake2b(key.encode(), digest_size=12).hexdigest()}"'
+
+
+def http_date(moment: datetime) -> str:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return format_datetime(moment.astimezone(timezone.utc), usegmt=True)
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of ``etag`` with an ``If-None-Match`` header."""
+    if header.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(tag) == wanted for tag in header.split(","))
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """Whether the client's copy, per its conditional headers, is still current."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    """Headers to send with a full response so the client can revalidate it later."""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """Empty 304 response carrying the current validators."""
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
@@ -1,7 +1,12 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import metrics
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -10,22 +15,72 @@ load_dotenv()
 # Get database URL from environment variable or use default
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# Connection pool settings (per worker process)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Prepared statements cached per connection; set to 0 behind PgBouncer in
+# transaction pooling mode, which cannot keep prepared statements.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+def get_async_database_url(url: str) -> URL:
+    """Map a plain PostgreSQL URL onto the asyncpg driver."""
+    async_url = make_url(url)
+    if async_url.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        async_url = async_url.set(drivername="postgresql+asyncpg")
+    return async_url
+
+class TimedAsyncPool(AsyncAdaptedQueuePool):
+    """Async queue pool that records how long each checkout takes."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_acquire_seconds.observe(time.perf_counter() - start)
+
+# Synchronous engine, used by scripts and migrations only
+engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine used by the API
+async_engine = create_async_engine(
+    get_async_database_url(DATABASE_URL),
+    poolclass=TimedAsyncPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    },
+)
+
+metrics.db_pool_size.set_function(lambda: async_engine.pool.size())
+metrics.db_pool_checked_out.set_function(lambda: async_engine.pool.checkedout())
+metrics.db_pool_overflow.set_function(lambda: max(async_engine.pool.overflow(), 0))
+
+# Objects stay usable after commit without another round trip
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 # Create Base class
 Base = declarative_base()
 
 # Dependency to get DB session
-def get_db():
+async def get_db():
     """
-    Dependency function that yields database sessions.
+    Dependency function that yields async database sessions.
     """
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class HashingPoolFull(Exception):
+    """Raised when the hashing pool already has too much work queued."""
+
+
+class HashingPool:
+    """
+    Bounded thread pool for CPU-heavy password hashing.
+
+    bcrypt releases the GIL while it works, so running it on a small pool of
+    threads keeps the event loop free to serve other requests. Work beyond
+    ``max_pending`` is rejected instead of queued so a login burst cannot
+    build an unbounded backlog.
+
+    Args:
+        max_workers: Number of threads hashing concurrently
+        max_pending: Maximum number of jobs queued or running at once
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="password-hash"
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+
+    def _timed(self, func: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._busy_seconds += elapsed
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run ``func(*args)`` on the pool and wait for the result.
+
+        Raises:
+            HashingPoolFull: If ``max_pending`` jobs are already queued or running
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HashingPoolFull()
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> Dict[str, float]:
+        """Snapshot of pool utilisation for metrics and debugging."""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "queue_depth": self._pending - self._in_flight,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "busy_seconds": self._busy_seconds,
+            }
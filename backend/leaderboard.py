@@ -0,0 +1,209 @@
+"""
+Points leaderboards in Redis sorted sets.
+
+Postgres stays the source of truth for ``User.points``; Redis mirrors it
+so ranking is O(log n) instead of sorting the users table. There are three
+kinds of board:
+
+- ``global``: every user's total points
+- ``weekly``: points earned in the current ISO week (UTC); old weeks expire
+- ``category:<name>``: points earned from habits of one ``HabitCategory``
+
+Boards are updated with ZINCRBY after the awarding transaction commits
+(see points.py), so they never show points that were rolled back. If an
+update is lost, e.g. while Redis is down, ``rebuild_leaderboards``
+resyncs every board from the points ledger:
+
+    python leaderboard.py
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, select
+from models import HabitCategory, PointsLedger, User
+import redis_config
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_KEY_PREFIX = os.getenv("LEADERBOARD_KEY_PREFIX", "leaderboard")
+# Weekly boards are kept for a few weeks after they close
+LEADERBOARD_WEEKLY_TTL_DAYS = int(os.getenv("LEADERBOARD_WEEKLY_TTL_DAYS", "35"))
+
+# (board, user_id, delta)
+ScoreUpdate = Tuple[str, int, int]
+
+
+def weekly_board(moment: Optional[datetime] = None) -> str:
+    """Name of the weekly board covering ``moment`` (default: now)."""
+    year, week, _ = (moment or datetime.now(timezone.utc)).isocalendar()
+    return f"weekly:{year}-W{week:02d}"
+
+
+def category_board(category: HabitCategory) -> str:
+    return f"category:{HabitCategory(category).value}"
+
+
+def resolve_board(board: str, category: Optional[HabitCategory] = None) -> str:
+    """Map the public board names (global, weekly, category) to a board."""
+    if board == "weekly":
+        return weekly_board()
+    if board == "category":
+        if category is None:
+            raise ValueError("category is required for the category board")
+        return category_board(category)
+    return "global"
+
+
+def _key(board: str) -> str:
+    return f"{LEADERBOARD_KEY_PREFIX}:{board}"
+
+
+def boards_for_award(delta: int, category: Optional[HabitCategory] = None) -> List[str]:
+    """Boards an award of ``delta`` points counts towards."""
+    boards = ["global"]
+    if delta > 0:
+        # Spending points lowers the total but not what was earned this week
+        boards.append(weekly_board())
+        if category is not None:
+            boards.append(category_board(category))
+    return boards
+
+
+async def apply_updates(updates: Iterable[ScoreUpdate], chunk_size: int = 10000) -> None:
+    """Apply score deltas to their boards, one pipeline round trip per chunk."""
+    updates = list(updates)
+    client = redis_config.get_redis_client()
+    for offset in range(0, len(updates), chunk_size):
+        pipe = client.pipeline(transaction=False)
+        weekly_boards = set()
+        for board, user_id, delta in updates[offset:offset + chunk_size]:
+            pipe.zincrby(_key(board), delta, user_id)
+            if board.startswith("weekly:"):
+                weekly_boards.add(board)
+        for board in weekly_boards:
+            pipe.expire(_key(board), timedelta(days=LEADERBOARD_WEEKLY_TTL_DAYS))
+        await pipe.execute()
+
+
+def _entries(members: List[Tuple[str, float]], first_rank: int) -> List[dict]:
+    return [
+        {"rank": first_rank + offset, "user_id": int(member), "score": int(score)}
+        for offset, (member, score) in enumerate(members)
+    ]
+
+
+async def top(board: str, limit: int = 10) -> List[dict]:
+    """The ``limit`` highest scores, rank 1 first."""
+    members = await redis_config.get_redis_client().zrevrange(_key(board), 0, limit - 1, withscores=True)
+    return _entries(members, 1)
+
+
+async def rank(board: str, user_id: int) -> Optional[dict]:
+    """A user's 1-based rank and score, or None if they are not on the board."""
+    client = redis_config.get_redis_client()
+    pipe = client.pipeline(transaction=False)
+    pipe.zrevrank(_key(board), user_id)
+    pipe.zscore(_key(board), user_id)
+    position, score = await pipe.execute()
+    if position is None:
+        return None
+    return {"rank": position + 1, "user_id": user_id, "score": int(score)}
+
+
+async def around(board: str, user_id: int, radius: int = 5) -> List[dict]:
+    """Up to ``radius`` users either side of ``user_id``, including them."""
+    client = redis_config.get_redis_client()
+    position = await client.zrevrank(_key(board), user_id)
+    if position is None:
+        return []
+    start = max(position - radius, 0)
+    members = await client.zrevrange(_key(board), start, position + radius, withscores=True)
+    return _entries(members, start + 1)
+
+
+async def attach_usernames(db, entries: List[dict]) -> List[dict]:
+    """Add ``username`` to leaderboard entries with one primary-key lookup."""
+    if not entries:
+        return entries
+    result = await db.execute(
+        select(User.id, User.username).where(User.id.in_([entry["user_id"] for entry in entries]))
+    )
+    names = dict(result.all())
+    for entry in entries:
+        entry["username"] = names.get(entry["user_id"])
+    return entries
+
+
+def _board_scores(connection) -> Dict[str, Dict[str, int]]:
+    """Recompute every board's scores from Postgres."""
+    scores: Dict[str, Dict[str, int]] = {"global": {}}
+    for user_id, total in connection.execute(
+        select(User.id, User.points).where(User.points > 0)
+    ):
+        scores["global"][str(user_id)] = total
+
+    # Weekly and category boards only count points earned, not spent
+    earned = PointsLedger.delta > 0
+    now = datetime.now(timezone.utc)
+    week_start = datetime.combine(
+        now.date() - timedelta(days=now.weekday()), datetime.min.time(), tzinfo=timezone.utc
+    )
+    weekly = scores.setdefault(weekly_board(now), {})
+    for user_id, total in connection.execute(
+        select(PointsLedger.user_id, func.sum(PointsLedger.delta))
+        .where(earned, PointsLedger.created_at >= week_start)
+        .group_by(PointsLedger.user_id)
+    ):
+        weekly[str(user_id)] = total
+
+    for user_id, category, total in connection.execute(
+        select(PointsLedger.user_id, PointsLedger.category, func.sum(PointsLedger.delta))
+        .where(earned, PointsLedger.category.is_not(None))
+        .group_by(PointsLedger.user_id, PointsLedger.category)
+    ):
+        scores.setdefault(category_board(category), {})[str(user_id)] = total
+    return scores
+
+
+async def rebuild_leaderboards(chunk_size: int = 10000) -> int:
+    """
+    Resync every board from Postgres.
+
+    Each board is built under a temporary key and swapped in with RENAME,
+    so readers never see a half-built board. Returns the number of boards
+    written.
+    """
+    from database import engine
+
+    with engine.connect() as connection:
+        scores = _board_scores(connection)
+
+    client = redis_config.get_redis_client()
+    boards = [f"category:{category.value}" for category in HabitCategory] + ["global", weekly_board()]
+    for board in boards:
+        members = list(scores.get(board, {}).items())
+        staging = _key(f"{board}:rebuild")
+        await client.delete(staging)
+        for offset in range(0, len(members), chunk_size):
+            await client.zadd(staging, dict(members[offset:offset + chunk_size]))
+        if members:
+            await client.rename(staging, _key(board))
+            if board.startswith("weekly:"):
+                await client.expire(_key(board), timedelta(days=LEADERBOARD_WEEKLY_TTL_DAYS))
+        else:
+            await client.delete(_key(board))
+        logger.info(f"Rebuilt leaderboard {board} with {len(members)} users")
+    return len(boards)
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    print("Rebuilding leaderboards from Postgres...")
+    asyncio.run(rebuild_leaderboards())
+    print("Leaderboards rebuilt successfully!")
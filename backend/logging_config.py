@@ -0,0 +1,261 @@
+"""
+Application logging.
+
+``configure_logging`` runs once at startup. Every logger hands its records
+to a bounded in-memory queue; a ``QueueListener`` thread formats them and
+does the console and file I/O, so the event loop never waits on a disk.
+When the queue is full records are dropped and counted rather than
+blocking the caller.
+
+Settings (environment):
+
+- ``LOG_LEVEL``: root level (default INFO)
+- ``LOG_LEVELS``: per-logger overrides, e.g. ``sqlalchemy.engine=WARNING,auth=DEBUG``
+- ``LOG_FORMAT``: ``text`` or ``json``
+- ``LOG_FILE``: file to append to (default app.log; empty disables)
+- ``LOG_QUEUE_SIZE``: records buffered before dropping (default 10000)
+
+Each record carries the id of the request that produced it (see
+``RequestIdMiddleware``). For hot paths, ``RateLimitedLog`` and
+``SampledLog`` cap how many records a single call site can emit; auth
+uses them for failed-login warnings and the per-login debug lines
+(``AUTH_DEBUG_LOG_SAMPLE_RATE``).
+"""
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Id of the request being handled in the current task, "-" outside requests
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queue handler that never blocks: it drops records when the queue is
+    full, and stamps each record with the current request id before it
+    leaves the request's context.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message now, while args are still valid, and keep the
+        # traceback as text so the writer thread can format it either way
+        record.request_id = request_id_var.get()
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging() -> None:
+    """
+    Route all logging through the background writer. Safe to call more than
+    once; only the first call has an effect.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats() -> dict:
+    """Queue depth and records dropped since startup."""
+    if _queue_handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "queue_depth": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+    }
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware giving each request an id, taken from the
+    ``X-Request-ID`` header or generated, for log records and the response.
+    """
+
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = next(
+            (value.decode("latin-1")[:64] for name, value in scope["headers"] if name == self.header),
+            None
+        ) or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
+
+
+class RateLimitedLog:
+    """
+    Emit at most ``max_per_interval`` records per ``interval_seconds`` from
+    one call site; the next record emitted reports how many were suppressed.
+
+    Args:
+        logger: Logger to write to
+        max_per_interval: Records allowed per interval
+        interval_seconds: Length of the interval
+    """
+
+    def __init__(self, logger: logging.Logger, max_per_interval: int = 10, interval_seconds: float = 60.0):
+        self.logger = logger
+        self.max_per_interval = max_per_interval
+        self.interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+        self._window_start = 0.0
+        self._emitted = 0
+        self._suppressed = 0
+
+    def _admit(self) -> Optional[int]:
+        """Return the suppressed count to report if this record may be emitted, else None."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.interval_seconds:
+                self._window_start = now
+                self._emitted = 0
+            if self._emitted >= self.max_per_interval:
+                self._suppressed += 1
+                return None
+            self._emitted += 1
+            suppressed, self._suppressed = self._suppressed, 0
+            return suppressed
+
+    def log(self, level: int, msg: str, *args) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        suppressed = self._admit()
+        if suppressed is None:
+            return
+        if suppressed:
+            msg = f"{msg} ({suppressed} similar messages suppressed)"
+        self.logger.log(level, msg, *args)
+
+    def warning(self, msg: str, *args) -> None:
+        self.log(logging.WARNING, msg, *args)
+
+    def info(self, msg: str, *args) -> None:
+        self.log(logging.INFO, msg, *args)
+
+
+class SampledLog:
+    """
+    Emit a random ``rate`` fraction of the records from one call site.
+
+    Args:
+        logger: Logger to write to
+        rate: Fraction of records kept, between 0 and 1
+    """
+
+    def __init__(self, logger: logging.Logger, rate: float = 0.01):
+        self.logger = logger
+        self.rate = rate
+
+    def log(self, level: int, msg: str, *args) -> None:
+        if self.logger.isEnabledFor(level) and random.random() < self.rate:
+            self.logger.log(level, f"{msg} (sampled at {self.rate:g})", *args)
+
+    def debug(self, msg: str, *args) -> None:
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg: str, *args) -> None:
+        self.log(logging.INFO, msg, *args)
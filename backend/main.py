@@ -1,40 +1,94 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from database import engine, get_db
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import async_engine, get_db
 import models
-from typing import List
+from typing import List, Literal, Optional
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 import schemas
 import auth
-from redis_config import rate_limit
+import calendars
+import completions
+import conditional
+import streaks
+from redis_config import close_redis_client, get_redis_client, rate_limit, rate_limiter
+from redis.exceptions import RedisError
 import oauth
-from fastapi.responses import HTMLResponse
+import pagination
+import leaderboard
+import partitions
+import rewards
+import points
+import rollups
+import serializers
+from serializers import serializer_for
+from compression import CompressionMiddleware
+from fastapi.responses import HTMLResponse, PlainTextResponse
+import asyncio
 import logging
+import logging_config
+import metrics
+import os
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("app.log")
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Seconds startup waits on the database before serving anyway
+STARTUP_DB_TIMEOUT = float(os.getenv("STARTUP_DB_TIMEOUT", "5"))
+# Seconds each /ready dependency check may take
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "1"))
+
+async def _ensure_completion_partitions():
+    async with async_engine.begin() as connection:
+        await connection.run_sync(partitions.ensure_completion_partitions)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per-worker startup and shutdown.
+
+    Importing this module does no I/O: database and Redis connections open on
+    first use, and the schema is managed by ``run_migrations.py``, not by the
+    workers. Startup only fails for bad configuration; an unreachable
+    database is logged and reported by /ready until it comes back.
+    """
+    # Records are written by a background thread
+    logging_config.configure_logging()
+    auth.get_secret_key()
+    logger.info(
+        f"Security configuration loaded - Algorithm: {auth.ALGORITHM}, "
+        f"Token Expiry: {auth.ACCESS_TOKEN_EXPIRE_MINUTES} minutes"
+    )
+    try:
+        # Create habit_completions partitions for the coming months, if partitioned
+        await asyncio.wait_for(_ensure_completion_partitions(), STARTUP_DB_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Skipped completion partition check at startup: {str(e) or type(e).__name__}")
+    yield
+    await points.wait_for_publishing()
+    await close_redis_client()
+    await async_engine.dispose()
+    # Write out queued log records before exiting
+    logging_config.shutdown_logging()
 
 # Create FastAPI application instance
 app = FastAPI(
     title="HabitForge API",
     description="API for HabitForge - A habit tracking application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=serializers.ORJSONResponse
 )
 
+# Compress large responses (gzip, or zstd when available)
+app.add_middleware(CompressionMiddleware)
+
+# Tag every request and its log records with a request id
+app.add_middleware(logging_config.RequestIdMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -46,6 +100,9 @@ app.add_middleware(
     max_age=3600,
 )
 
+# Per-route latency, status counts and requests in flight for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Pydantic models for request/response
 class TestItemBase(BaseModel):
     name: str
@@ -65,13 +122,14 @@ class TestItem(TestItemBase):
 @rate_limit(requests_per_minute=5, key_prefix="signup")
 async def signup(
     user: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new user."""
     # Check if user already exists
-    db_user = db.query(models.User).filter(
+    result = await db.execute(select(models.User.id).where(
         (models.User.email == user.email) | (models.User.username == user.username)
-    ).first()
+    ))
+    db_user = result.first()
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -79,16 +137,17 @@ async def signup(
         )
     
     # Create new user
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.get_password_hash(user.password)
     db_user = models.User(
         email=user.email,
         username=user.username,
         hashed_password=hashed_password,
+        timezone=user.timezone,
         is_active=True
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 @app.post("/token", response_model=schemas.Token)
@@ -96,11 +155,11 @@ async def signup(
 async def login_for_access_token(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Login endpoint to get access token."""
     try:
-        logger.debug(f"Login attempt for user: {form_data.username}")
+        auth.login_debug_log.debug("Login attempt for user: %s", form_data.username)
         
         # Validate input
         if not form_data.username or not form_data.password:
@@ -111,9 +170,9 @@ async def login_for_access_token(
             )
 
         # Authenticate user
-        user = auth.authenticate_user(db, form_data.username, form_data.password)
+        user = await auth.authenticate_user(db, form_data.username, form_data.password)
         if not user:
-            logger.warning(f"Failed login attempt for user: {form_data.username}")
+            # authenticate_user has logged the reason (rate limited)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
@@ -124,7 +183,7 @@ async def login_for_access_token(
         try:
             access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
             access_token = auth.create_access_token(
-                data={"sub": user.username}, expires_delta=access_token_expires
+                data=auth.token_claims(user), expires_delta=access_token_expires
             )
         except Exception as e:
             logger.error(f"Error creating access token: {str(e)}", exc_info=True)
@@ -133,33 +192,12 @@ async def login_for_access_token(
                 detail="Error creating access token"
             )
         
-        # Convert user to dict for response
-        try:
-            user_dict = {
-                "id": user.id,
-                "email": user.email,
-                "username": user.username,
-                "is_active": user.is_active,
-                "points": user.points,
-                "created_at": user.created_at,
-                "updated_at": user.updated_at,
-                "oauth_provider": user.oauth_provider,
-                "oauth_id": user.oauth_id,
-                "profile_picture": user.profile_picture
-            }
-        except Exception as e:
-            logger.error(f"Error converting user to dict: {str(e)}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Error processing user data"
-            )
-        
-        logger.info(f"Successful login for user: {user.username}")
-        return {
+        logger.info("Successful login for user: %s", user.username)
+        return serializer_for(schemas.Token).response({
             "access_token": access_token,
             "token_type": "bearer",
-            "user": user_dict
-        }
+            "user": serializer_for(schemas.User).dump(user)
+        })
     except HTTPException:
         raise
     except Exception as e:
@@ -186,7 +224,7 @@ async def oauth_login(
 async def oauth_callback(
     provider: str,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if provider not in ["google", "apple"]:
         raise HTTPException(
@@ -195,15 +233,370 @@ async def oauth_callback(
         )
     
     user = await oauth.get_oauth_user(request, provider, db)
-    access_token = auth.create_access_token(data={"sub": user.username})
+    access_token = auth.create_access_token(data=auth.token_claims(user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me", response_model=schemas.User)
 async def read_users_me(
+    request: Request,
     current_user: models.User = Depends(auth.get_current_active_user)
 ):
-    """Get current user information."""
-    return current_user
+    """Get current user information; supports If-None-Match and If-Modified-Since."""
+    last_modified = current_user.updated_at or current_user.created_at
+    etag = conditional.etag_for(schemas.User, current_user.id, last_modified)
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified(etag, last_modified)
+    return serializer_for(schemas.User).response(
+        current_user, headers=conditional.validator_headers(etag, last_modified)
+    )
+
+@app.get("/users/me/badges", response_model=List[schemas.Badge])
+async def read_my_badges(
+    principal: schemas.TokenData = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Badges the current user has earned, newest first."""
+    result = await db.execute(
+        select(models.Badge)
+        .where(models.Badge.user_id == principal.user_id)
+        .order_by(models.Badge.earned_at.desc(), models.Badge.id.desc())
+    )
+    return serializer_for(schemas.Badge).list_response(result.scalars().all())
+
+@app.post("/habits", response_model=schemas.Habit)
+async def create_habit(
+    habit: schemas.HabitCreate,
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create a habit for the current user."""
+    db_habit = models.Habit(**habit.model_dump(), user_id=current_user.id)
+    db.add(db_habit)
+    await db.commit()
+    await db.refresh(db_habit)
+    return db_habit
+
+@app.get("/habits", response_model=schemas.Page[schemas.Habit])
+async def read_habits(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    principal: schemas.TokenData = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List the current user's active habits, oldest first.
+
+    Supports If-None-Match and If-Modified-Since; the version check reads
+    one aggregate row instead of the page.
+    """
+    # Any insert, update or delete of the user's habits changes one of these
+    count, last_id, last_modified = (await db.execute(
+        select(
+            func.count(),
+            func.max(models.Habit.id),
+            func.max(func.coalesce(models.Habit.updated_at, models.Habit.created_at))
+        ).where(models.Habit.user_id == principal.user_id)
+    )).one()
+    etag = conditional.etag_for(
+        schemas.Page[schemas.Habit], principal.user_id, count, last_id, last_modified, cursor, limit
+    )
+    if conditional.is_not_modified(request, etag, last_modified):
+        return conditional.not_modified(etag, last_modified)
+
+    stmt = select(models.Habit).where(
+        models.Habit.user_id == principal.user_id,
+        models.Habit.is_active.is_(True)
+    )
+    items, next_cursor = await pagination.paginate(
+        db, stmt, (models.Habit.created_at, models.Habit.id), cursor, limit
+    )
+    return serializer_for(schemas.Page[schemas.Habit]).response(
+        {"items": items, "next_cursor": next_cursor},
+        headers=conditional.validator_headers(etag, last_modified)
+    )
+
+@app.get("/habits/{habit_id}/completions", response_model=schemas.Page[schemas.HabitCompletion])
+async def read_habit_completions(
+    habit_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """List completions of one of the current user's habits, newest first."""
+    habit = await completions.get_owned_habit(db, habit_id, current_user)
+    stmt = select(models.HabitCompletion).where(models.HabitCompletion.habit_id == habit.id)
+    if start is not None:
+        stmt = stmt.where(models.HabitCompletion.completed_at >= start)
+    if end is not None:
+        stmt = stmt.where(models.HabitCompletion.completed_at < end)
+    items, next_cursor = await pagination.paginate(
+        db, stmt, (models.HabitCompletion.completed_at, models.HabitCompletion.id),
+        cursor, limit, descending=True
+    )
+    return serializer_for(schemas.Page[schemas.HabitCompletion]).response({"items": items, "next_cursor": next_cursor})
+
+@app.post("/completions", response_model=schemas.HabitCompletion)
+async def complete_habit(
+    completion: schemas.HabitCompletionCreate,
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Record a habit completion and update its streak."""
+    habit = await completions.get_owned_habit(db, completion.habit_id, current_user)
+    return await completions.record_completion(db, current_user, habit, notes=completion.notes)
+
+@app.post("/completions/batch", response_model=schemas.HabitCompletionBatchResult)
+async def sync_completions(
+    batch: schemas.HabitCompletionBatch,
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Upload completions recorded offline.
+
+    Idempotent per client_id: re-sending an item reports it as a duplicate.
+    """
+    return await completions.record_completion_batch(db, current_user, batch.completions)
+
+@app.get("/habits/{habit_id}/streak", response_model=schemas.Streak)
+async def read_habit_streak(
+    habit_id: int,
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the streak for one of the current user's habits."""
+    habit = await completions.get_owned_habit(db, habit_id, current_user)
+    result = await db.execute(select(models.Streak).where(
+        models.Streak.habit_id == habit.id,
+        models.Streak.user_id == current_user.id
+    ))
+    streak = result.scalars().first()
+    if streak is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No completions recorded for this habit yet"
+        )
+    response = schemas.Streak.model_validate(streak)
+    response.current_streak = streaks.effective_current_streak(streak, habit, current_user.timezone)
+    return response
+
+@app.get("/habits/{habit_id}/calendar", response_model=schemas.CompletionCalendar)
+async def read_habit_calendar(
+    habit_id: int,
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Year heatmap of one of the current user's habits (default: this year),
+    read from its completion calendar.
+    """
+    habit = await completions.get_owned_habit(db, habit_id, current_user)
+    today = streaks.local_date(datetime.now(timezone.utc), current_user.timezone)
+    year = year or today.year
+    bits = await calendars.habit_year(db, habit.id, year)
+    first_day = streaks.local_date(habit.created_at, current_user.timezone)
+    return serializer_for(schemas.CompletionCalendar).response(
+        {"habit_id": habit.id, **calendars.heatmap(bits, year, first_day, today)}
+    )
+
+@app.get("/habits/{habit_id}/done", response_model=schemas.HabitDayStatus)
+async def read_habit_done(
+    habit_id: int,
+    day: Optional[date] = None,
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Whether one of the current user's habits was completed on a local day (default: today)."""
+    habit = await completions.get_owned_habit(db, habit_id, current_user)
+    day = day or streaks.local_date(datetime.now(timezone.utc), current_user.timezone)
+    done = await calendars.is_done(db, habit.id, day)
+    return serializer_for(schemas.HabitDayStatus).response({"habit_id": habit.id, "day": day, "done": done})
+
+@app.get("/calendar", response_model=schemas.CompletionCalendar)
+async def read_calendar(
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Year heatmap of the days on which the current user completed any habit."""
+    today = streaks.local_date(datetime.now(timezone.utc), current_user.timezone)
+    year = year or today.year
+    bits = await calendars.user_year(db, current_user.id, year)
+    first_day = streaks.local_date(current_user.created_at, current_user.timezone)
+    return serializer_for(schemas.CompletionCalendar).response(
+        {"habit_id": None, **calendars.heatmap(bits, year, first_day, today)}
+    )
+
+@app.get("/stats/completions", response_model=schemas.CompletionStats, response_model_exclude_none=True)
+async def read_completion_stats(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    group_by: Literal["day", "habit", "category"] = "day",
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Completion counts per day, habit or category over a range of the
+    current user's local days (default: the last 30 days).
+    """
+    if end is None:
+        end = streaks.local_date(datetime.now(timezone.utc), current_user.timezone)
+    if start is None:
+        start = end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must not be after end"
+        )
+    buckets = await rollups.completion_stats(db, current_user.id, start, end, group_by)
+    return {
+        "start": start,
+        "end": end,
+        "group_by": group_by,
+        "total": sum(bucket["completions"] for bucket in buckets),
+        "buckets": buckets
+    }
+
+@app.get("/users/me/consistency", response_model=schemas.ConsistencyReport)
+async def read_my_consistency(
+    principal: schemas.TokenData = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Consistency score and 7/30-day completion rates of the current user and
+    each of their habits, as of the last run of the analytics job.
+    """
+    summary = await db.get(models.UserMetrics, principal.user_id)
+    result = await db.execute(
+        select(models.HabitMetrics)
+        .where(models.HabitMetrics.user_id == principal.user_id)
+        .order_by(models.HabitMetrics.habit_id)
+    )
+    return serializer_for(schemas.ConsistencyReport).response({
+        "computed_at": summary.computed_at if summary else None,
+        "consistency": summary.consistency if summary else None,
+        "rate_7d": summary.rate_7d if summary else None,
+        "rate_30d": summary.rate_30d if summary else None,
+        "habits": [
+            {
+                "habit_id": metric.habit_id,
+                "consistency": metric.consistency,
+                "rate_7d": metric.rate_7d,
+                "rate_30d": metric.rate_30d
+            }
+            for metric in result.scalars().all()
+        ]
+    })
+
+@app.get("/stats/category-trends", response_model=List[schemas.CategoryTrendPoint])
+async def read_category_trends(
+    days: int = Query(30, ge=1, le=366),
+    principal: schemas.TokenData = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Daily share of due habits completed, per category, over the last ``days`` computed days."""
+    latest = (await db.execute(select(func.max(models.CategoryTrend.day)))).scalar()
+    if latest is None:
+        return serializer_for(schemas.CategoryTrendPoint).list_response([])
+    result = await db.execute(
+        select(models.CategoryTrend)
+        .where(models.CategoryTrend.day > latest - timedelta(days=days))
+        .order_by(models.CategoryTrend.category, models.CategoryTrend.day)
+    )
+    return serializer_for(schemas.CategoryTrendPoint).list_response(result.scalars().all())
+
+@app.post("/rewards", response_model=schemas.Reward)
+async def create_reward(
+    reward: schemas.RewardCreate,
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create a reward the current user can claim with points."""
+    db_reward = models.Reward(**reward.model_dump(), user_id=current_user.id, is_claimed=False)
+    db.add(db_reward)
+    await db.commit()
+    await db.refresh(db_reward)
+    return db_reward
+
+@app.get("/rewards", response_model=schemas.Page[schemas.Reward])
+async def read_rewards(
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    principal: schemas.TokenData = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """List the current user's rewards, oldest first."""
+    stmt = select(models.Reward).where(models.Reward.user_id == principal.user_id)
+    items, next_cursor = await pagination.paginate(
+        db, stmt, (models.Reward.created_at, models.Reward.id), cursor, limit
+    )
+    return serializer_for(schemas.Page[schemas.Reward]).response({"items": items, "next_cursor": next_cursor})
+
+@app.post("/rewards/{reward_id}/claim", response_model=schemas.RewardClaim)
+async def claim_reward(
+    reward_id: int,
+    current_user: models.User = Depends(auth.get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Claim a reward, paying its points.
+
+    Never waits on a concurrent claim: conflicts return 409.
+    """
+    reward, balance = await rewards.claim_reward(db, current_user, reward_id)
+    return {"reward": reward, "points": balance}
+
+async def _leaderboard_query(coro):
+    """Await a leaderboard read, turning Redis failures into 503."""
+    try:
+        return await coro
+    except RedisError as e:
+        logger.error(f"Leaderboard unavailable: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Leaderboard temporarily unavailable"
+        )
+
+def _board_name(board: str, category: Optional[models.HabitCategory]) -> str:
+    try:
+        return leaderboard.resolve_board(board, category)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.get("/leaderboard", response_model=schemas.Leaderboard)
+async def read_leaderboard(
+    board: Literal["global", "weekly", "category"] = "global",
+    category: Optional[models.HabitCategory] = None,
+    limit: int = Query(10, ge=1, le=100),
+    principal: schemas.TokenData = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Top users on a leaderboard, plus the current user's own rank."""
+    name = _board_name(board, category)
+    entries = await _leaderboard_query(leaderboard.top(name, limit))
+    me = await _leaderboard_query(leaderboard.rank(name, principal.user_id))
+    await leaderboard.attach_usernames(db, entries + ([me] if me else []))
+    return {"board": name, "entries": entries, "me": me}
+
+@app.get("/leaderboard/me", response_model=schemas.Leaderboard)
+async def read_leaderboard_around_me(
+    board: Literal["global", "weekly", "category"] = "global",
+    category: Optional[models.HabitCategory] = None,
+    radius: int = Query(5, ge=0, le=50),
+    principal: schemas.TokenData = Depends(auth.get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """The users ranked just above and below the current user."""
+    name = _board_name(board, category)
+    entries = await _leaderboard_query(leaderboard.around(name, principal.user_id, radius))
+    me = next((entry for entry in entries if entry["user_id"] == principal.user_id), None)
+    await leaderboard.attach_usernames(db, entries)
+    return {"board": name, "entries": entries, "me": me}
 
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -271,42 +664,93 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "rate_limiter": rate_limiter.stats(),
+        "password_hashing": auth.hash_pool.stats(),
+        "logging": logging_config.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Metrics for this worker in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+async def _check_database():
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+async def _check_redis():
+    await get_redis_client().ping()
+
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """
+    Readiness check: whether this worker can serve traffic now.
+
+    Postgres is required. Redis is reported but optional, since rate
+    limiting falls back to local limits without it.
+    """
+    names = ("database", "redis")
+    results = await asyncio.gather(
+        *(asyncio.wait_for(check(), READY_CHECK_TIMEOUT) for check in (_check_database, _check_redis)),
+        return_exceptions=True
+    )
+    checks = {
+        name: "ok" if not isinstance(result, BaseException) else f"unavailable: {type(result).__name__}"
+        for name, result in zip(names, results)
+    }
+    ready = checks["database"] == "ok"
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        "status": "ready" if ready and checks["redis"] == "ok" else "degraded" if ready else "not ready",
+        "checks": checks
+    }
 
 @app.post("/test-db/", response_model=TestItem)
-def create_test_item(item: TestItemCreate, db: Session = Depends(get_db)):
+async def create_test_item(item: TestItemCreate, db: AsyncSession = Depends(get_db)):
     """
     Test endpoint to verify database connection by creating a test item.
     """
     try:
         db_item = models.TestTable(name=item.name)
         db.add(db_item)
-        db.commit()
-        db.refresh(db_item)
+        await db.commit()
+        await db.refresh(db_item)
         return db_item
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/test-db/", response_model=List[TestItem])
-def read_test_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@app.get("/test-db/", response_model=schemas.Page[TestItem])
+async def read_test_items(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Test endpoint to verify database connection by retrieving test items.
     """
     try:
-        items = db.query(models.TestTable).offset(skip).limit(limit).all()
-        return items
+        items, next_cursor = await pagination.paginate(
+            db, select(models.TestTable), (models.TestTable.created_at, models.TestTable.id), cursor, limit
+        )
+        return {"items": items, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/debug/user/{username}")
 async def debug_user(
     username: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Debug endpoint to check user details."""
     try:
-        user = db.query(models.User).filter(models.User.username == username).first()
+        result = await db.execute(select(models.User).where(models.User.username == username))
+        user = result.scalars().first()
         if not user:
             return {"error": f"User {username} not found"}
             
@@ -0,0 +1,272 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms live in ``REGISTRY`` and are rendered by
+``render()`` for the /metrics endpoint. Each update is a dict lookup and an
+addition under an uncontended lock, cheap enough to leave on for every
+request. Values are per worker process; Prometheus sums them across
+workers.
+
+``MetricsMiddleware`` records per-route latency, status counts and requests
+in flight. Dependencies record their own timings against the metrics
+declared at the bottom of this module.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import threading
+import time
+
+# Starlette appends the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Seconds; covers sub-millisecond cache hits up to slow requests
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY: List["_Metric"] = []
+
+Sample = Tuple[str, Sequence[Tuple[str, str]], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _labels(self, values: tuple) -> Sequence[Tuple[str, str]]:
+        return list(zip(self.labelnames, values))
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per label combination."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, self._labels(labels), value
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down. ``set_function`` makes a series read its
+    value from a callable at scrape time instead.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[tuple, float] = {}
+        self._functions: Dict[tuple, Callable[[], float]] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, function: Callable[[], float], *labels: str) -> None:
+        with self._lock:
+            self._functions[labels] = function
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            values = list(self._values.items())
+            functions = dict(self._functions)
+        for labels, function in functions.items():
+            yield self.name, self._labels(labels), function()
+        for labels, value in values:
+            if labels not in functions:
+                yield self.name, self._labels(labels), value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values over fixed ``buckets``, stored per label
+    combination as per-bucket counts and made cumulative when rendered.
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> Iterator[Sample]:
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        for labels, values in series:
+            label_pairs = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                yield f"{self.name}_bucket", [*label_pairs, ("le", _format_value(bound))], cumulative
+            yield f"{self.name}_sum", label_pairs, values[-1]
+            yield f"{self.name}_count", label_pairs, cumulative
+
+
+def render() -> str:
+    """Every registered metric in the text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            if labels:
+                rendered = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels)
+                lines.append(f"{name}{{{rendered}}} {_format_value(value)}")
+            else:
+                lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request. Requests are labelled by
+    route template (``/habits/{habit_id}``), not by raw path, so the number
+    of series stays bounded; requests matching no route share "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict[Callable, str]] = None
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(endpoint, getattr(endpoint, "__name__", "unknown"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = self._route(scope)
+            http_request_duration_seconds.observe(elapsed, scope["method"], route)
+            http_requests_total.inc(scope["method"], route, str(status_code))
+
+
+# HTTP
+http_requests_total = Counter(
+    "http_requests_total", "HTTP requests by method, route and status code.", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route.", ("method", "route")
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being handled.")
+
+# Database connection pool (async engine)
+db_pool_size = Gauge("db_pool_size", "Connections the pool keeps open.")
+db_pool_checked_out = Gauge("db_pool_checked_out", "Connections currently checked out of the pool.")
+db_pool_overflow = Gauge("db_pool_overflow", "Connections open beyond the pool size.")
+db_pool_acquire_seconds = Histogram(
+    "db_pool_acquire_seconds", "Time to check a connection out of the pool, including waiting for one."
+)
+
+# Redis
+redis_command_seconds = Histogram(
+    "redis_command_seconds", "Latency of successful Redis calls by operation.", ("operation",)
+)
+redis_command_errors_total = Counter(
+    "redis_command_errors_total", "Failed or timed out Redis calls by operation.", ("operation",)
+)
+
+# Circuit breakers guarding dependencies (see circuit_breaker.py)
+circuit_breaker_state = Gauge(
+    "circuit_breaker_state", "Circuit breaker state by breaker: 0 closed, 1 half-open, 2 open.", ("breaker",)
+)
+circuit_breaker_trips_total = Counter(
+    "circuit_breaker_trips_total", "Times a circuit breaker opened, by breaker.", ("breaker",)
+)
+
+# Rate limiting
+rate_limit_rejections_total = Counter(
+    "rate_limit_rejections_total", "Requests rejected with 429 by key prefix.", ("key_prefix",)
+)
+rate_limit_fallback_checks_total = Counter(
+    "rate_limit_fallback_checks_total",
+    "Rate limit checks answered by the per-process fallback while Redis was unavailable."
+)
+
+# Password hashing
+hashing_pool_pending = Gauge(
+    "hashing_pool_pending", "Password hashing jobs queued or running, bounded by PASSWORD_HASH_MAX_PENDING."
+)
+hashing_pool_in_flight = Gauge("hashing_pool_in_flight", "Password hashing jobs running on a hashing thread.")
+password_hash_seconds = Histogram(
+    "password_hash_seconds",
+    "Time spent in bcrypt on a hashing thread by operation.",
+    ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0)
+)
@@ -0,0 +1,56 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+import badges
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Add badge rule codes and per-user counters, then award badges already earned."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect() as connection:
+            created = connection.execute(text("""
+                SELECT to_regclass('user_counters') IS NULL
+            """)).scalar()
+
+            connection.execute(text("""
+                ALTER TABLE badges
+                ADD COLUMN IF NOT EXISTS code VARCHAR
+            """))
+            connection.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_badges_user_code
+                ON badges (user_id, code)
+            """))
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS user_counters (
+                    user_id INTEGER NOT NULL REFERENCES users (id),
+                    name VARCHAR NOT NULL,
+                    value BIGINT NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, name)
+                )
+            """))
+
+            connection.commit()
+
+        # New counters start from history rather than zero
+        if created:
+            badges.rebuild_counters()
+            badges.backfill_badges()
+
+        logger.info("Successfully added badge rules")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,55 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+import calendars
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Create the per-habit completion calendar and backfill it from existing completions."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect() as connection:
+            created = connection.execute(text("""
+                SELECT to_regclass('completion_calendar') IS NULL
+            """)).scalar()
+
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS completion_calendar (
+                    habit_id INTEGER NOT NULL REFERENCES habits (id),
+                    year INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL REFERENCES users (id),
+                    days BIT(366) NOT NULL,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                    PRIMARY KEY (habit_id, year)
+                )
+            """))
+            # Whole-user heatmaps OR together the user's rows for one year
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_completion_calendar_user_year
+                ON completion_calendar (user_id, year)
+            """))
+
+            connection.commit()
+
+        # Only a new table needs the full backfill; later drift is repaired
+        # with ``python calendars.py --start-year ... --end-year ...``
+        if created:
+            calendars.rebuild_calendar()
+
+        logger.info("Successfully added completion calendar")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,47 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Add client-supplied ids to habit completions for idempotent batch sync."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect() as connection:
+            connection.execute(text("""
+                ALTER TABLE habit_completions
+                ADD COLUMN IF NOT EXISTS client_id VARCHAR
+            """))
+
+            # Re-uploading a completion conflicts here and is skipped. Checked
+            # by name first: once the table is partitioned the index has a
+            # different shape and this definition would be rejected.
+            index_exists = connection.execute(text("""
+                SELECT 1 FROM pg_indexes
+                WHERE indexname = 'uq_habit_completions_user_client'
+            """)).scalar()
+            if not index_exists:
+                connection.execute(text("""
+                    CREATE UNIQUE INDEX uq_habit_completions_user_client
+                    ON habit_completions (user_id, client_id)
+                """))
+
+            connection.commit()
+
+        logger.info("Successfully added client ids to habit completions")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
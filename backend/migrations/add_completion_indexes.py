@@ -0,0 +1,83 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+from partitions import is_partitioned
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Add composite indexes for per-user and per-habit completion range queries."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction, and
+        # keeps the table writable while the index builds
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if is_partitioned(connection):
+                logger.info("habit_completions is partitioned, its indexes are created with the partitions")
+                return
+
+            # "today's completions for user Y", per-user stats
+            connection.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_habit_completions_user_completed_at
+                ON habit_completions (user_id, completed_at)
+            """))
+
+            # "completions for habit X in range", streak rebuilds
+            connection.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_habit_completions_habit_completed_at
+                ON habit_completions (habit_id, completed_at)
+            """))
+
+            # An earlier version of this migration added completed_at to the
+            # client id index, which only a partitioned table needs and which
+            # stops it from rejecting a client id re-sent with another time
+            client_index = connection.execute(text("""
+                SELECT indexdef FROM pg_indexes
+                WHERE indexname = 'uq_habit_completions_user_client'
+            """)).scalar()
+            if client_index is not None and "completed_at" in client_index:
+                duplicates = connection.execute(text("""
+                    DELETE FROM habit_completions c
+                    USING habit_completions kept
+                    WHERE kept.user_id = c.user_id
+                      AND kept.client_id = c.client_id
+                      AND kept.id < c.id
+                """)).rowcount
+                if duplicates:
+                    logger.warning(
+                        f"Removed {duplicates} completions uploaded twice with one client id; "
+                        "rebuild streaks, rollups and calendars for the affected users"
+                    )
+                connection.execute(text("""
+                    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_habit_completions_user_client_only
+                    ON habit_completions (user_id, client_id)
+                """))
+                connection.execute(text("""
+                    DROP INDEX CONCURRENTLY IF EXISTS uq_habit_completions_user_client
+                """))
+                connection.execute(text("""
+                    ALTER INDEX uq_habit_completions_user_client_only
+                    RENAME TO uq_habit_completions_user_client
+                """))
+
+            connection.execute(text("""
+                ALTER TABLE habit_completions
+                ALTER COLUMN completed_at SET NOT NULL
+            """))
+
+        logger.info("Successfully added habit completion indexes")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,50 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+import rollups
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Create the daily completion rollup and backfill it from existing completions."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect() as connection:
+            created = connection.execute(text("""
+                SELECT to_regclass('completion_daily_rollup') IS NULL
+            """)).scalar()
+
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS completion_daily_rollup (
+                    user_id INTEGER NOT NULL REFERENCES users (id),
+                    day DATE NOT NULL,
+                    habit_id INTEGER NOT NULL REFERENCES habits (id),
+                    completions INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                    PRIMARY KEY (user_id, day, habit_id)
+                )
+            """))
+
+            connection.commit()
+
+        # Only a new table needs the full backfill; later drift is repaired
+        # with ``python rollups.py --start ... --end ...``
+        if created:
+            rollups.rebuild_rollup()
+
+        logger.info("Successfully added completion rollup")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,65 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Create the tables the offline analytics job (analytics.py) writes."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect() as connection:
+            # Derived data replaced wholesale on every run, so no foreign keys
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS habit_metrics (
+                    habit_id INTEGER PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    consistency DOUBLE PRECISION,
+                    rate_7d DOUBLE PRECISION,
+                    rate_30d DOUBLE PRECISION,
+                    computed_at TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_habit_metrics_user_id ON habit_metrics (user_id)
+            """))
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS user_metrics (
+                    user_id INTEGER PRIMARY KEY,
+                    consistency DOUBLE PRECISION,
+                    rate_7d DOUBLE PRECISION,
+                    rate_30d DOUBLE PRECISION,
+                    habits INTEGER NOT NULL DEFAULT 0,
+                    computed_at TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            """))
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS category_trends (
+                    category habitcategory NOT NULL,
+                    day DATE NOT NULL,
+                    satisfied INTEGER NOT NULL,
+                    eligible INTEGER NOT NULL,
+                    rate DOUBLE PRECISION,
+                    computed_at TIMESTAMP WITH TIME ZONE NOT NULL,
+                    PRIMARY KEY (category, day)
+                )
+            """))
+
+            connection.commit()
+
+        logger.info("Successfully added consistency metrics tables")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,55 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Index users for the OAuth upsert and username allocation."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            # A failed CREATE UNIQUE INDEX CONCURRENTLY leaves an invalid index
+            # that IF NOT EXISTS would then skip, so check for duplicates first
+            duplicates = connection.execute(text("""
+                SELECT count(*) FROM (
+                    SELECT 1 FROM users
+                    WHERE oauth_provider IS NOT NULL AND oauth_id IS NOT NULL
+                    GROUP BY oauth_provider, oauth_id
+                    HAVING count(*) > 1
+                ) AS duplicated
+            """)).scalar()
+            if duplicates:
+                raise ValueError(
+                    f"{duplicates} OAuth identities belong to more than one user; "
+                    "merge or clear them before adding uq_users_oauth_provider_id"
+                )
+
+            # Conflict target of the OAuth user upsert
+            connection.execute(text("""
+                CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_users_oauth_provider_id
+                ON users (oauth_provider, oauth_id)
+            """))
+
+            # LIKE 'prefix%' scans for the next free username suffix
+            connection.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_pattern
+                ON users (username text_pattern_ops)
+            """))
+
+        logger.info("Successfully added OAuth user indexes")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
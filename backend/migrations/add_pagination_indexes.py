@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Add indexes matching the keyset pagination sort keys of list endpoints."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            # GET /habits pages by (created_at, id) within a user
+            connection.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_habits_user_created_at_id
+                ON habits (user_id, created_at, id)
+            """))
+
+            # GET /test-db/
+            connection.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_test_table_created_at_id
+                ON test_table (created_at, id)
+            """))
+
+        logger.info("Successfully added pagination indexes")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,73 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+from points import POINTS_PER_COMPLETION
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Create the points ledger and open it with every user's current balance."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect() as connection:
+            created = connection.execute(text("""
+                SELECT to_regclass('points_ledger') IS NULL
+            """)).scalar()
+
+            connection.execute(text("""
+                CREATE TABLE IF NOT EXISTS points_ledger (
+                    id BIGSERIAL PRIMARY KEY,
+                    user_id INTEGER NOT NULL REFERENCES users (id),
+                    delta INTEGER NOT NULL,
+                    reason VARCHAR NOT NULL,
+                    category habitcategory,
+                    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+                )
+            """))
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_points_ledger_user_id_id
+                ON points_ledger (user_id, id)
+            """))
+
+            if created:
+                # Lock balances so none move while the ledger is opened
+                connection.execute(text("LOCK TABLE users IN SHARE ROW EXCLUSIVE MODE"))
+
+                # Completion points keep their category and time so the
+                # weekly and category leaderboards can be rebuilt from the ledger
+                connection.execute(text("""
+                    INSERT INTO points_ledger (user_id, delta, reason, category, created_at)
+                    SELECT c.user_id, :points, 'completion', h.category, c.completed_at
+                    FROM habit_completions c
+                    JOIN habits h ON h.id = c.habit_id
+                """), {"points": POINTS_PER_COMPLETION})
+
+                # Whatever the completions do not explain becomes the opening balance
+                connection.execute(text("""
+                    INSERT INTO points_ledger (user_id, delta, reason)
+                    SELECT u.id, COALESCE(u.points, 0) - COALESCE(l.total, 0), 'opening_balance'
+                    FROM users u
+                    LEFT JOIN (
+                        SELECT user_id, SUM(delta) AS total FROM points_ledger GROUP BY user_id
+                    ) l ON l.user_id = u.id
+                    WHERE COALESCE(u.points, 0) <> COALESCE(l.total, 0)
+                """))
+
+            connection.commit()
+
+        logger.info("Successfully added points ledger")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def run_migration():
+    """Add the columns and unique index used by the incremental streak engine."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.connect() as connection:
+            # Day boundary for streaks
+            connection.execute(text("""
+                ALTER TABLE users
+                ADD COLUMN IF NOT EXISTS timezone VARCHAR NOT NULL DEFAULT 'UTC'
+            """))
+
+            # Period length for CUSTOM frequency habits
+            connection.execute(text("""
+                ALTER TABLE habits
+                ADD COLUMN IF NOT EXISTS custom_interval_days INTEGER
+            """))
+
+            # Latest completed period, compared against on every completion
+            connection.execute(text("""
+                ALTER TABLE streaks
+                ADD COLUMN IF NOT EXISTS last_period INTEGER
+            """))
+
+            # Keep the most recently updated row for any duplicated streak
+            connection.execute(text("""
+                DELETE FROM streaks s
+                USING streaks newer
+                WHERE s.habit_id = newer.habit_id
+                  AND s.user_id = newer.user_id
+                  AND s.id < newer.id
+            """))
+
+            # One streak row per (habit, user), targeted by ON CONFLICT
+            connection.execute(text("""
+                CREATE UNIQUE INDEX IF NOT EXISTS uq_streaks_habit_user
+                ON streaks (habit_id, user_id)
+            """))
+
+            connection.commit()
+
+        logger.info("Successfully added streak columns")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
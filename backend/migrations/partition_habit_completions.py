@@ -0,0 +1,97 @@
+from sqlalchemy import create_engine
+from sqlalchemy.sql import text
+from database import DATABASE_URL
+from partitions import ensure_completion_partitions, is_partitioned
+import logging
+import os
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Opt-in: converting the table rewrites every row under an exclusive lock
+PARTITION_HABIT_COMPLETIONS = os.getenv("PARTITION_HABIT_COMPLETIONS", "false").lower() in ("1", "true", "yes")
+
+def run_migration():
+    """Convert habit_completions into a table range partitioned by month."""
+    try:
+        # Create engine
+        engine = create_engine(DATABASE_URL)
+
+        with engine.begin() as connection:
+            if is_partitioned(connection):
+                ensure_completion_partitions(connection)
+                logger.info("habit_completions is already partitioned")
+                return
+            if not PARTITION_HABIT_COMPLETIONS:
+                logger.info("Skipping habit_completions partitioning (PARTITION_HABIT_COMPLETIONS not set)")
+                return
+
+            connection.execute(text("LOCK TABLE habit_completions IN ACCESS EXCLUSIVE MODE"))
+            sequence = connection.execute(text(
+                "SELECT pg_get_serial_sequence('habit_completions', 'id')"
+            )).scalar()
+            first_completion = connection.execute(text(
+                "SELECT min(completed_at) FROM habit_completions"
+            )).scalar()
+
+            # Keep the id sequence alive when the old table is dropped
+            connection.execute(text("ALTER TABLE habit_completions RENAME TO habit_completions_unpartitioned"))
+            connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+
+            # The partition key has to be part of the primary key
+            connection.execute(text(f"""
+                CREATE TABLE habit_completions (
+                    id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+                    habit_id INTEGER REFERENCES habits (id),
+                    user_id INTEGER REFERENCES users (id),
+                    completed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+                    notes TEXT,
+                    client_id VARCHAR,
+                    PRIMARY KEY (id, completed_at)
+                ) PARTITION BY RANGE (completed_at)
+            """))
+            connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY habit_completions.id"))
+            connection.execute(text("""
+                CREATE TABLE habit_completions_default
+                PARTITION OF habit_completions DEFAULT
+            """))
+            start = first_completion.date() if first_completion else None
+            months = ensure_completion_partitions(connection, start=start)
+
+            connection.execute(text("""
+                INSERT INTO habit_completions (id, habit_id, user_id, completed_at, notes, client_id)
+                SELECT id, habit_id, user_id, completed_at, notes, client_id
+                FROM habit_completions_unpartitioned
+            """))
+            connection.execute(text("DROP TABLE habit_completions_unpartitioned"))
+
+            # Created on the parent, so every partition gets them
+            connection.execute(text("""
+                CREATE INDEX ix_habit_completions_id
+                ON habit_completions (id)
+            """))
+            connection.execute(text("""
+                CREATE INDEX ix_habit_completions_user_completed_at
+                ON habit_completions (user_id, completed_at)
+            """))
+            connection.execute(text("""
+                CREATE INDEX ix_habit_completions_habit_completed_at
+                ON habit_completions (habit_id, completed_at)
+            """))
+            connection.execute(text("""
+                CREATE UNIQUE INDEX uq_habit_completions_user_client
+                ON habit_completions (user_id, client_id, completed_at)
+            """))
+
+        logger.info(f"Successfully partitioned habit_completions into {months} monthly partitions")
+
+    except Exception as e:
+        logger.error(f"Error running migration: {str(e)}", exc_info=True)
+        raise
+
+if __name__ == "__main__":
+    run_migration()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, Boolean, ForeignKey, Table, Enum, Text
+from sqlalchemy import Column, BigInteger, Integer, String, Date, DateTime, Float, func, Boolean, ForeignKey, Table, Enum, Text, Index
+from sqlalchemy.dialects.postgresql import BIT
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -31,6 +32,9 @@ class TestTable(Base):
     A test table to verify database connection.
     """
     __tablename__ = "test_table"
+    __table_args__ = (
+        Index("ix_test_table_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -42,6 +46,12 @@ class User(Base):
     User model for authentication and basic user information.
     """
     __tablename__ = "users"
+    __table_args__ = (
+        # One account per provider identity; the key of the OAuth upsert
+        Index("uq_users_oauth_provider_id", "oauth_provider", "oauth_id", unique=True),
+        # Prefix scans (LIKE 'name%') when allocating OAuth usernames
+        Index("ix_users_username_pattern", "username", postgresql_ops={"username": "text_pattern_ops"}),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
@@ -54,6 +64,7 @@ class User(Base):
     oauth_provider = Column(String, nullable=True)  # Store OAuth provider (google, apple)
     oauth_id = Column(String, nullable=True)  # Store OAuth provider's user ID
     profile_picture = Column(String, nullable=True)  # Store profile picture URL from OAuth
+    timezone = Column(String, nullable=False, default="UTC", server_default="UTC")  # IANA name, defines the user's day boundary
 
     # Relationships
     habits = relationship("Habit", back_populates="user")
@@ -64,12 +75,16 @@ class User(Base):
 
 class Habit(Base):
     __tablename__ = "habits"
+    __table_args__ = (
+        Index("ix_habits_user_created_at_id", "user_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     description = Column(Text, nullable=True)
     frequency = Column(Enum(HabitFrequency))
     category = Column(Enum(HabitCategory))
+    custom_interval_days = Column(Integer, nullable=True)  # Period length for CUSTOM frequency
     user_id = Column(Integer, ForeignKey("users.id"))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -82,6 +97,9 @@ class Habit(Base):
 
 class Streak(Base):
     __tablename__ = "streaks"
+    __table_args__ = (
+        Index("uq_streaks_habit_user", "habit_id", "user_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     habit_id = Column(Integer, ForeignKey("habits.id"))
@@ -89,6 +107,7 @@ class Streak(Base):
     current_streak = Column(Integer, default=0)
     longest_streak = Column(Integer, default=0)
     last_completion_date = Column(DateTime(timezone=True), nullable=True)
+    last_period = Column(Integer, nullable=True)  # Index of the latest completed period, see streaks.period_index
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -98,19 +117,128 @@ class Streak(Base):
 
 class HabitCompletion(Base):
     __tablename__ = "habit_completions"
+    __table_args__ = (
+        # Once the table is range partitioned by month (see partitions.py)
+        # this index also holds completed_at, and batch sync serializes per
+        # user instead (see completions.record_completion_batch)
+        Index("uq_habit_completions_user_client", "user_id", "client_id", unique=True),
+        Index("ix_habit_completions_user_completed_at", "user_id", "completed_at"),
+        Index("ix_habit_completions_habit_completed_at", "habit_id", "completed_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     habit_id = Column(Integer, ForeignKey("habits.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
-    completed_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     notes = Column(Text, nullable=True)
+    client_id = Column(String, nullable=True)  # Client-generated id, makes offline sync idempotent
 
     # Relationships
     habit = relationship("Habit", back_populates="completions")
     user = relationship("User", back_populates="completions")
 
+class CompletionDailyRollup(Base):
+    """
+    Completions per habit per local day, maintained alongside habit_completions
+    so statistics never have to aggregate raw history (see rollups.py).
+    """
+    __tablename__ = "completion_daily_rollup"
+
+    # Day before habit so a user's date range is one index range
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)  # Calendar day in the user's timezone
+    habit_id = Column(Integer, ForeignKey("habits.id"), primary_key=True)
+    completions = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class CompletionCalendar(Base):
+    """
+    One bit per local day per habit and year, maintained alongside
+    habit_completions for heatmaps and "done today?" checks (see calendars.py).
+    """
+    __tablename__ = "completion_calendar"
+    __table_args__ = (
+        Index("ix_completion_calendar_user_year", "user_id", "year"),
+    )
+
+    habit_id = Column(Integer, ForeignKey("habits.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)  # Calendar year in the user's timezone
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    days = Column(BIT(366), nullable=False)  # Bit n (from the left) set if completed on day n, January 1st is 0
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class HabitMetrics(Base):
+    """
+    Consistency metrics per habit, written by the offline job in analytics.py.
+    Derived data replaced on every run, so no foreign keys.
+    """
+    __tablename__ = "habit_metrics"
+    __table_args__ = (
+        Index("ix_habit_metrics_user_id", "user_id"),
+    )
+
+    habit_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    consistency = Column(Float, nullable=True)  # Recency-weighted share of satisfied days; None if no eligible days
+    rate_7d = Column(Float, nullable=True)
+    rate_30d = Column(Float, nullable=True)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+class UserMetrics(Base):
+    """Means of a user's active habit metrics, written by analytics.py."""
+    __tablename__ = "user_metrics"
+
+    user_id = Column(Integer, primary_key=True)
+    consistency = Column(Float, nullable=True)
+    rate_7d = Column(Float, nullable=True)
+    rate_30d = Column(Float, nullable=True)
+    habits = Column(Integer, nullable=False, default=0)  # Active habits
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+class CategoryTrend(Base):
+    """Share of satisfied habit-days per category and day across all users, written by analytics.py."""
+    __tablename__ = "category_trends"
+
+    category = Column(Enum(HabitCategory), primary_key=True)
+    day = Column(Date, primary_key=True)
+    satisfied = Column(Integer, nullable=False)
+    eligible = Column(Integer, nullable=False)
+    rate = Column(Float, nullable=True)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+class PointsLedger(Base):
+    """
+    Append-only record of every points change. ``User.points`` is a cached
+    sum of a user's entries, maintained in the same statement (see points.py).
+    """
+    __tablename__ = "points_ledger"
+    __table_args__ = (
+        Index("ix_points_ledger_user_id_id", "user_id", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    delta = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False)  # e.g. completion, bonus, opening_balance
+    category = Column(Enum(HabitCategory), nullable=True)  # Habit category that earned the points
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class UserCounter(Base):
+    """
+    Named per-user counters (e.g. ``completions``), incremented as events
+    happen so badge rules never have to count rows (see badges.py).
+    """
+    __tablename__ = "user_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    name = Column(String, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
 class Reward(Base):
     __tablename__ = "rewards"
+    __table_args__ = (
+        Index("ix_rewards_user_created_at_id", "user_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
@@ -127,8 +255,13 @@ class Reward(Base):
 
 class Badge(Base):
     __tablename__ = "badges"
+    __table_args__ = (
+        # One award per rule and user, see badges.py
+        Index("uq_badges_user_code", "user_id", "code", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    code = Column(String, nullable=True)  # Code of the badge rule that awarded it
     title = Column(String, index=True)
     description = Column(Text, nullable=True)
     icon = Column(String)  # URL or icon identifier
@@ -1,47 +1,201 @@
+from functools import lru_cache
 from typing import Optional, Dict, Any
 from fastapi import HTTPException, status
-from authlib.integrations.starlette_client import OAuth
+from authlib.integrations.starlette_client import OAuth, StarletteOAuth2App
 from starlette.config import Config
 from starlette.requests import Request
 from starlette.responses import RedirectResponse, JSONResponse
 import httpx
-from sqlalchemy.orm import Session
+from sqlalchemy import BigInteger, String, case, cast, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 import models
 import auth
+from oidc_cache import provider_cache
+from principal_cache import principal_cache
 import os
+import random
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-config = Config(".env")
-
-# Register OAuth2 configurations
-oauth = OAuth(config)
-
-# Google OAuth2
-oauth.register(
-    name="google",
-    server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
-    client_kwargs={
-        "scope": "openid email profile",
-        "redirect_uri": "http://localhost:8000/auth/google/callback"
-    }
-)
-
-# Apple OAuth2
-oauth.register(
-    name="apple",
-    server_metadata_url="https://appleid.apple.com/.well-known/openid-configuration",
-    client_kwargs={
-        "scope": "openid email name",
-        "redirect_uri": "http://localhost:8000/auth/apple/callback"
-    }
-)
-
-async def get_oauth_user(request: Request, provider: str, db: Session) -> models.User:
+# Attempts at claiming a free username before giving up
+OAUTH_USERNAME_RETRIES = int(os.getenv("OAUTH_USERNAME_RETRIES", "5"))
+
+# Unique indexes on users, as named by the model
+USERNAME_INDEX = "ix_users_username"
+EMAIL_INDEX = "ix_users_email"
+
+class CachedOAuth2App(StarletteOAuth2App):
+    """
+    OAuth2 client that reads discovery metadata and signing keys through
+    ``oidc_cache`` instead of fetching them from the provider itself.
+    """
+
+    async def load_server_metadata(self):
+        if self._server_metadata_url:
+            entry = await provider_cache.get(self.name, self._server_metadata_url)
+            if self.server_metadata.get("_loaded_at") != entry.fetched_at:
+                self.server_metadata.update(entry.metadata, jwks=entry.jwks, _loaded_at=entry.fetched_at)
+        return self.server_metadata
+
+    async def fetch_jwk_set(self, force=False):
+        # authlib forces a refetch when the token's key id is not in the set
+        if force and self._server_metadata_url:
+            jwks = await provider_cache.refresh_jwks(self.name, self._server_metadata_url)
+            self.server_metadata["jwks"] = jwks
+            return jwks
+        return await super().fetch_jwk_set(force=force)
+
+class CachedOAuth(OAuth):
+    oauth2_client_cls = CachedOAuth2App
+
+@lru_cache(maxsize=None)
+def get_oauth() -> OAuth:
+    """
+    OAuth registry with the Google and Apple providers, built on first use.
+    """
+    # Load environment variables
+    config = Config(".env")
+    oauth = CachedOAuth(config)
+
+    # Google OAuth2
+    oauth.register(
+        name="google",
+        server_metadata_url="https://accounts.google.com/.well-known/openid-configuration",
+        client_kwargs={
+            "scope": "openid email profile",
+            "redirect_uri": "http://localhost:8000/auth/google/callback"
+        }
+    )
+
+    # Apple OAuth2
+    oauth.register(
+        name="apple",
+        server_metadata_url="https://appleid.apple.com/.well-known/openid-configuration",
+        client_kwargs={
+            "scope": "openid email name",
+            "redirect_uri": "http://localhost:8000/auth/apple/callback"
+        }
+    )
+    return oauth
+
+def _free_username(base: str, skip: int = 0):
+    """
+    Scalar SQL expression for ``base`` if it is free, else ``base`` followed
+    by one more than the highest numeric suffix in use, plus ``skip``. One
+    index range scan over usernames starting with ``base``
+    (ix_users_username_pattern).
+    """
+    suffix = func.substr(models.User.username, len(base) + 1)
+    numeric_suffix = case(
+        (suffix.op("~")("^[1-9][0-9]{0,8}$"), cast(suffix, BigInteger)),
+        else_=None
+    )
+    taken = (
+        select(
+            func.bool_or(models.User.username == base).label("base_taken"),
+            func.coalesce(func.max(numeric_suffix), 0).label("max_suffix")
+        )
+        .where(models.User.username.startswith(base, autoescape=True))
+        .subquery()
+    )
+    return (
+        select(case(
+            (taken.c.base_taken.is_(True), literal(base) + cast(taken.c.max_suffix + 1 + skip, String)),
+            else_=literal(base)
+        ))
+        .scalar_subquery()
+    )
+
+def _constraint_name(error: IntegrityError) -> Optional[str]:
+    # asyncpg's UniqueViolationError is chained behind the DBAPI adapter error
+    return getattr(getattr(error.orig, "__cause__", None), "constraint_name", None)
+
+async def upsert_oauth_user(db: AsyncSession, provider: str, userinfo: Dict[str, Any]) -> models.User:
+    """
+    Create or update the user for a provider identity in one statement.
+
+    The INSERT is keyed on (oauth_provider, oauth_id): a returning user only
+    has their profile picture refreshed, and a new user gets the first free
+    username derived from their name, computed inside the same statement.
+    Two new users racing for the same username make one INSERT fail; it is
+    retried up to ``OAUTH_USERNAME_RETRIES`` times, skipping a random and
+    growing number of suffixes so that a burst of sign-ups with the same
+    name spreads out instead of colliding again. An email already
+    registered by another account signs in as that account, linking the
+    provider identity to it if it has none.
+
+    Raises:
+        HTTPException: 400 if the provider did not return an email or subject
+    """
+    email = userinfo.get("email")
+    oauth_id = userinfo.get("sub")
+    if not email or not oauth_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email not provided by OAuth provider" if not email else "Subject not provided by OAuth provider"
+        )
+    base_username = userinfo.get("name") or email.split("@")[0]
+    picture = userinfo.get("picture")
+
+    for attempt in range(1, OAUTH_USERNAME_RETRIES + 1):
+        candidate = select(
+            literal(email),
+            _free_username(base_username, random.randrange(4 ** (attempt - 1))),
+            literal(provider),
+            literal(oauth_id),
+            literal(picture, String),
+            literal(True)
+        )
+        stmt = insert(models.User).from_select(
+            ["email", "username", "oauth_provider", "oauth_id", "profile_picture", "is_active"],
+            candidate
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.User.oauth_provider, models.User.oauth_id],
+            set_={
+                "profile_picture": func.coalesce(stmt.excluded.profile_picture, models.User.profile_picture),
+                "updated_at": func.now(),
+            }
+        ).returning(models.User)
+        try:
+            async with db.begin_nested():
+                user = (await db.execute(
+                    stmt, execution_options={"populate_existing": True}
+                )).scalars().one()
+            await db.commit()
+            # Core statements bypass the ORM events that evict cached principals
+            principal_cache.invalidate_user(user.id)
+            return user
+        except IntegrityError as e:
+            constraint = _constraint_name(e)
+            if constraint == USERNAME_INDEX and attempt < OAUTH_USERNAME_RETRIES:
+                logger.info(f"Username for {base_username!r} was taken concurrently, retrying ({attempt})")
+                continue
+            if constraint != EMAIL_INDEX:
+                await db.rollback()
+                raise
+            break
+
+    # The email belongs to an account created another way
+    result = await db.execute(
+        update(models.User)
+        .where(models.User.email == email, models.User.oauth_id.is_(None))
+        .values(oauth_provider=provider, oauth_id=oauth_id,
+                profile_picture=func.coalesce(models.User.profile_picture, picture))
+        .returning(models.User)
+        .execution_options(synchronize_session=False, populate_existing=True)
+    )
+    user = result.scalars().first()
+    if user is None:
+        user = (await db.execute(select(models.User).where(models.User.email == email))).scalars().one()
+    await db.commit()
+    principal_cache.invalidate_user(user.id)
+    return user
+
+async def get_oauth_user(request: Request, provider: str, db: AsyncSession) -> models.User:
     """
     Get or create user from OAuth provider.
     
@@ -54,44 +208,20 @@ async def get_oauth_user(request: Request, provider: str, db: Session) -> models
         User object
     """
     try:
-        token = await oauth.authorize_access_token(request)
-        userinfo = await oauth.parse_id_token(request, token)
-        
-        # Get or create user
-        email = userinfo.get("email")
-        if not email:
+        client = get_oauth().create_client(provider)
+        if not client:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email not provided by OAuth provider"
+                detail=f"OAuth client for {provider} not configured"
             )
+        # The ID token is verified against the cached key set
+        token = await client.authorize_access_token(request)
+        userinfo = token.get("userinfo") or await client.userinfo(token=token)
         
-        # Check if user exists
-        user = db.query(models.User).filter(models.User.email == email).first()
-        if user:
-            return user
-        
-        # Create new user
-        username = userinfo.get("name", email.split("@")[0])
-        # Ensure unique username
-        base_username = username
-        counter = 1
-        while db.query(models.User).filter(models.User.username == username).first():
-            username = f"{base_username}{counter}"
-            counter += 1
-        
-        user = models.User(
-            email=email,
-            username=username,
-            oauth_provider=provider,
-            oauth_id=userinfo.get("sub"),
-            profile_picture=userinfo.get("picture"),
-            is_active=True
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-        return user
-        
+        return await upsert_oauth_user(db, provider, userinfo)
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"OAuth error: {str(e)}")
         raise HTTPException(
@@ -111,7 +241,7 @@ async def get_oauth_login_url(provider: str, request: Request) -> Dict[str, str]
         Dictionary containing the authorization URL
     """
     try:
-        client = oauth.create_client(provider)
+        client = get_oauth().create_client(provider)
         if not client:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
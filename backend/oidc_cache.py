@@ -0,0 +1,217 @@
+"""
+Cache of OpenID Connect discovery metadata and signing keys (JWKS).
+
+Each provider's discovery document and key set are fetched together and
+kept for ``OIDC_CACHE_TTL`` seconds. Past ``OIDC_REFRESH_AFTER`` of that
+TTL the cached entry is still served while a background task refetches
+it, so requests only wait on the identity provider when a worker has
+nothing usable. If the provider is down, an expired entry keeps being
+served.
+
+Entries are also written to Redis, so a restarted worker (or a new one)
+starts from the shared copy instead of the network. A token signed with an
+unknown key id triggers a refetch of the key set, at most once per
+``OIDC_JWKS_MIN_REFRESH_SECONDS`` per provider so forged tokens cannot
+make us hammer the provider.
+"""
+from typing import Dict, NamedTuple, Optional, Set
+from redis.exceptions import RedisError
+import asyncio
+import httpx
+import json
+import logging
+import os
+import time
+import redis_config
+
+logger = logging.getLogger(__name__)
+
+OIDC_CACHE_TTL = float(os.getenv("OIDC_CACHE_TTL", "3600"))
+OIDC_REFRESH_AFTER = float(os.getenv("OIDC_REFRESH_AFTER", "0.75"))
+OIDC_JWKS_MIN_REFRESH_SECONDS = float(os.getenv("OIDC_JWKS_MIN_REFRESH_SECONDS", "30"))
+OIDC_FETCH_TIMEOUT = float(os.getenv("OIDC_FETCH_TIMEOUT", "5"))
+
+
+class ProviderEntry(NamedTuple):
+    """Discovery metadata and key set of one provider, as of ``fetched_at`` (epoch seconds)."""
+    metadata: dict
+    jwks: dict
+    fetched_at: float
+
+
+def _key(provider: str) -> str:
+    return f"oidc:{provider}"
+
+
+class ProviderCache:
+    """
+    Per-process cache of provider entries, backed by Redis.
+
+    Args:
+        ttl: Seconds an entry is used before it must be refetched
+        refresh_after: Fraction of ``ttl`` after which entries are refreshed in the background
+        min_jwks_refresh: Minimum seconds between forced key set refetches per provider
+        fetch_timeout: Timeout for each request to a provider
+    """
+
+    def __init__(
+        self,
+        ttl: float = OIDC_CACHE_TTL,
+        refresh_after: float = OIDC_REFRESH_AFTER,
+        min_jwks_refresh: float = OIDC_JWKS_MIN_REFRESH_SECONDS,
+        fetch_timeout: float = OIDC_FETCH_TIMEOUT
+    ):
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self.min_jwks_refresh = min_jwks_refresh
+        self.fetch_timeout = fetch_timeout
+        self._entries: Dict[str, ProviderEntry] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._jwks_refreshed_at: Dict[str, float] = {}
+        self._refresh_tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.store_loads = 0
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    async def get(self, provider: str, metadata_url: str) -> ProviderEntry:
+        """Return the entry for ``provider``, loading or fetching it if needed."""
+        entry = self._entries.get(provider)
+        if entry is not None:
+            age = time.time() - entry.fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                if age >= self.ttl * self.refresh_after:
+                    self._refresh_in_background(provider, metadata_url)
+                return entry
+        return await self._load(provider, metadata_url)
+
+    async def refresh_jwks(self, provider: str, metadata_url: str) -> dict:
+        """
+        Refetch the key set after a token named a key id we do not have.
+        Rate limited per provider; within the limit the cached set is returned.
+        """
+        entry = await self.get(provider, metadata_url)
+        now = time.monotonic()
+        if now - self._jwks_refreshed_at.get(provider, float("-inf")) < self.min_jwks_refresh:
+            return entry.jwks
+        self._jwks_refreshed_at[provider] = now
+        async with self._lock(provider):
+            try:
+                async with self._client() as client:
+                    jwks = await self._fetch_jwks(client, entry.metadata)
+            except Exception as e:
+                self.fetch_errors += 1
+                logger.warning(f"Refetching signing keys for {provider} failed: {str(e)}")
+                return entry.jwks
+            entry = entry._replace(jwks=jwks)
+            self._entries[provider] = entry
+            await self._save(provider, entry)
+        logger.info(f"Refetched signing keys for {provider} after an unknown key id")
+        return jwks
+
+    def stats(self) -> dict:
+        return {
+            "providers": sorted(self._entries),
+            "hits": self.hits,
+            "store_loads": self.store_loads,
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+        }
+
+    def _lock(self, provider: str) -> asyncio.Lock:
+        lock = self._locks.get(provider)
+        if lock is None:
+            lock = self._locks[provider] = asyncio.Lock()
+        return lock
+
+    def _client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(timeout=self.fetch_timeout)
+
+    async def _load(self, provider: str, metadata_url: str) -> ProviderEntry:
+        # One fetch per provider at a time; waiters reuse its result
+        async with self._lock(provider):
+            entry = self._entries.get(provider)
+            if entry is not None and time.time() - entry.fetched_at < self.ttl:
+                return entry
+            stored = await self._read(provider)
+            if stored is not None and time.time() - stored.fetched_at < self.ttl:
+                self.store_loads += 1
+                self._entries[provider] = stored
+                return stored
+            stale = entry or stored
+            try:
+                entry = await self._fetch(metadata_url)
+            except Exception as e:
+                self.fetch_errors += 1
+                if stale is None:
+                    raise
+                logger.warning(f"Fetching OIDC metadata for {provider} failed, using the cached copy: {str(e)}")
+                # Keep serving it without waiting; retries happen in the background
+                stale = stale._replace(fetched_at=time.time() - self.ttl * self.refresh_after)
+                self._entries[provider] = stale
+                return stale
+            self._entries[provider] = entry
+            await self._save(provider, entry)
+            return entry
+
+    def _refresh_in_background(self, provider: str, metadata_url: str) -> None:
+        if self._lock(provider).locked():
+            return
+        task = asyncio.create_task(self._refresh(provider, metadata_url))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    async def _refresh(self, provider: str, metadata_url: str) -> None:
+        async with self._lock(provider):
+            entry = self._entries.get(provider)
+            if entry is not None and time.time() - entry.fetched_at < self.ttl * self.refresh_after:
+                return
+            try:
+                entry = await self._fetch(metadata_url)
+            except Exception as e:
+                self.fetch_errors += 1
+                logger.warning(f"Background refresh of OIDC metadata for {provider} failed: {str(e)}")
+                return
+            self._entries[provider] = entry
+            await self._save(provider, entry)
+
+    async def _fetch(self, metadata_url: str) -> ProviderEntry:
+        self.fetches += 1
+        async with self._client() as client:
+            response = await client.get(metadata_url)
+            response.raise_for_status()
+            metadata = response.json()
+            jwks = await self._fetch_jwks(client, metadata)
+        return ProviderEntry(metadata=metadata, jwks=jwks, fetched_at=time.time())
+
+    async def _fetch_jwks(self, client: httpx.AsyncClient, metadata: dict) -> dict:
+        jwks_uri = metadata.get("jwks_uri")
+        if not jwks_uri:
+            return {}
+        response = await client.get(jwks_uri)
+        response.raise_for_status()
+        return response.json()
+
+    async def _read(self, provider: str) -> Optional[ProviderEntry]:
+        try:
+            raw = await redis_config.get_redis_client().get(_key(provider))
+        except RedisError as e:
+            logger.warning(f"Could not read cached OIDC metadata for {provider}: {str(e)}")
+            return None
+        if not raw:
+            return None
+        try:
+            data = json.loads(raw)
+            return ProviderEntry(metadata=data["metadata"], jwks=data["jwks"], fetched_at=float(data["fetched_at"]))
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    async def _save(self, provider: str, entry: ProviderEntry) -> None:
+        try:
+            await redis_config.get_redis_client().set(_key(provider), json.dumps(entry._asdict()), px=int(self.ttl * 1000))
+        except RedisError as e:
+            logger.warning(f"Could not store OIDC metadata for {provider}: {str(e)}")
+
+
+provider_cache = ProviderCache()
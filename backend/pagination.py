@@ -0,0 +1,99 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``OFFSET``, each page continues from the sort key of the last row
+of the previous page with a row-value comparison such as
+``(created_at, id) > (:created_at, :id)``. With an index on the sort key the
+database seeks straight to the start of the page, so page 10,000 costs the
+same as page 1. Cursors are opaque to clients: base64url-encoded JSON of the
+last row's sort values.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+import json
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort values of a row as an opaque cursor."""
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Decode a cursor produced by ``encode_cursor``; raises 400 if it is malformed."""
+    try:
+        raw = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != size:
+            raise ValueError("cursor has the wrong shape")
+        return [
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in payload
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def page_query(
+    stmt: Select,
+    sort_columns: Sequence[Any],
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    descending: bool = False
+) -> Select:
+    """The statement ``paginate`` runs: ``stmt`` ordered and cut to one page plus one row."""
+    key = tuple_(*sort_columns)
+    if cursor:
+        after = tuple_(*decode_cursor(cursor, len(sort_columns)))
+        stmt = stmt.where(key < after if descending else key > after)
+    order = [column.desc() if descending else column.asc() for column in sort_columns]
+    return stmt.order_by(*order).limit(limit + 1)
+
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    sort_columns: Sequence[Any],
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    descending: bool = False
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Fetch one page of ``stmt`` ordered by ``sort_columns``.
+
+    ``sort_columns`` must end in a unique column (usually the primary key)
+    so the order is total. ``stmt`` should select a single ORM entity whose
+    attributes include the sort columns. Returns the rows and the cursor for
+    the next page, or None on the last page.
+
+    Args:
+        db: Database session
+        stmt: Select statement with any filters already applied
+        sort_columns: Columns defining the page order, e.g. (Model.created_at, Model.id)
+        cursor: Cursor returned with the previous page
+        limit: Page size
+        descending: Page from newest to oldest instead
+    """
+    result = await db.execute(page_query(stmt, sort_columns, cursor, limit, descending))
+    rows = result.scalars().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in sort_columns])
+    return rows, next_cursor
@@ -0,0 +1,90 @@
+"""
+Monthly range partitions for ``habit_completions``.
+
+Partitioning is optional (see migrations/partition_habit_completions.py).
+Once the table is partitioned, ``ensure_completion_partitions`` must keep
+partitions ahead of the calendar; it runs at app startup and from
+run_migrations.py, and can be scheduled on its own with
+``python partitions.py``. Rows outside every monthly range land in a
+default partition, so an insert never fails for lack of a partition.
+"""
+from datetime import date, datetime, timezone
+from typing import Optional
+from sqlalchemy.sql import text
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# How many months beyond the current one to keep partitions for
+COMPLETION_PARTITION_MONTHS_AHEAD = int(os.getenv("COMPLETION_PARTITION_MONTHS_AHEAD", "3"))
+
+# Serialises partition creation across workers starting at the same time
+_PARTITION_LOCK_ID = 7_310_001
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"habit_completions_y{month.year}m{month.month:02d}"
+
+
+def is_partitioned(connection) -> bool:
+    """Return True if habit_completions is a partitioned table."""
+    relkind = connection.execute(text("""
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'habit_completions' AND n.nspname = current_schema()
+    """)).scalar()
+    return relkind == "p"
+
+
+def create_month_partition(connection, month: date) -> None:
+    """Create the partition holding ``month`` if it does not exist yet."""
+    start = month.replace(day=1)
+    end = _add_months(start, 1)
+    connection.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(start)}
+        PARTITION OF habit_completions
+        FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')
+    """))
+
+
+def ensure_completion_partitions(
+    connection,
+    months_ahead: int = COMPLETION_PARTITION_MONTHS_AHEAD,
+    start: Optional[date] = None
+) -> int:
+    """
+    Create monthly partitions from ``start`` (default: this month) through
+    ``months_ahead`` months from now. Does nothing if the table is not
+    partitioned. Returns the number of months checked.
+    """
+    if not is_partitioned(connection):
+        return 0
+    connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": _PARTITION_LOCK_ID})
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    month = (start or this_month).replace(day=1)
+    last = _add_months(this_month, months_ahead)
+    checked = 0
+    while month <= last:
+        create_month_partition(connection, month)
+        month = _add_months(month, 1)
+        checked += 1
+    logger.debug(f"Ensured habit_completions partitions through {last.isoformat()}")
+    return checked
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    with engine.begin() as connection:
+        checked = ensure_completion_partitions(connection)
+    print(f"Checked {checked} monthly partitions")
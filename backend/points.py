@@ -0,0 +1,279 @@
+"""
+Points balances and the points ledger.
+
+Every change to a user's points is an append-only ``points_ledger`` entry.
+``User.points`` caches the sum of a user's entries: both are written by one
+statement (an ``UPDATE ... RETURNING`` feeding an ``INSERT`` through a CTE),
+so a balance can never move without its entry, and concurrent awards never
+overwrite each other. ``reconcile_balances`` checks the cache against the
+ledger in chunks:
+
+    python points.py reconcile [--fix]
+    python points.py bonus --delta 50 --reason nightly_bonus
+"""
+from typing import Optional
+from sqlalchemy import event, func, literal, select, true, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from principal_cache import principal_cache
+import badges
+import leaderboard
+import models
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Points earned for each recorded habit completion
+POINTS_PER_COMPLETION = int(os.getenv("POINTS_PER_COMPLETION", "10"))
+# Users locked and checked per transaction by reconcile_balances
+POINTS_RECONCILE_CHUNK_SIZE = int(os.getenv("POINTS_RECONCILE_CHUNK_SIZE", "1000"))
+
+# Session.info key for leaderboard updates waiting on the commit
+_PENDING_SCORES = "pending_leaderboard_updates"
+# Keeps publishing tasks referenced until they finish
+_publishing = set()
+
+
+def _award_statement(condition, delta: int, reason: str, category: Optional[models.HabitCategory]):
+    """
+    Add ``delta`` to every user matching ``condition`` and append their
+    ledger entries; selects the id and new balance of each user changed.
+    """
+    awarded = (
+        update(models.User)
+        .where(condition)
+        .values(points=func.coalesce(models.User.points, 0) + delta)
+        .returning(models.User.id, models.User.points)
+        .cte("awarded")
+    )
+    entries = (
+        insert(models.PointsLedger)
+        .from_select(
+            ["user_id", "delta", "reason", "category"],
+            select(
+                awarded.c.id,
+                literal(delta),
+                literal(reason),
+                literal(category, models.PointsLedger.category.type)
+            )
+        )
+        .cte("entries")
+    )
+    return select(awarded.c.id, awarded.c.points).add_cte(entries)
+
+
+def _queue_scores(db: AsyncSession, user_ids, delta: int, category: Optional[models.HabitCategory]) -> None:
+    boards = leaderboard.boards_for_award(delta, category)
+    db.info.setdefault(_PENDING_SCORES, []).extend(
+        (board, user_id, delta) for user_id in user_ids for board in boards
+    )
+
+
+async def award_points(
+    db: AsyncSession,
+    user_id: int,
+    delta: int,
+    category: Optional[models.HabitCategory] = None,
+    reason: str = "completion"
+) -> None:
+    """
+    Add ``delta`` points to a user and record it in the ledger.
+
+    One statement updates the balance with ``points = points + delta`` and
+    appends the ledger entry. The caller commits; the leaderboards are
+    updated once the commit succeeds.
+
+    Args:
+        db: Database session
+        user_id: User receiving the points
+        delta: Points to add (negative to spend)
+        category: Category of the habit that earned the points, if any
+        reason: Why the points changed, stored on the ledger entry
+    """
+    if delta == 0:
+        return
+    await db.execute(_award_statement(models.User.id == user_id, delta, reason, category))
+    principal_cache.invalidate_user(user_id)
+    _queue_scores(db, [user_id], delta, category)
+    if delta > 0:
+        await badges.dispatch(db, badges.BadgeEvent(
+            badges.POINTS_CHANGED, user_id, increments={"points_earned": delta}
+        ))
+
+
+async def spend_points(db: AsyncSession, user_id: int, amount: int, reason: str) -> Optional[int]:
+    """
+    Deduct ``amount`` points only if the user has at least that many.
+
+    The balance check and the deduction are one conditional UPDATE, so two
+    concurrent spends can never both succeed against the same points. The
+    caller commits.
+
+    Returns:
+        The new balance, or None if the balance was insufficient
+    """
+    result = await db.execute(_award_statement(
+        (models.User.id == user_id) & (func.coalesce(models.User.points, 0) >= amount),
+        -amount, reason, None
+    ))
+    row = result.first()
+    if row is None:
+        return None
+    principal_cache.invalidate_user(user_id)
+    if amount:
+        _queue_scores(db, [user_id], -amount, None)
+    return row.points
+
+
+async def award_points_bulk(
+    db: AsyncSession,
+    delta: int,
+    reason: str,
+    condition=None
+) -> int:
+    """
+    Award ``delta`` points to every user matching ``condition`` in one statement.
+
+    Meant for set-based grants such as a nightly bonus; the database does
+    the work, however many users match. The caller commits.
+
+    Args:
+        db: Database session
+        delta: Points for each user
+        reason: Stored on every ledger entry
+        condition: SQL expression over ``models.User`` (default: every user)
+
+    Returns:
+        Number of users awarded
+    """
+    if delta == 0:
+        return 0
+    result = await db.execute(_award_statement(
+        condition if condition is not None else true(), delta, reason, None
+    ))
+    user_ids = [user_id for user_id, _ in result.all()]
+    principal_cache.clear()
+    _queue_scores(db, user_ids, delta, None)
+    if delta > 0:
+        await badges.dispatch_bulk(db, badges.POINTS_CHANGED, user_ids, {"points_earned": delta})
+    logger.info(f"Awarded {delta} points to {len(user_ids)} users ({reason})")
+    return len(user_ids)
+
+
+async def _publish(updates: list) -> None:
+    try:
+        await leaderboard.apply_updates(updates)
+    except Exception as e:
+        # The boards are a mirror; rebuild_leaderboards repairs them
+        logger.warning(f"Failed to update leaderboards: {str(e)}")
+
+
+async def wait_for_publishing() -> None:
+    """Wait for queued leaderboard updates; for scripts about to exit."""
+    if _publishing:
+        await asyncio.gather(*_publishing, return_exceptions=True)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed_scores(session: Session) -> None:
+    """Push the points awarded in a committed transaction to the leaderboards."""
+    updates = session.info.pop(_PENDING_SCORES, None)
+    if not updates:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        logger.warning("No event loop to update leaderboards from; run leaderboard.py to resync")
+        return
+    task = loop.create_task(_publish(updates))
+    _publishing.add(task)
+    task.add_done_callback(_publishing.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_scores(session: Session) -> None:
+    session.info.pop(_PENDING_SCORES, None)
+
+
+def reconcile_balances(chunk_size: int = POINTS_RECONCILE_CHUNK_SIZE, fix: bool = False) -> int:
+    """
+    Compare every ``User.points`` with the sum of the user's ledger entries.
+
+    Users are processed in id order, ``chunk_size`` per transaction. Each
+    chunk's user rows are locked first, so no award can land between
+    reading the balances and the ledger. With ``fix`` the balance is reset
+    to the ledger sum, which is authoritative. Returns the number of
+    mismatched balances found.
+    """
+    from database import engine
+
+    ledger_total = (
+        select(models.PointsLedger.user_id, func.sum(models.PointsLedger.delta).label("total"))
+        .group_by(models.PointsLedger.user_id)
+        .subquery()
+    )
+    mismatched = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            balances = dict(connection.execute(
+                select(models.User.id, func.coalesce(models.User.points, 0))
+                .where(models.User.id > last_id)
+                .order_by(models.User.id)
+                .limit(chunk_size)
+                .with_for_update()
+            ).all())
+            if not balances:
+                break
+            last_id = max(balances)
+
+            totals = dict(connection.execute(
+                select(ledger_total.c.user_id, ledger_total.c.total)
+                .where(ledger_total.c.user_id.in_(list(balances)))
+            ).all())
+            for user_id, balance in balances.items():
+                expected = totals.get(user_id) or 0
+                if balance == expected:
+                    continue
+                mismatched += 1
+                logger.warning(f"User {user_id} has {balance} points but the ledger sums to {expected}")
+                if fix:
+                    connection.execute(
+                        update(models.User).where(models.User.id == user_id).values(points=expected)
+                    )
+    logger.info(f"Reconciled balances up to user {last_id}: {mismatched} mismatched")
+    return mismatched
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(description="Points ledger maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reconcile = commands.add_parser("reconcile", help="Check balances against the ledger")
+    reconcile.add_argument("--fix", action="store_true", help="Reset mismatched balances to the ledger sum")
+    reconcile.add_argument("--chunk-size", type=int, default=POINTS_RECONCILE_CHUNK_SIZE)
+    bonus = commands.add_parser("bonus", help="Award points to every active user")
+    bonus.add_argument("--delta", type=int, required=True)
+    bonus.add_argument("--reason", default="bonus")
+    args = parser.parse_args()
+
+    if args.command == "reconcile":
+        reconcile_balances(args.chunk_size, args.fix)
+    else:
+        async def grant_bonus():
+            from database import AsyncSessionLocal, async_engine
+            async with AsyncSessionLocal() as db:
+                await award_points_bulk(db, args.delta, args.reason, models.User.is_active.is_(True))
+                await db.commit()
+            await wait_for_publishing()
+            await async_engine.dispose()
+
+        asyncio.run(grant_bonus())
@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+import models
+import threading
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+
+def _detached_copy(user: models.User) -> models.User:
+    """Copy a loaded User's column values into a detached instance."""
+    values = {
+        attr.key: getattr(user, attr.key)
+        for attr in inspect(models.User).column_attrs
+    }
+    snapshot = models.User(**values)
+    make_transient_to_detached(snapshot)
+    return snapshot
+
+
+class PrincipalCache:
+    """
+    In-process cache of authenticated users keyed by access token.
+
+    Entries live for at most ``ttl_seconds`` and never outlive the token's
+    ``exp`` claim. Cached users are detached snapshots; callers attach them to
+    their own session with ``Session.merge(user, load=False)``, which does not
+    emit SQL. Invalidation is per process, so ``ttl_seconds`` bounds how long
+    other workers can serve a stale user after an update.
+
+    Args:
+        max_entries: Maximum number of cached tokens (least recently used are evicted)
+        ttl_seconds: Upper bound on the lifetime of an entry
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, int, models.User]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[models.User]:
+        """Return the cached user for ``token``, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user_id, user = entry
+            if expires_at <= now:
+                self._remove(token, user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def put(self, token: str, user: models.User, token_exp: Optional[float]) -> None:
+        """Cache ``user`` for ``token`` until the TTL or the token's expiry, whichever is first."""
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - datetime.now(timezone.utc).timestamp())
+        if ttl <= 0:
+            return
+        snapshot = _detached_copy(user)
+        with self._lock:
+            old = self._entries.get(token)
+            if old is not None:
+                self._remove(token, old[1])
+            self._entries[token] = (time.monotonic() + ttl, user.id, snapshot)
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                oldest, (_, oldest_user_id, _) = next(iter(self._entries.items()))
+                self._remove(oldest, oldest_user_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every cached token belonging to ``user_id``."""
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, set()):
+                self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. after a bulk update to the users table."""
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _remove(self, token: str, user_id: int) -> None:
+        self._entries.pop(token, None)
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+principal_cache = PrincipalCache(
+    max_entries=PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS
+)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: models.User) -> None:
+    """Evict a user whenever the ORM writes a change to their row."""
+    logger.debug(f"Invalidating cached principal for user id {target.id}")
+    principal_cache.invalidate_user(target.id)
@@ -1,60 +1,408 @@
-import redis
-from typing import Optional
+import redis.asyncio as redis
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
 from functools import wraps
-from fastapi import HTTPException, Request, status
-import time
+from fastapi import HTTPException, Request, Response, status
+from circuit_breaker import CircuitBreaker
+import metrics
+import inspect
+import logging
+import math
 import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Redis connection settings. Timeouts are deliberately short: the rate
+# limiter falls back to local limiting rather than waiting on a slow Redis.
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.25"))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.25"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "0.1"))
+
+# Rate limiter tiers
+# Fraction of a limit leased from Redis at once and spent locally
+RATE_LIMIT_LEASE_FRACTION = float(os.getenv("RATE_LIMIT_LEASE_FRACTION", "0.1"))
+# Fraction of a limit each process allows on its own while Redis is unavailable
+RATE_LIMIT_FALLBACK_SHARE = float(os.getenv("RATE_LIMIT_FALLBACK_SHARE", "1.0"))
+RATE_LIMIT_LOCAL_MAX_KEYS = int(os.getenv("RATE_LIMIT_LOCAL_MAX_KEYS", "10000"))
+RATE_LIMIT_BREAKER_FAILURES = int(os.getenv("RATE_LIMIT_BREAKER_FAILURES", "5"))
+RATE_LIMIT_BREAKER_SLOW_MS = float(os.getenv("RATE_LIMIT_BREAKER_SLOW_MS", "100"))
+RATE_LIMIT_BREAKER_RESET_SECONDS = float(os.getenv("RATE_LIMIT_BREAKER_RESET_SECONDS", "10"))
+
+# Redis connection, created on first use so importing this module never
+# touches the network (see ``get_redis_client``)
+redis_client: Optional[redis.Redis] = None
+
+# Generic cell rate algorithm (GCRA), evaluated atomically on the server.
+#
+# The key holds the "theoretical arrival time" (TAT) in milliseconds. Each
+# request pushes the TAT forward by one emission interval (period / limit);
+# a request is allowed while the TAT stays within one period of now, which
+# permits bursts of up to `limit` requests and then a steady refill.
+# Uses the Redis server clock so app hosts never need synchronised clocks.
+# Requests for several tokens are granted partially when fewer are left,
+# which lets a process lease a batch of tokens in one call.
+#
+# KEYS[1] - rate limit key
+# ARGV[1] - emission interval in milliseconds
+# ARGV[2] - period in milliseconds
+# ARGV[3] - number of tokens requested
+#
+# Returns {granted, remaining, retry_after_ms, reset_after_ms}
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local tat = redis.call('GET', KEYS[1])
+if tat then
+    tat = math.max(tonumber(tat), now)
+else
+    tat = now
+end
+
+local available = math.floor((period - (tat - now)) / interval + 1e-9)
+local granted = math.min(cost, available)
+if granted < 1 then
+    return {0, 0, math.ceil(tat + interval - period - now), math.ceil(tat - now)}
+end
+
+local new_tat = tat + interval * granted
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {granted, available - granted, 0, math.ceil(new_tat - now)}
+"""
+
+# Registered against the shared client on first use
+gcra_script = None
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of a single rate limit check."""
+    allowed: bool
+    limit: int
+    period: int
+    remaining: int
+    retry_after: float
+    reset_after: float
+    granted: int = 1
+
+    def headers(self) -> Dict[str, str]:
+        """Standard RateLimit-* headers, plus Retry-After when rejected."""
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(max(self.remaining, 0)),
+            "RateLimit-Reset": str(math.ceil(self.reset_after)),
+            "RateLimit-Policy": f"{self.limit};w={self.period}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(math.ceil(self.retry_after), 1))
+        return headers
+
+
+async def check_rate_limit(
+    key: str,
+    limit: int,
+    period: int = 60,
+    cost: int = 1,
+    client: Optional[redis.Redis] = None
+) -> RateLimitResult:
+    """
+    Check and record a request against a GCRA limit in one round trip.
+
+    Args:
+        key: Redis key identifying the limited client
+        limit: Requests allowed per period (also the maximum burst)
+        period: Window length in seconds
+        cost: Number of tokens wanted; fewer may be granted
+        client: Redis client to use instead of the module default
+    """
+    script = _default_gcra_script() if client is None else client.register_script(GCRA_SCRIPT)
+    period_ms = period * 1000
+    granted, remaining, retry_after_ms, reset_after_ms = await script(
+        keys=[key],
+        args=[period_ms / limit, period_ms, cost]
+    )
+    return RateLimitResult(
+        allowed=int(granted) > 0,
+        limit=limit,
+        period=period,
+        remaining=int(remaining),
+        retry_after=int(retry_after_ms) / 1000,
+        reset_after=int(reset_after_ms) / 1000,
+        granted=int(granted)
+    )
+
+
+class LocalTokenBucket:
+    """
+    Per-process token bucket, used while Redis is unavailable.
+
+    Args:
+        capacity: Maximum burst
+        period: Seconds to refill the bucket from empty
+    """
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.refill_rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def take(self, limit: int, period: int) -> RateLimitResult:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+        allowed = self.tokens >= 1
+        if allowed:
+            self.tokens -= 1
+        return RateLimitResult(
+            allowed=allowed,
+            limit=limit,
+            period=period,
+            remaining=int(self.tokens),
+            retry_after=0 if allowed else (1 - self.tokens) / self.refill_rate,
+            reset_after=(self.capacity - self.tokens) / self.refill_rate
+        )
+
+
+class _Lease:
+    """Tokens leased from Redis and spent locally until they run out or expire."""
+
+    __slots__ = ("tokens", "expires_at", "redis_remaining", "reset_at")
+
+    def __init__(self, tokens: int, expires_at: float, redis_remaining: int, reset_at: float):
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.redis_remaining = redis_remaining
+        self.reset_at = reset_at
 
-# Redis connection
-redis_client = redis.Redis.from_url(
-    os.getenv("REDIS_URL", "redis://localhost:6379/0"),
-    decode_responses=True
+
+class TwoTierRateLimiter:
+    """
+    Rate limiter answering most checks in-process and syncing with Redis in batches.
+
+    Each process leases a batch of tokens (``lease_fraction`` of the limit)
+    from the shared GCRA state in one call and spends them locally, so only
+    one check in every batch touches Redis. Small limits lease one token at a
+    time and therefore stay exact. Redis calls go through a circuit breaker;
+    while it is open, or when a call fails, each process enforces
+    ``fallback_share`` of the limit on its own with a local token bucket.
+
+    Args:
+        breaker: Circuit breaker guarding Redis
+        lease_fraction: Fraction of the limit leased per Redis call
+        fallback_share: Fraction of the limit a process allows on its own
+        max_keys: Maximum number of clients tracked locally
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        lease_fraction: float,
+        fallback_share: float,
+        max_keys: int
+    ):
+        self.breaker = breaker
+        self.lease_fraction = lease_fraction
+        self.fallback_share = fallback_share
+        self.max_keys = max_keys
+        self._leases: "OrderedDict[str, _Lease]" = OrderedDict()
+        self._fallback: "OrderedDict[str, LocalTokenBucket]" = OrderedDict()
+        self.local_hits = 0
+        self.redis_checks = 0
+        self.fallback_checks = 0
+
+    def _remember(self, table: OrderedDict, key: str, value) -> None:
+        table[key] = value
+        table.move_to_end(key)
+        while len(table) > self.max_keys:
+            table.popitem(last=False)
+
+    def _lease_size(self, limit: int) -> int:
+        return max(1, int(limit * self.lease_fraction))
+
+    def _check_fallback(self, key: str, limit: int, period: int) -> RateLimitResult:
+        self.fallback_checks += 1
+        metrics.rate_limit_fallback_checks_total.inc()
+        bucket = self._fallback.get(key)
+        if bucket is None:
+            capacity = max(1, int(limit * self.fallback_share))
+            bucket = LocalTokenBucket(capacity, period)
+        self._remember(self._fallback, key, bucket)
+        return bucket.take(limit, period)
+
+    async def check(self, key: str, limit: int, period: int = 60) -> RateLimitResult:
+        """Check and record one request for ``key``."""
+        now = time.monotonic()
+        lease = self._leases.get(key)
+        if lease is not None and lease.tokens > 0 and lease.expires_at > now:
+            lease.tokens -= 1
+            self._leases.move_to_end(key)
+            self.local_hits += 1
+            return RateLimitResult(
+                allowed=True,
+                limit=limit,
+                period=period,
+                remaining=lease.redis_remaining + lease.tokens,
+                retry_after=0,
+                reset_after=max(lease.reset_at - now, 0)
+            )
+
+        if not self.breaker.allow():
+            return self._check_fallback(key, limit, period)
+
+        lease_size = self._lease_size(limit)
+        start = time.perf_counter()
+        try:
+            result = await check_rate_limit(key, limit, period, cost=lease_size)
+        except Exception as e:
+            self.breaker.record_failure()
+            metrics.redis_command_errors_total.inc("rate_limit")
+            logger.warning(f"Rate limit check against Redis failed, using local limit: {str(e)}")
+            return self._check_fallback(key, limit, period)
+        elapsed = time.perf_counter() - start
+        self.breaker.record_success(elapsed)
+        metrics.redis_command_seconds.observe(elapsed, "rate_limit")
+        self.redis_checks += 1
+
+        if result.allowed:
+            # Leased tokens are valid for as long as they took to accrue
+            lease_seconds = max(1.0, result.granted * period / limit)
+            self._remember(self._leases, key, _Lease(
+                tokens=result.granted - 1,
+                expires_at=now + lease_seconds,
+                redis_remaining=result.remaining,
+                reset_at=now + result.reset_after
+            ))
+            return result._replace(remaining=result.remaining + result.granted - 1)
+        self._leases.pop(key, None)
+        return result
+
+    def stats(self) -> Dict[str, object]:
+        """Counters for the local tier, the fallback and the Redis breaker."""
+        return {
+            "local_hits": self.local_hits,
+            "redis_checks": self.redis_checks,
+            "fallback_checks": self.fallback_checks,
+            "fallback_active": self.breaker.state != CircuitBreaker.CLOSED,
+            "tracked_keys": len(self._leases) + len(self._fallback),
+            "breaker": self.breaker.stats(),
+        }
+
+
+rate_limiter = TwoTierRateLimiter(
+    breaker=CircuitBreaker(
+        name="redis_rate_limit",
+        failure_threshold=RATE_LIMIT_BREAKER_FAILURES,
+        slow_call_seconds=RATE_LIMIT_BREAKER_SLOW_MS / 1000,
+        reset_timeout=RATE_LIMIT_BREAKER_RESET_SECONDS
+    ),
+    lease_fraction=RATE_LIMIT_LEASE_FRACTION,
+    fallback_share=RATE_LIMIT_FALLBACK_SHARE,
+    max_keys=RATE_LIMIT_LOCAL_MAX_KEYS
 )
 
+
+def _client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
 def rate_limit(
     requests_per_minute: int = 60,
     key_prefix: str = "rate_limit"
 ) -> callable:
     """
-    Rate limiting decorator using Redis.
-    
+    Rate limiting decorator using Redis, with a local fallback.
+
+    Works on any FastAPI endpoint: ``request`` and ``response`` parameters are
+    injected when the endpoint does not declare them. Allowed responses carry
+    RateLimit-* headers, also when the endpoint returns its own ``Response``;
+    rejected ones raise 429 with Retry-After.
+
     Args:
         requests_per_minute: Maximum number of requests allowed per minute
         key_prefix: Prefix for the Redis key
     """
     def decorator(func: callable) -> callable:
+        signature = inspect.signature(func)
+        wants_request = "request" in signature.parameters
+        wants_response = "response" in signature.parameters
+        extra_params = []
+        if not wants_request:
+            extra_params.append(inspect.Parameter(
+                "request", inspect.Parameter.KEYWORD_ONLY, annotation=Request
+            ))
+        if not wants_response:
+            extra_params.append(inspect.Parameter(
+                "response", inspect.Parameter.KEYWORD_ONLY, annotation=Response
+            ))
+
         @wraps(func)
-        async def wrapper(request: Request, *args, **kwargs):
-            # Get client IP
-            client_ip = request.client.host
-            
+        async def wrapper(*args, **kwargs):
+            request = kwargs["request"] if wants_request else kwargs.pop("request")
+            response = kwargs["response"] if wants_response else kwargs.pop("response")
+
             # Create Redis key
-            key = f"{key_prefix}:{client_ip}"
-            
-            # Get current timestamp
-            current_time = int(time.time())
-            
-            # Get existing requests
-            pipe = redis_client.pipeline()
-            pipe.zremrangebyscore(key, 0, current_time - 60)  # Remove old requests
-            pipe.zcard(key)  # Count remaining requests
-            pipe.zadd(key, {str(current_time): current_time})  # Add current request
-            pipe.expire(key, 60)  # Set expiry
-            _, request_count, _, _ = pipe.execute()
-            
-            # Check if rate limit exceeded
-            if request_count > requests_per_minute:
+            key = f"{key_prefix}:{_client_ip(request)}"
+
+            result = await rate_limiter.check(key, requests_per_minute)
+            headers = result.headers()
+            if not result.allowed:
+                metrics.rate_limit_rejections_total.inc(key_prefix)
                 raise HTTPException(
                     status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail="Too many requests. Please try again later."
+                    detail="Too many requests. Please try again later.",
+                    headers=headers
                 )
-            
-            return await func(request, *args, **kwargs)
+            response.headers.update(headers)
+
+            result = await func(*args, **kwargs)
+            if isinstance(result, Response):
+                # FastAPI only merges the injected response's headers into
+                # responses it builds itself, not into ones returned directly
+                result.headers.update(headers)
+            return result
+
+        wrapper.__signature__ = signature.replace(
+            parameters=[*signature.parameters.values(), *extra_params]
+        )
         return wrapper
     return decorator
 
 def get_redis_client() -> redis.Redis:
     """
-    Get Redis client instance.
+    Get the shared Redis client, creating its connection pool on first use.
+    Connections are opened by the first command, not here.
     """
-    return redis_client 
\ No newline at end of file
+    global redis_client
+    if redis_client is None:
+        pool = redis.BlockingConnectionPool.from_url(
+            REDIS_URL,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            decode_responses=True
+        )
+        redis_client = redis.Redis(connection_pool=pool)
+    return redis_client
+
+
+def _default_gcra_script():
+    global gcra_script
+    if gcra_script is None:
+        gcra_script = get_redis_client().register_script(GCRA_SCRIPT)
+    return gcra_script
+
+
+async def close_redis_client() -> None:
+    """Close the shared client and its pool; the next use creates new ones."""
+    global redis_client, gcra_script
+    if redis_client is not None:
+        await redis_client.aclose(close_connection_pool=True)
+        redis_client = None
+        gcra_script = None
@@ -0,0 +1,91 @@
+"""
+Reward claiming.
+
+A claim is two conditional UPDATEs in one short transaction: mark the
+reward claimed only if it is still unclaimed, then deduct its cost only if
+the balance covers it (``points.spend_points``). If either condition fails
+the transaction rolls back and the caller gets a 409 naming the reason.
+Nothing is read first and no lock is held across round trips. The reward
+row is picked with ``FOR UPDATE SKIP LOCKED``, so a double-tapped claim
+fails fast with "in progress" instead of queueing behind the first one.
+"""
+from datetime import datetime, timezone
+from typing import Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+import points
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _conflict(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+async def claim_reward(db: AsyncSession, user: models.User, reward_id: int) -> Tuple[models.Reward, int]:
+    """
+    Claim one of ``user``'s rewards and pay for it with points.
+
+    Commits on success and rolls back on any conflict.
+
+    Returns:
+        The claimed reward and the user's new balance
+
+    Raises:
+        HTTPException: 404 if the reward does not exist or is not the user's,
+            409 if it is already claimed, being claimed concurrently, or the
+            user does not have enough points
+    """
+    # Rolling back expires ``user``; keep the id readable without a reload
+    user_id = user.id
+    claimable = (
+        select(models.Reward.id)
+        .where(
+            models.Reward.id == reward_id,
+            models.Reward.user_id == user_id,
+            models.Reward.is_claimed.is_not(True)
+        )
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    try:
+        result = await db.execute(
+            update(models.Reward)
+            .where(models.Reward.id == claimable)
+            .values(is_claimed=True, claimed_at=datetime.now(timezone.utc))
+            .returning(models.Reward)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        reward = result.scalars().first()
+        if reward is None:
+            await db.rollback()
+            existing = await db.execute(
+                select(models.Reward.is_claimed).where(
+                    models.Reward.id == reward_id, models.Reward.user_id == user_id
+                )
+            )
+            is_claimed = existing.scalar_one_or_none()
+            if is_claimed is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Reward not found")
+            if is_claimed:
+                raise _conflict("Reward already claimed")
+            raise _conflict("Reward claim already in progress")
+
+        balance = await points.spend_points(db, user_id, reward.points_required or 0, "reward_claim")
+        if balance is None:
+            await db.rollback()
+            raise _conflict("Not enough points to claim this reward")
+
+        await db.commit()
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error claiming reward {reward_id} for user {user_id}: {str(e)}", exc_info=True)
+        raise
+
+    logger.info(f"User {user_id} claimed reward {reward.id} for {reward.points_required} points")
+    return reward, balance
@@ -0,0 +1,182 @@
+"""
+Daily completion rollups.
+
+``completion_daily_rollup`` holds one counter per (user, local day, habit).
+Every completion write bumps its counter in the same transaction, so the
+statistics endpoints read at most one row per habit per day instead of
+aggregating raw ``habit_completions``. ``rebuild_rollup`` recomputes any
+date range from raw data to repair drift, e.g. after completions were
+deleted or edited by hand:
+
+    python rollups.py --start 2026-01-01 --end 2026-01-31
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import Date, Select, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import CompletionDailyRollup, Habit, HabitCompletion, User
+from streaks import local_date
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Accepted values of the stats ``group_by`` parameter
+GROUPINGS = ("day", "habit", "category")
+
+
+async def record_completions(
+    db: AsyncSession,
+    user: User,
+    completions: Iterable[Tuple[int, datetime]]
+) -> None:
+    """
+    Count ``(habit_id, completed_at)`` pairs into the user's daily rollup.
+
+    One multi-row upsert for all affected days. Rows are written in key
+    order so concurrent writers lock them in the same order.
+    """
+    counts = Counter(
+        (local_date(completed_at, user.timezone), habit_id)
+        for habit_id, completed_at in completions
+    )
+    if not counts:
+        return
+    rows = [
+        {"user_id": user.id, "day": day, "habit_id": habit_id, "completions": count}
+        for (day, habit_id), count in sorted(counts.items())
+    ]
+    stmt = insert(CompletionDailyRollup).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CompletionDailyRollup.user_id, CompletionDailyRollup.day, CompletionDailyRollup.habit_id],
+        set_={
+            "completions": CompletionDailyRollup.completions + stmt.excluded.completions,
+            "updated_at": func.now(),
+        }
+    )
+    await db.execute(stmt)
+
+
+def completion_stats_query(user_id: int, start: date, end: date, group_by: str = "day") -> Tuple[str, Select]:
+    """The grouping field name and statement ``completion_stats`` runs."""
+    total = func.sum(CompletionDailyRollup.completions).label("completions")
+    in_range = (
+        CompletionDailyRollup.user_id == user_id,
+        CompletionDailyRollup.day >= start,
+        CompletionDailyRollup.day <= end,
+    )
+    if group_by == "habit":
+        field, key = "habit_id", CompletionDailyRollup.habit_id
+        stmt = select(key, total).where(*in_range)
+    elif group_by == "category":
+        field, key = "category", Habit.category
+        stmt = select(key, total).join(Habit, Habit.id == CompletionDailyRollup.habit_id).where(*in_range)
+    else:
+        field, key = "day", CompletionDailyRollup.day
+        stmt = select(key, total).where(*in_range)
+    return field, stmt.group_by(key).order_by(key)
+
+
+async def completion_stats(
+    db: AsyncSession,
+    user_id: int,
+    start: date,
+    end: date,
+    group_by: str = "day"
+) -> List[dict]:
+    """
+    Completion counts for ``start``..``end`` (inclusive, user's local days).
+
+    Args:
+        db: Database session
+        user_id: Owner of the completions
+        start: First day of the range
+        end: Last day of the range
+        group_by: One of GROUPINGS
+
+    Returns:
+        One dict per bucket with the grouping key and ``completions``
+    """
+    field, stmt = completion_stats_query(user_id, start, end, group_by)
+    result = await db.execute(stmt)
+    return [{field: value, "completions": count} for value, count in result.all()]
+
+
+def rebuild_rollup(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    user_id: Optional[int] = None
+) -> int:
+    """
+    Recompute rollup rows for ``start``..``end`` from ``habit_completions``.
+
+    Open ends mean all history. The delete and re-insert run in one
+    transaction and the insert overwrites rows a concurrent writer created
+    meanwhile, so it is safe to run while the app is serving traffic.
+    Returns the number of rollup rows written.
+    """
+    from database import engine
+
+    local_day = cast(func.timezone(User.timezone, HabitCompletion.completed_at), Date)
+    source = (
+        select(
+            HabitCompletion.user_id,
+            local_day.label("day"),
+            HabitCompletion.habit_id,
+            func.count().label("completions")
+        )
+        .join(User, User.id == HabitCompletion.user_id)
+        .group_by(HabitCompletion.user_id, local_day, HabitCompletion.habit_id)
+    )
+    stale = delete(CompletionDailyRollup)
+
+    # Local days are at most 14 hours off UTC; the padded bounds on
+    # completed_at keep the scan on the index before the exact day filter
+    if start is not None:
+        source = source.where(
+            HabitCompletion.completed_at >= start - timedelta(days=1),
+            local_day >= start
+        )
+        stale = stale.where(CompletionDailyRollup.day >= start)
+    if end is not None:
+        source = source.where(
+            HabitCompletion.completed_at < end + timedelta(days=2),
+            local_day <= end
+        )
+        stale = stale.where(CompletionDailyRollup.day <= end)
+    if user_id is not None:
+        source = source.where(HabitCompletion.user_id == user_id)
+        stale = stale.where(CompletionDailyRollup.user_id == user_id)
+
+    stmt = insert(CompletionDailyRollup).from_select(
+        ["user_id", "day", "habit_id", "completions"], source
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CompletionDailyRollup.user_id, CompletionDailyRollup.day, CompletionDailyRollup.habit_id],
+        set_={"completions": stmt.excluded.completions, "updated_at": func.now()}
+    )
+
+    with engine.begin() as connection:
+        connection.execute(stale)
+        written = connection.execute(stmt).rowcount
+
+    logger.info(f"Rebuilt {written} rollup rows for {start or 'beginning'}..{end or 'now'}")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(description="Rebuild completion_daily_rollup from raw completions")
+    parser.add_argument("--start", type=date.fromisoformat, help="First local day (default: all history)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Last local day (default: all history)")
+    parser.add_argument("--user-id", type=int)
+    args = parser.parse_args()
+    print("Rebuilding completion rollups...")
+    rebuild_rollup(args.start, args.end, args.user_id)
+    print("Rollups rebuilt successfully!")
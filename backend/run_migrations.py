@@ -1,5 +1,20 @@
 import logging
+from sqlalchemy import inspect
+from database import engine
+import models
 from migrations.add_oauth_columns import run_migration as add_oauth_columns
+from migrations.add_streak_columns import run_migration as add_streak_columns
+from migrations.add_completion_client_ids import run_migration as add_completion_client_ids
+from migrations.add_completion_indexes import run_migration as add_completion_indexes
+from migrations.partition_habit_completions import run_migration as partition_habit_completions
+from migrations.add_pagination_indexes import run_migration as add_pagination_indexes
+from migrations.add_completion_rollup import run_migration as add_completion_rollup
+from migrations.add_points_ledger import run_migration as add_points_ledger
+from migrations.add_badge_rules import run_migration as add_badge_rules
+from migrations.add_reward_indexes import run_migration as add_reward_indexes
+from migrations.add_oauth_user_indexes import run_migration as add_oauth_user_indexes
+from migrations.add_completion_calendar import run_migration as add_completion_calendar
+from migrations.add_consistency_metrics import run_migration as add_consistency_metrics
 
 # Configure logging
 logging.basicConfig(
@@ -8,13 +23,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def create_schema_if_missing():
+    """
+    Create every table from the models on an empty database. The API never
+    creates tables itself; this script is the one place schema changes run.
+    """
+    if inspect(engine).has_table(models.User.__tablename__):
+        return
+    logger.info("Empty database, creating schema from models...")
+    models.Base.metadata.create_all(bind=engine)
+
 def run_all_migrations():
     """Run all database migrations in order."""
     try:
         logger.info("Starting database migrations...")
+        create_schema_if_missing()
         
         # Run migrations in order
         add_oauth_columns()
+        add_streak_columns()
+        add_completion_client_ids()
+        add_completion_indexes()
+        # Opt-in (PARTITION_HABIT_COMPLETIONS); once partitioned, this only
+        # creates partitions for upcoming months
+        partition_habit_completions()
+        add_pagination_indexes()
+        add_completion_rollup()
+        add_points_ledger()
+        add_badge_rules()
+        add_reward_indexes()
+        add_oauth_user_indexes()
+        add_completion_calendar()
+        add_consistency_metrics()
         
         logger.info("All migrations completed successfully")
         
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr, constr
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, conint, conlist, constr, field_validator
+from typing import Generic, Literal, Optional, List, TypeVar
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
 from models import HabitFrequency, HabitCategory
 
 # User Schemas
@@ -10,6 +11,16 @@ class UserBase(BaseModel):
 
 class UserCreate(UserBase):
     password: constr(min_length=8)
+    timezone: str = "UTC"
+
+    @field_validator("timezone")
+    @classmethod
+    def validate_timezone(cls, value: str) -> str:
+        try:
+            ZoneInfo(value)
+        except Exception:
+            raise ValueError("Unknown timezone")
+        return value
 
 class UserLogin(BaseModel):
     username: str
@@ -24,6 +35,7 @@ class User(UserBase):
     oauth_provider: Optional[str] = None
     oauth_id: Optional[str] = None
     profile_picture: Optional[str] = None
+    timezone: str = "UTC"
 
     class Config:
         from_attributes = True
@@ -40,6 +52,7 @@ class HabitBase(BaseModel):
     description: Optional[str] = None
     frequency: HabitFrequency
     category: HabitCategory
+    custom_interval_days: Optional[conint(ge=1, le=365)] = None
 
 class HabitCreate(HabitBase):
     pass
@@ -87,11 +100,30 @@ class HabitCompletion(HabitCompletionBase):
     class Config:
         from_attributes = True
 
+class HabitCompletionSyncItem(HabitCompletionBase):
+    client_id: constr(min_length=1, max_length=64)
+    completed_at: datetime
+
+class HabitCompletionBatch(BaseModel):
+    completions: conlist(HabitCompletionSyncItem, min_length=1, max_length=500)
+
+class HabitCompletionSyncResult(BaseModel):
+    client_id: str
+    status: Literal["created", "duplicate", "rejected"]
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class HabitCompletionBatchResult(BaseModel):
+    results: List[HabitCompletionSyncResult]
+    created: int
+    duplicates: int
+    rejected: int
+
 # Reward Schemas
 class RewardBase(BaseModel):
     title: constr(min_length=1, max_length=100)
     description: Optional[str] = None
-    points_cost: int
+    points_required: conint(ge=0)
 
 class RewardCreate(RewardBase):
     pass
@@ -99,32 +131,105 @@ class RewardCreate(RewardBase):
 class Reward(RewardBase):
     id: int
     user_id: int
-    is_redeemed: bool
-    redeemed_at: Optional[datetime] = None
+    is_claimed: bool
+    claimed_at: Optional[datetime] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class RewardClaim(BaseModel):
+    reward: Reward
+    points: int
+
 # Badge Schemas
 class BadgeBase(BaseModel):
     title: constr(min_length=1, max_length=100)
-    description: str
+    description: Optional[str] = None
     icon: str
-    points_value: int
 
 class BadgeCreate(BadgeBase):
     pass
 
 class Badge(BadgeBase):
     id: int
+    code: Optional[str] = None
+    user_id: int
+    earned_at: datetime
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+# Pagination Schemas
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+# Statistics Schemas
+class CompletionStatsBucket(BaseModel):
+    day: Optional[date] = None
+    habit_id: Optional[int] = None
+    category: Optional[HabitCategory] = None
+    completions: int
+
+class CompletionStats(BaseModel):
+    start: date
+    end: date
+    group_by: Literal["day", "habit", "category"]
+    total: int
+    buckets: List[CompletionStatsBucket]
+
+class CompletionCalendar(BaseModel):
+    habit_id: Optional[int] = None  # None for the calendar of all the user's habits
+    year: int
+    days: int
+    bitmap: str  # Base64; bit n (most significant first) set if completed on day n, January 1st is 0
+    completed_days: int
+    completion_rate: float
+
+class HabitDayStatus(BaseModel):
+    habit_id: int
+    day: date
+    done: bool
+
+# Consistency Schemas (computed offline by analytics.py)
+class HabitConsistency(BaseModel):
+    habit_id: int
+    consistency: Optional[float] = None
+    rate_7d: Optional[float] = None
+    rate_30d: Optional[float] = None
+
+class ConsistencyReport(BaseModel):
+    computed_at: Optional[datetime] = None  # None until the job has run for this user
+    consistency: Optional[float] = None
+    rate_7d: Optional[float] = None
+    rate_30d: Optional[float] = None
+    habits: List[HabitConsistency]
+
+class CategoryTrendPoint(BaseModel):
+    category: HabitCategory
+    day: date
+    satisfied: int
+    eligible: int
+    rate: Optional[float] = None
+
+# Leaderboard Schemas
+class LeaderboardEntry(BaseModel):
+    rank: int
+    user_id: int
+    username: Optional[str] = None
+    score: int
+
+class Leaderboard(BaseModel):
+    board: str
+    entries: List[LeaderboardEntry]
+    me: Optional[LeaderboardEntry] = None
+
 # Token Schemas
 class Token(BaseModel):
     access_token: str
@@ -132,4 +237,6 @@ class Token(BaseModel):
     user: Optional[dict] = None
 
 class TokenData(BaseModel):
-    username: Optional[str] = None 
\ No newline at end of file
+    username: Optional[str] = None
+    user_id: Optional[int] = None
+    is_active: Optional[bool] = None 
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+Fast JSON responses.
+
+``ORJSONResponse`` is the application's default response class. It
+renders with orjson, whose output matches Pydantic's JSON mode for the
+types we return (UTC datetimes end in ``Z``, enums become their values).
+
+For hot endpoints that return ORM rows, ``serializer_for(schema)`` builds a
+``Serializer`` once per schema. It copies the schema's fields off the
+objects with a single ``attrgetter`` call and skips validation entirely.
+Use it only for data we wrote ourselves (database rows, values computed
+by the server), never for client input. Endpoints keep their
+``response_model`` so the OpenAPI schema is unchanged:
+
+    return serializers.serializer_for(schemas.User).response(current_user)
+"""
+from decimal import Decimal
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type, Union, get_args, get_origin
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+import orjson
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize ``content`` to JSON bytes."""
+    return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _nested_schema(annotation: Any) -> Tuple[Optional[Type[BaseModel]], bool]:
+    """The schema inside ``Model``, ``Optional[Model]`` or ``List[Model]``, and whether it is a list."""
+    origin = get_origin(annotation)
+    if origin is Union:
+        arguments = [argument for argument in get_args(annotation) if argument is not type(None)]
+        return _nested_schema(arguments[0]) if len(arguments) == 1 else (None, False)
+    if origin in (list, List):
+        schema, _ = _nested_schema(get_args(annotation)[0])
+        return schema, schema is not None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None, False
+
+
+class Serializer:
+    """
+    Dumps objects or dicts shaped like ``schema`` into JSON-ready dicts
+    without validating them. Nested schemas (``Reward`` in ``RewardClaim``,
+    ``List[Habit]`` in ``Page[Habit]``) get their own serializers.
+    """
+
+    def __init__(self, schema: Type[BaseModel]):
+        self.schema = schema
+        self.names = tuple(schema.model_fields)
+        self.defaults = {
+            name: field.default for name, field in schema.model_fields.items() if not field.is_required()
+        }
+        getter = attrgetter(*self.names)
+        self._get = getter if len(self.names) > 1 else (lambda obj: (getter(obj),))
+        self._nested: Dict[str, Tuple["Serializer", bool]] = {}
+        for name, field in schema.model_fields.items():
+            nested, many = _nested_schema(field.annotation)
+            if nested is not None:
+                self._nested[name] = (serializer_for(nested), many)
+
+    def _values(self, obj: Any) -> tuple:
+        if isinstance(obj, dict):
+            return tuple(obj.get(name, self.defaults.get(name)) for name in self.names)
+        return self._get(obj)
+
+    def dump(self, obj: Any) -> Optional[dict]:
+        if obj is None:
+            return None
+        data = dict(zip(self.names, self._values(obj)))
+        for name, (serializer, many) in self._nested.items():
+            value = data[name]
+            data[name] = serializer.dump_many(value) if many else serializer.dump(value)
+        return data
+
+    def dump_many(self, objs: Optional[Iterable[Any]]) -> Optional[List[dict]]:
+        if objs is None:
+            return None
+        if not self._nested:
+            names, values = self.names, self._values
+            return [dict(zip(names, values(obj))) for obj in objs]
+        return [self.dump(obj) for obj in objs]
+
+    def response(self, obj: Any, status_code: int = 200, headers: Optional[dict] = None) -> ORJSONResponse:
+        """An ``ORJSONResponse`` with ``obj`` dumped as this schema."""
+        return ORJSONResponse(self.dump(obj), status_code=status_code, headers=headers)
+
+    def list_response(self, objs: Iterable[Any], status_code: int = 200) -> ORJSONResponse:
+        """An ``ORJSONResponse`` with each of ``objs`` dumped as this schema."""
+        return ORJSONResponse(self.dump_many(objs), status_code=status_code)
+
+
+@lru_cache(maxsize=None)
+def serializer_for(schema: Type[BaseModel]) -> Serializer:
+    """The serializer for ``schema``, built on first use."""
+    return Serializer(schema)
@@ -0,0 +1,327 @@
+"""
+Incremental streak engine.
+
+Every completion is mapped to a period index (a day, ISO week, month or
+custom-length block in the user's timezone). A ``Streak`` row only has to
+remember the last completed period: a completion in the next period extends
+the streak, one in the same period changes nothing, and anything later
+starts a new streak. That keeps each update O(1) regardless of history.
+"""
+from datetime import date, datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import case, func, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Habit, HabitCompletion, HabitFrequency, Streak, User
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (current_streak, longest_streak, last_period)
+StreakState = Tuple[int, int, Optional[int]]
+
+
+@lru_cache(maxsize=512)
+def _zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown timezone {name!r}, falling back to UTC")
+        return ZoneInfo("UTC")
+
+
+def local_date(moment: datetime, tz_name: Optional[str] = "UTC") -> date:
+    """Calendar day of ``moment`` in the given timezone; naive times are UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(_zone(tz_name)).date()
+
+
+def period_index(
+    moment: datetime,
+    frequency: HabitFrequency,
+    tz_name: Optional[str] = "UTC",
+    custom_interval_days: Optional[int] = None
+) -> int:
+    """
+    Map a completion time to the index of the habit period it falls in.
+
+    Consecutive periods have consecutive indexes. Days end at midnight in the
+    user's timezone and weeks start on Monday.
+    """
+    local_day = local_date(moment, tz_name)
+    ordinal = local_day.toordinal()  # 0001-01-01, a Monday, is ordinal 1
+    if frequency == HabitFrequency.WEEKLY:
+        return (ordinal - 1) // 7
+    if frequency == HabitFrequency.MONTHLY:
+        return local_day.year * 12 + local_day.month - 1
+    if frequency == HabitFrequency.CUSTOM:
+        return ordinal // max(custom_interval_days or 1, 1)
+    return ordinal
+
+
+def advance(state: StreakState, period: int) -> StreakState:
+    """Apply one completed period to a streak state (pure version of the SQL update)."""
+    current, longest, last_period = state
+    if last_period is None or period > last_period + 1:
+        current = 1
+    elif period == last_period + 1:
+        current += 1
+    else:
+        # Same period, or an out-of-order completion; rebuild_all_streaks
+        # reconciles the latter.
+        return state
+    return current, max(longest, current), period
+
+
+def fold(periods: Iterable[int], state: StreakState = (0, 0, None)) -> StreakState:
+    """Apply periods in ascending order to a streak state."""
+    for period in periods:
+        state = advance(state, period)
+    return state
+
+
+def effective_current_streak(streak: Streak, habit: Habit, tz_name: Optional[str], now: Optional[datetime] = None) -> int:
+    """
+    Current streak as of ``now``.
+
+    The stored value is only updated on completion, so a streak whose last
+    period is older than the previous period has already been broken.
+    """
+    if streak.last_period is None:
+        return 0
+    now_period = period_index(
+        now or datetime.now(timezone.utc), habit.frequency, tz_name, habit.custom_interval_days
+    )
+    if streak.last_period < now_period - 1:
+        return 0
+    return streak.current_streak
+
+
+async def record_completion_streak(
+    db: AsyncSession,
+    habit: Habit,
+    user: User,
+    completed_at: datetime
+) -> Tuple[Streak, Optional[int]]:
+    """
+    Update the streak for one completion with an atomic upsert.
+
+    The row is locked and its current streak read first. The new values are
+    then computed from the row as stored at update time, so concurrent
+    completions serialise on the row and none are lost. Returns the
+    streak and its previous current streak: 0 for a new row, None if another
+    transaction created the row in between. The caller commits.
+    """
+    previous = (await db.execute(
+        select(Streak.current_streak)
+        .where(Streak.habit_id == habit.id, Streak.user_id == user.id)
+        .with_for_update()
+    )).scalar()
+
+    period = period_index(completed_at, habit.frequency, user.timezone, habit.custom_interval_days)
+    new_current = case(
+        (Streak.last_period.is_(None), 1),
+        (Streak.last_period == period - 1, Streak.current_streak + 1),
+        (Streak.last_period < period - 1, 1),
+        else_=Streak.current_streak
+    )
+    stmt = insert(Streak).values(
+        habit_id=habit.id,
+        user_id=user.id,
+        current_streak=1,
+        longest_streak=1,
+        last_period=period,
+        last_completion_date=completed_at
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Streak.habit_id, Streak.user_id],
+        set_={
+            "current_streak": new_current,
+            "longest_streak": func.greatest(Streak.longest_streak, new_current),
+            "last_period": func.greatest(Streak.last_period, period),
+            "last_completion_date": func.greatest(Streak.last_completion_date, completed_at),
+            "updated_at": func.now(),
+        }
+    # xmax is 0 on a freshly inserted row
+    ).returning(Streak, literal_column("xmax").op("=")(0))
+    streak, inserted = (await db.execute(stmt, execution_options={"populate_existing": True})).one()
+    if previous is None and inserted:
+        previous = 0
+    return streak, previous
+
+
+async def record_batch_streaks(
+    db: AsyncSession,
+    user: User,
+    completions_by_habit: Dict[int, Tuple[Habit, List[datetime]]]
+) -> Dict[int, Tuple[int, int]]:
+    """
+    Update the streaks of several habits for a batch of new completions.
+
+    Makes sure every streak row exists, locks them all in one statement (in
+    habit id order, so concurrent batches cannot deadlock), folds the batch's
+    periods into each row and writes everything back in one executemany.
+    A batch reaching back before a streak's last period (e.g. a device
+    syncing old offline history) is folded from that habit's full history
+    instead, so the result matches a rebuild. Returns the previous and new
+    current streak of each habit. The caller commits.
+    """
+    if not completions_by_habit:
+        return {}
+    habit_ids = sorted(completions_by_habit)
+
+    await db.execute(
+        insert(Streak)
+        .values([
+            {"habit_id": habit_id, "user_id": user.id, "current_streak": 0, "longest_streak": 0}
+            for habit_id in habit_ids
+        ])
+        .on_conflict_do_nothing(index_elements=[Streak.habit_id, Streak.user_id])
+    )
+    result = await db.execute(
+        select(Streak.id, Streak.habit_id, Streak.current_streak, Streak.longest_streak,
+               Streak.last_period, Streak.last_completion_date)
+        .where(Streak.user_id == user.id, Streak.habit_id.in_(habit_ids))
+        .order_by(Streak.habit_id)
+        .with_for_update()
+    )
+
+    updates = []
+    changes = {}
+    for streak_id, habit_id, current, longest, last_period, last_completed_at in result.all():
+        habit, completed_ats = completions_by_habit[habit_id]
+        periods = sorted(
+            period_index(moment, habit.frequency, user.timezone, habit.custom_interval_days)
+            for moment in completed_ats
+        )
+        latest = max(completed_ats)
+        if last_period is not None and periods[0] < last_period:
+            history = await db.execute(
+                select(HabitCompletion.completed_at)
+                .where(HabitCompletion.habit_id == habit_id, HabitCompletion.user_id == user.id)
+                .order_by(HabitCompletion.completed_at)
+            )
+            history_times = history.scalars().all()
+            state = fold(
+                period_index(moment, habit.frequency, user.timezone, habit.custom_interval_days)
+                for moment in history_times
+            )
+            latest = history_times[-1]
+        else:
+            state = fold(periods, (current, longest, last_period))
+            if last_completed_at is not None:
+                latest = max(latest, last_completed_at)
+        updates.append({
+            "id": streak_id,
+            "current_streak": state[0],
+            "longest_streak": state[1],
+            "last_period": state[2],
+            "last_completion_date": latest,
+        })
+        changes[habit_id] = (current, state[0])
+
+    await db.execute(update(Streak), updates)
+    return changes
+
+
+def _write_streaks(connection, rows: list) -> None:
+    stmt = insert(Streak)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Streak.habit_id, Streak.user_id],
+        set_={
+            "current_streak": stmt.excluded.current_streak,
+            "longest_streak": stmt.excluded.longest_streak,
+            "last_period": stmt.excluded.last_period,
+            "last_completion_date": stmt.excluded.last_completion_date,
+            "updated_at": func.now(),
+        }
+    )
+    connection.execute(stmt, rows)
+
+
+def rebuild_all_streaks(batch_size: int = 1000) -> int:
+    """
+    Rebuild every streak from ``habit_completions`` in one streaming pass.
+
+    Completions are read through a server-side cursor ordered by habit, so
+    memory stays flat however large the table is; finished streaks are
+    written back in batches. Returns the number of streaks written.
+    """
+    from database import engine
+
+    query = (
+        select(
+            HabitCompletion.habit_id,
+            HabitCompletion.user_id,
+            HabitCompletion.completed_at,
+            Habit.frequency,
+            Habit.custom_interval_days,
+            User.timezone
+        )
+        .join(Habit, Habit.id == HabitCompletion.habit_id)
+        .join(User, User.id == HabitCompletion.user_id)
+        .order_by(HabitCompletion.habit_id, HabitCompletion.user_id, HabitCompletion.completed_at)
+    )
+
+    written = 0
+    pending = []
+    group = None
+    state: StreakState = (0, 0, None)
+    last_completed_at = None
+
+    def finish_group():
+        nonlocal written
+        if group is None:
+            return
+        current, longest, last_period = state
+        pending.append({
+            "habit_id": group[0],
+            "user_id": group[1],
+            "current_streak": current,
+            "longest_streak": longest,
+            "last_period": last_period,
+            "last_completion_date": last_completed_at,
+        })
+        written += 1
+
+    with engine.connect() as reader, engine.begin() as writer:
+        rows = reader.execution_options(stream_results=True, yield_per=10000).execute(query)
+        for habit_id, user_id, completed_at, frequency, interval_days, tz_name in rows:
+            if (habit_id, user_id) != group:
+                finish_group()
+                if len(pending) >= batch_size:
+                    _write_streaks(writer, pending)
+                    pending.clear()
+                group = (habit_id, user_id)
+                state = (0, 0, None)
+            state = advance(state, period_index(completed_at, frequency, tz_name, interval_days))
+            last_completed_at = completed_at
+        finish_group()
+        if pending:
+            _write_streaks(writer, pending)
+
+        # Streaks whose completions have all been deleted
+        writer.execute(
+            update(Streak)
+            .where(~select(HabitCompletion.id).where(
+                HabitCompletion.habit_id == Streak.habit_id,
+                HabitCompletion.user_id == Streak.user_id
+            ).exists())
+            .values(current_streak=0, longest_streak=0, last_period=None, last_completion_date=None)
+        )
+
+    logger.info(f"Rebuilt {written} streaks")
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    print("Rebuilding streaks from completion history...")
+    rebuild_all_streaks()
+    print("Streaks rebuilt successfully!")
@@ -0,0 +1,23 @@
+import os
+import sys
+import fakeredis
+import pytest
+
+# Backend modules are imported by their flat names, as the app does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# database.py builds its engines on import; these tests never connect
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/habbitforge_test")
+
+
+@pytest.fixture
+def fake_redis():
+    return fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture
+def redis_client(fake_redis, monkeypatch):
+    """``fake_redis`` installed as the shared client from ``redis_config.get_redis_client``."""
+    import redis_config
+
+    monkeypatch.setattr(redis_config, "redis_client", fake_redis)
+    return fake_redis
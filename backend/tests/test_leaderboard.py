@@ -0,0 +1,159 @@
+"""Leaderboard tests against fakeredis."""
+import asyncio
+from contextlib import contextmanager
+import pytest
+import database
+import leaderboard
+from models import HabitCategory
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def key(board: str) -> str:
+    return f"{leaderboard.LEADERBOARD_KEY_PREFIX}:{board}"
+
+
+async def seed(board: str, scores: dict) -> None:
+    await leaderboard.apply_updates((board, user_id, score) for user_id, score in scores.items())
+
+
+# User 1 leads with 50 points, user 5 trails with 10
+SCORES = {1: 50, 2: 40, 3: 30, 4: 20, 5: 10}
+
+
+def test_apply_updates_on_every_board(redis_client):
+    weekly = leaderboard.weekly_board()
+    health = leaderboard.category_board(HabitCategory.HEALTH)
+
+    async def scenario():
+        await leaderboard.apply_updates(
+            (board, 7, 10) for board in leaderboard.boards_for_award(10, HabitCategory.HEALTH)
+        )
+        # Spending lowers the global total only
+        await leaderboard.apply_updates((board, 7, -4) for board in leaderboard.boards_for_award(-4))
+        return (
+            await redis_client.zscore(key("global"), 7),
+            await redis_client.zscore(key(weekly), 7),
+            await redis_client.zscore(key(health), 7),
+            await redis_client.ttl(key(weekly)),
+            await redis_client.ttl(key("global")),
+        )
+
+    global_score, weekly_score, category_score, weekly_ttl, global_ttl = run(scenario())
+    assert (global_score, weekly_score, category_score) == (6, 10, 10)
+    # Only weekly boards expire
+    assert 0 < weekly_ttl <= leaderboard.LEADERBOARD_WEEKLY_TTL_DAYS * 86400
+    assert global_ttl == -1
+
+
+def test_apply_updates_in_chunks(redis_client):
+    async def scenario():
+        await leaderboard.apply_updates((("global", user_id, 1) for user_id in range(25)), chunk_size=10)
+        await leaderboard.apply_updates((("global", 3, 2) for _ in range(3)), chunk_size=2)
+        return await redis_client.zcard(key("global")), await redis_client.zscore(key("global"), 3)
+
+    assert run(scenario()) == (25, 7)
+
+
+def test_top(redis_client):
+    async def scenario():
+        await seed("global", SCORES)
+        return await leaderboard.top("global", 3), await leaderboard.top("global", 10)
+
+    top_three, everyone = run(scenario())
+    assert top_three == [
+        {"rank": 1, "user_id": 1, "score": 50},
+        {"rank": 2, "user_id": 2, "score": 40},
+        {"rank": 3, "user_id": 3, "score": 30},
+    ]
+    assert [entry["user_id"] for entry in everyone] == [1, 2, 3, 4, 5]
+
+
+def test_rank(redis_client):
+    async def scenario():
+        await seed("global", SCORES)
+        return [await leaderboard.rank("global", user_id) for user_id in (1, 3, 5, 99)]
+
+    first, middle, last, missing = run(scenario())
+    assert first == {"rank": 1, "user_id": 1, "score": 50}
+    assert middle == {"rank": 3, "user_id": 3, "score": 30}
+    assert last == {"rank": 5, "user_id": 5, "score": 10}
+    assert missing is None
+
+
+@pytest.mark.parametrize("user_id, radius, expected", [
+    (3, 1, [2, 3, 4]),
+    # Top of the board: nothing above, the window is clipped at rank 1
+    (1, 2, [1, 2, 3]),
+    # Bottom of the board: nothing below
+    (5, 2, [3, 4, 5]),
+    (3, 0, [3]),
+    (3, 10, [1, 2, 3, 4, 5]),
+])
+def test_around(redis_client, user_id, radius, expected):
+    async def scenario():
+        await seed("global", SCORES)
+        return await leaderboard.around("global", user_id, radius)
+
+    entries = run(scenario())
+    assert [entry["user_id"] for entry in entries] == expected
+    assert [entry["rank"] for entry in entries] == expected
+    assert all(entry["score"] == SCORES[entry["user_id"]] for entry in entries)
+
+
+def test_around_unranked_user(redis_client):
+    async def scenario():
+        await seed("global", SCORES)
+        return await leaderboard.around("global", 99)
+
+    assert run(scenario()) == []
+
+
+@contextmanager
+def _no_connection():
+    yield None
+
+
+class _Engine:
+    def connect(self):
+        return _no_connection()
+
+
+def test_rebuild_replaces_stale_members(redis_client, monkeypatch):
+    weekly = leaderboard.weekly_board()
+    fitness = leaderboard.category_board(HabitCategory.FITNESS)
+    health = leaderboard.category_board(HabitCategory.HEALTH)
+    monkeypatch.setattr(database, "engine", _Engine())
+    monkeypatch.setattr(leaderboard, "_board_scores", lambda connection: {
+        "global": {"1": 30, "2": 20},
+        weekly: {"2": 5},
+        fitness: {"1": 30},
+    })
+
+    async def scenario():
+        # Drifted state: user 9 is gone, user 1's score is stale, health has no earners left
+        await seed("global", {1: 10, 9: 100})
+        await seed(health, {9: 100})
+        await redis_client.zadd(key("global:rebuild"), {"42": 1})
+        written = await leaderboard.rebuild_leaderboards(chunk_size=1)
+        return (
+            written,
+            await redis_client.zrevrange(key("global"), 0, -1, withscores=True),
+            await redis_client.zrevrange(key(weekly), 0, -1, withscores=True),
+            await redis_client.zrevrange(key(fitness), 0, -1, withscores=True),
+            await redis_client.exists(key(health)),
+            await redis_client.ttl(key(weekly)),
+            await redis_client.keys(f"{leaderboard.LEADERBOARD_KEY_PREFIX}:*:rebuild"),
+        )
+
+    written, global_board, weekly_board, fitness_board, health_exists, weekly_ttl, staging = run(scenario())
+    assert written == len(HabitCategory) + 2
+    assert global_board == [("1", 30.0), ("2", 20.0)]
+    assert weekly_board == [("2", 5.0)]
+    assert fitness_board == [("1", 30.0)]
+    assert health_exists == 0
+    assert weekly_ttl > 0
+    # Staging keys are renamed away, including a leftover from an interrupted run
+    assert staging == []
@@ -0,0 +1,224 @@
+"""OIDC metadata and key set cache tests against a stand-in identity provider and fakeredis."""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from authlib.jose import JsonWebKey, jwt
+import oauth
+import oidc_cache
+from oidc_cache import ProviderCache
+
+CLIENT_ID = "test-client"
+PROVIDER = "stand_in"
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class StandInProvider:
+    """Minimal identity provider on a local port: discovery document, key set, signing."""
+
+    def __init__(self):
+        self.requests = {"discovery": 0, "jwks": 0}
+        self.available = True
+        self.rotate()
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if not provider.available:
+                    self.send_error(503)
+                    return
+                if self.path == "/.well-known/openid-configuration":
+                    provider.requests["discovery"] += 1
+                    body = provider.discovery()
+                elif self.path == "/jwks":
+                    provider.requests["jwks"] += 1
+                    body = {"keys": [provider.public_key]}
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.issuer = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.metadata_url = f"{self.issuer}/.well-known/openid-configuration"
+
+    def discovery(self) -> dict:
+        return {
+            "issuer": self.issuer,
+            "authorization_endpoint": f"{self.issuer}/authorize",
+            "token_endpoint": f"{self.issuer}/token",
+            "jwks_uri": f"{self.issuer}/jwks",
+            "id_token_signing_alg_values_supported": ["RS256"],
+        }
+
+    def rotate(self) -> None:
+        self.private_key = JsonWebKey.generate_key("RSA", 2048, is_private=True)
+        self.kid = uuid.uuid4().hex[:8]
+        self.public_key = dict(self.private_key.as_dict(is_private=False), kid=self.kid, use="sig")
+
+    def id_token(self, nonce: str) -> str:
+        now = int(time.time())
+        claims = {
+            "iss": self.issuer, "sub": "user-1", "aud": CLIENT_ID, "email": "user@example.com",
+            "iat": now, "exp": now + 300, "nonce": nonce,
+        }
+        return jwt.encode({"alg": "RS256", "kid": self.kid}, claims, self.private_key).decode()
+
+    def total(self) -> int:
+        return sum(self.requests.values())
+
+
+@pytest.fixture
+def provider():
+    provider = StandInProvider()
+    thread = threading.Thread(target=provider.server.serve_forever, daemon=True)
+    thread.start()
+    yield provider
+    provider.server.shutdown()
+    provider.server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def cache(redis_client):
+    return ProviderCache(ttl=60, refresh_after=0.5, min_jwks_refresh=30)
+
+
+def _kids(jwks: dict) -> list:
+    return [key["kid"] for key in jwks["keys"]]
+
+
+def test_cold_start_fetches_metadata_and_keys(provider, cache):
+    entry = run(cache.get(PROVIDER, provider.metadata_url))
+    assert provider.requests == {"discovery": 1, "jwks": 1}
+    assert entry.metadata["jwks_uri"] == f"{provider.issuer}/jwks"
+    assert _kids(entry.jwks) == [provider.kid]
+    assert cache.stats()["fetches"] == 1
+
+
+def test_hit_inside_ttl_does_not_fetch(provider, cache):
+    async def scenario():
+        first = await cache.get(PROVIDER, provider.metadata_url)
+        fetched = provider.total()
+        hits = [await cache.get(PROVIDER, provider.metadata_url) for _ in range(20)]
+        return first, fetched, hits
+
+    first, fetched, hits = run(scenario())
+    assert provider.total() == fetched
+    assert all(hit is first for hit in hits)
+    assert cache.hits == 20
+    assert cache.fetches == 1
+
+
+def test_past_refresh_point_serves_cached_then_refreshes_in_background(provider, redis_client, cache):
+    async def scenario():
+        entry = await cache.get(PROVIDER, provider.metadata_url)
+        # Age the entry past refresh_after but inside the TTL
+        aged = entry._replace(fetched_at=time.time() - cache.ttl * 0.6)
+        cache._entries[PROVIDER] = aged
+        before = provider.total()
+        served = await cache.get(PROVIDER, provider.metadata_url)
+        fetched_while_serving = provider.total() - before
+        await asyncio.gather(*cache._refresh_tasks)
+        stored = json.loads(await redis_client.get(oidc_cache._key(PROVIDER)))
+        return aged, served, fetched_while_serving, provider.total() - before, stored
+
+    aged, served, fetched_while_serving, fetched_after, stored = run(scenario())
+    assert served is aged
+    assert fetched_while_serving == 0
+    assert fetched_after == 2
+    refreshed = cache._entries[PROVIDER]
+    assert refreshed.fetched_at > aged.fetched_at
+    assert stored["fetched_at"] == refreshed.fetched_at
+
+
+def test_unknown_kid_refetches_keys_within_rate_limit(provider, cache):
+    async def scenario():
+        await cache.get(PROVIDER, provider.metadata_url)
+        provider.rotate()
+        rotated = await cache.refresh_jwks(PROVIDER, provider.metadata_url)
+        first_kid = provider.kid
+        # A second unknown kid inside min_jwks_refresh gets the cached set
+        provider.rotate()
+        limited = await cache.refresh_jwks(PROVIDER, provider.metadata_url)
+        jwks_requests = provider.requests["jwks"]
+        cache._jwks_refreshed_at[PROVIDER] -= cache.min_jwks_refresh
+        allowed = await cache.refresh_jwks(PROVIDER, provider.metadata_url)
+        return first_kid, rotated, limited, jwks_requests, allowed
+
+    first_kid, rotated, limited, jwks_requests, allowed = run(scenario())
+    assert _kids(rotated) == [first_kid]
+    assert _kids(limited) == [first_kid]
+    assert jwks_requests == 2
+    assert _kids(allowed) == [provider.kid]
+    assert provider.requests == {"discovery": 1, "jwks": 3}
+    assert _kids(cache._entries[PROVIDER].jwks) == [provider.kid]
+
+
+def test_new_cache_starts_from_redis_copy(provider, cache):
+    async def scenario():
+        entry = await cache.get(PROVIDER, provider.metadata_url)
+        fetched = provider.total()
+        restarted = ProviderCache(ttl=cache.ttl, refresh_after=cache.refresh_after)
+        return entry, fetched, restarted, await restarted.get(PROVIDER, provider.metadata_url)
+
+    entry, fetched, restarted, loaded = run(scenario())
+    assert provider.total() == fetched
+    assert loaded == entry
+    assert restarted.stats()["store_loads"] == 1
+    assert restarted.fetches == 0
+
+
+def test_provider_down_serves_expired_entry(provider, redis_client, cache):
+    async def scenario():
+        entry = await cache.get(PROVIDER, provider.metadata_url)
+        cache._entries[PROVIDER] = entry._replace(fetched_at=time.time() - cache.ttl - 1)
+        await redis_client.delete(oidc_cache._key(PROVIDER))
+        provider.available = False
+        return entry, await cache.get(PROVIDER, provider.metadata_url)
+
+    entry, served = run(scenario())
+    assert served.metadata == entry.metadata and served.jwks == entry.jwks
+    assert cache.fetch_errors == 1
+    # Kept usable without waiting on the provider again
+    assert time.time() - served.fetched_at < cache.ttl
+
+
+def test_client_verifies_id_tokens_through_cache(provider, cache, monkeypatch):
+    monkeypatch.setattr(oauth, "provider_cache", cache)
+    registry = oauth.CachedOAuth(None)
+    registry.register(
+        name=PROVIDER, client_id=CLIENT_ID, client_secret="secret", server_metadata_url=provider.metadata_url
+    )
+    client = registry.create_client(PROVIDER)
+
+    async def scenario():
+        cold = await client.parse_id_token({"id_token": provider.id_token("n1")}, nonce="n1")
+        after_cold = provider.total()
+        for _ in range(5):
+            await client.parse_id_token({"id_token": provider.id_token("n2")}, nonce="n2")
+        after_warm = provider.total()
+        provider.rotate()
+        rotated = await client.parse_id_token({"id_token": provider.id_token("n3")}, nonce="n3")
+        return cold, after_cold, after_warm, rotated
+
+    cold, after_cold, after_warm, rotated = run(scenario())
+    assert cold["email"] == rotated["email"] == "user@example.com"
+    assert after_cold == 2
+    assert after_warm == 2
+    # Key rotation refetches only the key set, once
+    assert provider.requests == {"discovery": 1, "jwks": 2}
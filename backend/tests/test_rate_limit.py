@@ -0,0 +1,180 @@
+"""Rate limiter tests against fakeredis, which runs the GCRA Lua script in-process."""
+import asyncio
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from circuit_breaker import CircuitBreaker
+import metrics
+import redis_config
+from redis_config import TwoTierRateLimiter, check_rate_limit, rate_limit
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def limiter(fake_redis, monkeypatch):
+    """A fresh module-level limiter whose Redis is ``fake_redis``."""
+    monkeypatch.setattr(redis_config, "gcra_script", fake_redis.register_script(redis_config.GCRA_SCRIPT))
+    limiter = TwoTierRateLimiter(
+        breaker=CircuitBreaker(name="test", failure_threshold=2, slow_call_seconds=5, reset_timeout=60),
+        lease_fraction=0.1,
+        fallback_share=1.0,
+        max_keys=100
+    )
+    monkeypatch.setattr(redis_config, "rate_limiter", limiter)
+    return limiter
+
+
+def test_gcra_allows_up_to_the_limit(fake_redis):
+    result = run(check_rate_limit("rl:allow", limit=5, period=60, client=fake_redis))
+    assert result.allowed
+    assert result.granted == 1
+    assert result.limit == 5 and result.period == 60
+    assert result.remaining == 4
+    assert result.retry_after == 0
+    # One emission interval (60 s / 5) of the bucket is used
+    assert 11.9 <= result.reset_after <= 12
+
+
+def test_gcra_counts_requests_within_the_same_second(fake_redis):
+    async def burst():
+        return [await check_rate_limit("rl:burst", limit=5, period=60, client=fake_redis) for _ in range(5)]
+
+    results = run(burst())
+    assert all(result.allowed for result in results)
+    assert [result.remaining for result in results] == [4, 3, 2, 1, 0]
+    # Each request pushes the reset time one interval further out
+    assert [round(result.reset_after) for result in results] == [12, 24, 36, 48, 60]
+
+
+def test_gcra_denies_with_retry_after(fake_redis):
+    async def exhaust():
+        for _ in range(3):
+            await check_rate_limit("rl:deny", limit=3, period=60, client=fake_redis)
+        return await check_rate_limit("rl:deny", limit=3, period=60, client=fake_redis)
+
+    result = run(exhaust())
+    assert not result.allowed
+    assert result.granted == 0
+    assert result.remaining == 0
+    # The next token accrues one interval (20 s) after the burst
+    assert 19.9 <= result.retry_after <= 20
+    assert 59.9 <= result.reset_after <= 60
+    assert result.headers()["Retry-After"] == "20"
+
+
+def test_gcra_grants_leases_partially(fake_redis):
+    async def lease():
+        first = await check_rate_limit("rl:lease", limit=10, period=60, cost=8, client=fake_redis)
+        second = await check_rate_limit("rl:lease", limit=10, period=60, cost=8, client=fake_redis)
+        return first, second
+
+    first, second = run(lease())
+    assert (first.granted, first.remaining) == (8, 2)
+    assert (second.granted, second.remaining) == (2, 0)
+
+
+def test_result_headers():
+    allowed = redis_config.RateLimitResult(
+        allowed=True, limit=10, period=60, remaining=7, retry_after=0, reset_after=17.2
+    )
+    assert allowed.headers() == {
+        "RateLimit-Limit": "10",
+        "RateLimit-Remaining": "7",
+        "RateLimit-Reset": "18",
+        "RateLimit-Policy": "10;w=60",
+    }
+    denied = allowed._replace(allowed=False, remaining=0, retry_after=0.2)
+    assert denied.headers()["Retry-After"] == "1"
+
+
+def test_limiter_spends_leased_tokens_locally(limiter):
+    async def checks():
+        return [await limiter.check("rl:local", limit=50) for _ in range(5)]
+
+    results = run(checks())
+    assert all(result.allowed for result in results)
+    assert [result.remaining for result in results] == [49, 48, 47, 46, 45]
+    # A lease is 10% of the limit: one Redis call, the rest answered locally
+    assert limiter.redis_checks == 1
+    assert limiter.local_hits == 4
+
+
+def test_limiter_falls_back_when_redis_fails(limiter, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(redis_config, "check_rate_limit", broken)
+
+    async def checks():
+        return [await limiter.check("rl:fallback", limit=2) for _ in range(3)]
+
+    results = run(checks())
+    assert [result.allowed for result in results] == [True, True, False]
+    assert limiter.fallback_checks == 3
+    assert limiter.breaker.state == CircuitBreaker.OPEN
+    assert 'circuit_breaker_state{breaker="test"} 2' in metrics.render()
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/limited")
+    @rate_limit(requests_per_minute=2, key_prefix="test")
+    async def limited():
+        return {"ok": True}
+
+    @app.get("/limited-with-request")
+    @rate_limit(requests_per_minute=2, key_prefix="test_request")
+    async def limited_with_request(request: Request):
+        return {"path": request.url.path}
+
+    @app.get("/limited-response")
+    @rate_limit(requests_per_minute=2, key_prefix="test_response")
+    async def limited_response():
+        return JSONResponse({"ok": True}, headers={"X-Own": "kept"})
+
+    return app
+
+
+async def _get(app: FastAPI, path: str, times: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return [await client.get(path) for _ in range(times)]
+
+
+def test_decorator_sets_rate_limit_headers(limiter):
+    first, second = run(_get(_app(), "/limited", 2))
+    assert first.status_code == 200 and first.json() == {"ok": True}
+    assert first.headers["RateLimit-Limit"] == "2"
+    assert first.headers["RateLimit-Remaining"] == "1"
+    assert first.headers["RateLimit-Policy"] == "2;w=60"
+    assert int(first.headers["RateLimit-Reset"]) == 30
+    assert second.headers["RateLimit-Remaining"] == "0"
+    assert "Retry-After" not in second.headers
+
+
+def test_decorator_rejects_with_retry_after(limiter):
+    *_, rejected = run(_get(_app(), "/limited", 3))
+    assert rejected.status_code == 429
+    assert rejected.headers["RateLimit-Remaining"] == "0"
+    assert rejected.headers["Retry-After"] == "30"
+    assert int(rejected.headers["RateLimit-Reset"]) == 60
+
+
+def test_decorator_keeps_declared_request_parameter(limiter):
+    response, = run(_get(_app(), "/limited-with-request", 1))
+    assert response.status_code == 200
+    assert response.json() == {"path": "/limited-with-request"}
+    assert response.headers["RateLimit-Remaining"] == "1"
+
+
+def test_decorator_sets_headers_on_returned_response(limiter):
+    response, = run(_get(_app(), "/limited-response", 1))
+    assert response.status_code == 200
+    assert response.headers["X-Own"] == "kept"
+    assert response.headers["RateLimit-Limit"] == "2"
+    assert response.headers["RateLimit-Remaining"] == "1"